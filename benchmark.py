@@ -0,0 +1,509 @@
+# Homepage of Josua Krause
+# Copyright (C) 2024  Josua Krause
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import sys
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+from PIL import Image, ImageDraw
+
+from buildcache import CACHE_DIR
+from buildtrace import now, TRACE
+from create_page import (
+    apply_template,
+    FADEOUT,
+    HEADER_JOBS,
+    MONTHS,
+    OGIMG_JOB,
+    ONGOING,
+)
+from create_sitemap import (
+    create_sitemap,
+    get_local_files,
+    SITEMAP_RULES,
+    write_entries,
+)
+from filerules import FileRules
+from probe import Prober
+from writer import OutputWriter
+
+
+BENCH_DIR = os.path.join(CACHE_DIR, "bench")
+BASELINE_FILE = "benchmark_baseline.json"
+# NOTE: named catalogue sizes for --sizes. the full preset is used for
+# the baseline. resizing dominates the run time so the quick preset is the
+# default for a fast check
+SIZE_PRESETS: dict[str, list[int]] = {
+    "quick": [100, 500],
+    "full": [1000, 10000, 100000],
+}
+DEFAULT_SIZES = "quick"
+# NOTE: fraction of entries that have the field. mirrors content.json.
+# teasers are only added to entries with an autopage
+FIELD_MIX: dict[str, float] = {
+    "abstract": 0.06,
+    "autopage": 0.07,
+    "awards": 0.02,
+    "bibtex": 0.10,
+    "end-date": 0.04,
+    "github": 0.19,
+    "logo": 0.18,
+    "pdf": 0.15,
+    "short-conference": 0.80,
+    "short-title": 0.68,
+    "slides": 0.09,
+    "teaser": 0.85,
+    "video": 0.05,
+}
+TYPES: list[str] = [
+    "thesis",
+    "paper",
+    "book",
+    "blog",
+    "project",
+    "patent",
+    "mentoring",
+    "committee",
+    "teaching",
+    "ta",
+    "poster",
+    FADEOUT,
+    "award",
+]
+NUM_LOGOS = 32
+NUM_TEASERS = 8
+NUM_PDFS = 64
+WORDS = (
+    "visual analytics machine learning interactive model prediction "
+    "explanation feature partial dependence inspection data scientist "
+    "system evaluation study graph network time series text corpus "
+    "embedding cluster outlier user interface design interpretation"
+).split()
+
+
+# key is size/script/stage, value is seconds
+Results = dict[str, float]
+
+
+def words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+def random_date(rng: random.Random, first_year: int) -> str:
+    year = rng.randint(first_year, 2024)
+    month = rng.choice(list(MONTHS)).capitalize()
+    kind = rng.random()
+    if kind < 0.2:
+        return f"{year}"
+    if kind < 0.6:
+        return f"{month}, {year}"
+    return f"{month} {rng.randint(1, 28)}, {year}"
+
+
+def random_color(rng: random.Random) -> tuple[int, int, int]:
+    return (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255))
+
+
+def make_image(
+        fname: str,
+        width: int,
+        height: int,
+        rng: random.Random) -> None:
+    img = Image.new("RGB", (width, height), random_color(rng))
+    draw = ImageDraw.Draw(img)
+    for _ in range(16):
+        x0 = rng.randint(0, width - 1)
+        y0 = rng.randint(0, height - 1)
+        draw.rectangle(
+            (x0, y0, rng.randint(x0, width), rng.randint(y0, height)),
+            fill=random_color(rng))
+    img.save(fname)
+
+
+def generate_tree(prefix: str, rng: random.Random) -> None:
+    # NOTE: a shared pool of images and pdfs is referenced by the entries
+    img_dir = os.path.join(prefix, "img")
+    material_dir = os.path.join(prefix, "material")
+    os.makedirs(img_dir, exist_ok=True)
+    os.makedirs(material_dir, exist_ok=True)
+    for job in [*HEADER_JOBS.values(), OGIMG_JOB]:
+        fname = os.path.join(prefix, job[0])
+        if not os.path.exists(fname):
+            make_image(fname, 1024, 960, rng)
+    Image.new("RGBA", (1, 1)).save(os.path.join(img_dir, "nologo.png"))
+    for ix in range(NUM_LOGOS):
+        make_image(os.path.join(img_dir, f"logo{ix}.png"), 512, 512, rng)
+    for ix in range(NUM_TEASERS):
+        make_image(
+            os.path.join(img_dir, f"teaser{ix}.png"), 2400, 1300, rng)
+    for ix in range(NUM_PDFS):
+        with open(os.path.join(material_dir, f"paper{ix}.pdf"), "wb") as fout:
+            fout.write(b"%PDF-1.4\n")
+            fout.write(rng.randbytes(rng.randint(20, 2000) * 1024))
+
+
+def generate_entry(ix: int, rng: random.Random) -> dict[str, Any]:
+
+    def has(field: str) -> bool:
+        return rng.random() < FIELD_MIX[field]
+
+    title = f"{words(rng, rng.randint(3, 10)).capitalize()} {ix}"
+    doc: dict[str, Any] = {
+        "type": rng.choice(TYPES),
+        "title": title,
+        "authors": ", ".join(
+            f"{rng.choice(WORDS).capitalize()} {rng.choice(WORDS)}"
+            for _ in range(rng.randint(1, 5))),
+        "conference": words(rng, 3).title(),
+        "date": random_date(rng, 2010),
+        "published": rng.random() < 0.95,
+    }
+    if has("short-title"):
+        doc["short-title"] = title[:20]
+    if has("short-conference"):
+        doc["short-conference"] = doc["conference"].split()[0].upper()
+    if has("end-date"):
+        # NOTE: the end date always lies in a later year
+        year = int(doc["date"][-4:])
+        doc["end-date"] = (
+            ONGOING
+            if rng.random() < 0.3 or year == 2024
+            else random_date(rng, year + 1))
+    if has("logo"):
+        doc["logo"] = f"img/logo{rng.randrange(NUM_LOGOS)}.png"
+    if has("pdf"):
+        doc["pdf"] = f"material/paper{rng.randrange(NUM_PDFS)}.pdf"
+    if has("github"):
+        doc["github"] = f"https://github.com/example/project{ix}"
+    if has("slides"):
+        doc["slides"] = f"https://example.com/slides{ix}"
+    if has("video"):
+        doc["video"] = f"https://vimeo.com/{100000 + ix}"
+    if has("awards"):
+        doc["awards"] = [words(rng, 2).title()]
+    if has("abstract"):
+        doc["abstract"] = [
+            words(rng, 14) for _ in range(rng.randint(4, 10))
+        ]
+    if has("bibtex"):
+        doc["bibtex"] = [
+            f"@inproceedings{{bench{ix},",
+            f"author = {{{doc['authors']}}},",
+            f"title = {{{title}}},",
+            f"booktitle = {{{doc['conference']}}},",
+            "}",
+        ]
+    if has("autopage"):
+        doc["href"] = f"bench{ix}.html"
+        doc["autopage"] = True
+        if has("teaser"):
+            doc["teaser"] = f"img/teaser{rng.randrange(NUM_TEASERS)}.png"
+            doc["teaser_desc"] = words(rng, 6)
+    return doc
+
+
+def generate_catalogue(fname: str, size: int, rng: random.Random) -> None:
+    with open(fname, "w", encoding="utf-8") as fout:
+        json.dump({
+            "types": [
+                {
+                    "type": kind,
+                    "name": kind.capitalize(),
+                    "color": "black",
+                }
+                for kind in TYPES
+            ],
+            "documents": [generate_entry(ix, rng) for ix in range(size)],
+        }, fout, indent=2)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # NOTE: answers every page with a fixed body and supports conditional
+    # requests. there are no previous sitemaps
+    latency = 0.0
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        time.sleep(self.latency)
+        if self.path.endswith(".xml"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = f"page {self.path}".encode("utf-8")
+        etag = f"\"{hashlib.md5(body).hexdigest()}\""
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", formatdate(0, usegmt=True))
+        self.send_header("Content-Length", f"{len(body)}")
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_server(latency: float) -> ThreadingHTTPServer:
+    StandInHandler.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_page(prefix: str, catalogue: str, *, parallel: int) -> Results:
+    TRACE.enable()
+    start = now()
+    writer = OutputWriter(prefix)
+    with open(
+            os.path.join(prefix, "index.html"), "w", encoding="utf-8") as out:
+        apply_template(
+            "index.tmpl",
+            catalogue,
+            prefix,
+            out,
+            writer,
+            is_ordered_by_type=False,
+            dry_run=False,
+            parallel=parallel)
+        with TRACE.span("write"):
+            writer.finish()
+    res = TRACE.get_stage_times()
+    res["total"] = (now() - start) / 1e9
+    return res
+
+
+def run_sitemap(
+        prefix: str,
+        output: str,
+        *,
+        server: ThreadingHTTPServer,
+        parallel: int) -> Results:
+    port = server.server_address[1]
+
+    def domain(subdomain: str) -> str:
+        return f"http://127.0.0.1:{port}/{subdomain}"
+
+    TRACE.enable()
+    start = now()
+    with TRACE.span("load"):
+        local_files = get_local_files(prefix, FileRules.load(SITEMAP_RULES))
+    prober = Prober()
+    try:
+        records = create_sitemap(
+            domain,
+            "/",
+            local_files,
+            base_dir=prefix,
+            prober=prober,
+            jobs=parallel)
+    finally:
+        prober.close()
+    with TRACE.span("write"):
+        with open(output, "w", encoding="utf-8") as f_out:
+            with open(os.devnull, "w", encoding="utf-8") as f_int:
+                write_entries(f_out, f_int, records)
+    res = TRACE.get_stage_times()
+    res["total"] = (now() - start) / 1e9
+    return res
+
+
+def run_size(
+        size: int,
+        work_dir: str,
+        *,
+        server: ThreadingHTTPServer,
+        parallel: int) -> Results:
+    prefix = os.path.join(work_dir, f"{size}")
+    if os.path.exists(prefix):
+        shutil.rmtree(prefix)
+    os.makedirs(prefix)
+    rng = random.Random(size)
+    catalogue = os.path.join(work_dir, f"content_{size}.json")
+    print(f"generating {size} entries", file=sys.stderr)
+    generate_tree(prefix, rng)
+    generate_catalogue(catalogue, size, rng)
+    res: Results = {}
+    print(f"benchmarking page generation for {size}", file=sys.stderr)
+    page = run_page(prefix, catalogue, parallel=parallel)
+    res.update({f"{size}/page/{stage}": secs for stage, secs in page.items()})
+    print(f"benchmarking sitemap generation for {size}", file=sys.stderr)
+    sitemap = run_sitemap(
+        prefix,
+        os.path.join(work_dir, f"sitemap_{size}.xml"),
+        server=server,
+        parallel=parallel)
+    res.update({
+        f"{size}/sitemap/{stage}": secs for stage, secs in sitemap.items()
+    })
+    return res
+
+
+def compare(
+        results: Results,
+        baseline: Results,
+        *,
+        threshold: float,
+        min_seconds: float) -> list[str]:
+    # NOTE: a stage regresses if it is slower than the baseline by more than
+    # the relative threshold and by more than min_seconds
+    regressions: list[str] = []
+    for key, secs in results.items():
+        base = baseline.get(key)
+        delta = ""
+        flag = ""
+        if base is not None:
+            delta = f"{(secs - base) / base:+.1%}" if base > 0 else ""
+            if (
+                    secs > base * (1.0 + threshold)
+                    and secs - base > min_seconds):
+                regressions.append(key)
+                flag = "REGRESSION"
+        base_str = "" if base is None else f"{base:.3f}s"
+        print(f"{key:<32} {secs:>10.3f}s {base_str:>11} {delta:>8} {flag}")
+    return regressions
+
+
+def get_sizes(values: list[str]) -> list[int]:
+    res: list[int] = []
+    for value in values:
+        preset = SIZE_PRESETS.get(value)
+        if preset is not None:
+            res.extend(preset)
+        elif value.isdigit() and int(value) > 0:
+            res.append(int(value))
+        else:
+            raise ValueError(
+                f"invalid size {value!r}. expected a positive number or one "
+                f"of {', '.join(SIZE_PRESETS)}")
+    return res
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog=f"python {os.path.basename(__file__)}",
+        description=(
+            "Benchmark page and sitemap generation on synthetic content"))
+    parser.add_argument(
+        "--sizes",
+        type=str,
+        nargs="+",
+        default=[DEFAULT_SIZES],
+        help=(
+            "number of entries of the synthetic catalogues or a preset. "
+            + ", ".join(
+                f"{name} is {' '.join(f'{size}' for size in sizes)}"
+                for (name, sizes) in SIZE_PRESETS.items())
+            + f". default is {DEFAULT_SIZES}"))
+    parser.add_argument(
+        "--work-dir",
+        type=str,
+        default=BENCH_DIR,
+        help="specifies the folder for the synthetic inputs and outputs")
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        default=BASELINE_FILE,
+        help="specifies the baseline file to compare against")
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="store the results as the new baseline")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="relative slowdown that is flagged as a regression")
+    parser.add_argument(
+        "--min-seconds",
+        type=float,
+        default=0.05,
+        help="slowdowns below this many seconds are never flagged")
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help="simulated latency of the stand-in server in seconds")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of parallel processes and threads")
+    args = parser.parse_args()
+    try:
+        args.sizes = get_sizes(args.sizes)
+    except ValueError as e:
+        parser.error(f"{e}")
+    return args
+
+
+def run() -> None:
+    args = parse_args()
+    if not args.update_baseline and not os.path.exists(args.baseline):
+        print(
+            f"ERROR: no baseline at {args.baseline}. create one with "
+            f"'python {os.path.basename(__file__)} --update-baseline' "
+            "(or 'make benchmark-baseline') on this machine first",
+            file=sys.stderr)
+        sys.exit(2)
+    TRACE.set_quiet(True)
+    os.makedirs(args.work_dir, exist_ok=True)
+    server = start_server(args.latency)
+    results: Results = {}
+    try:
+        for size in args.sizes:
+            results.update(run_size(
+                size, args.work_dir, server=server, parallel=args.jobs))
+    finally:
+        server.shutdown()
+    baseline: Results = {}
+    try:
+        with open(args.baseline, "r", encoding="utf-8") as fin:
+            baseline = json.load(fin)
+    except FileNotFoundError:
+        print(f"no baseline at {args.baseline}", file=sys.stderr)
+    regressions = compare(
+        results,
+        baseline,
+        threshold=args.threshold,
+        min_seconds=args.min_seconds)
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as fout:
+            json.dump(baseline, fout, indent=2, sort_keys=True)
+            fout.write("\n")
+        print(f"updated baseline {args.baseline}", file=sys.stderr)
+    if regressions:
+        print(
+            f"{len(regressions)} regressions: {', '.join(regressions)}",
+            file=sys.stderr)
+        # NOTE: slower results are expected when updating the baseline
+        if not args.update_baseline:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,477 @@
+# Homepage of Josua Krause
+# Copyright (C) 2024  Josua Krause
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import glob
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, TypedDict
+
+from buildtrace import TRACE
+
+
+CACHE_DIR = ".cache"
+MEBIBYTE = 1024 * 1024
+
+
+def get_hash(content: bytes) -> str:
+    blake = hashlib.blake2b(digest_size=32)
+    blake.update(content)
+    return blake.hexdigest()
+
+
+def get_file_hash(fname: str) -> str:
+    # NOTE: reads the file in fixed size chunks so memory stays bounded
+    with TRACE.span("hash", "entry", file=fname), open(fname, "rb") as fin:
+        blake = hashlib.file_digest(
+            fin, lambda: hashlib.blake2b(digest_size=32))
+    return blake.hexdigest()
+
+
+class JSONStore:
+    def __init__(self, fname: str) -> None:
+        self._fname = fname
+        self._data: dict[str, Any] = self._load()
+        self._dirty = False
+
+    def _load(self) -> dict[str, Any]:
+        try:
+            with open(self._fname, "r", encoding="utf-8") as fin:
+                res = json.load(fin)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError:
+            print(f"WARNING: ignoring corrupt cache {self._fname}",
+                  file=sys.stderr)
+            return {}
+        if not isinstance(res, dict):
+            return {}
+        return res
+
+    def get(self, key: str) -> Any:
+        return self._data.get(key)
+
+    def set(self, key: str, value: Any) -> None:
+        self._data[key] = value
+        self._dirty = True
+
+    def remove(self, key: str) -> None:
+        if self._data.pop(key, None) is not None:
+            self._dirty = True
+
+    def keys(self) -> list[str]:
+        return list(self._data.keys())
+
+    def get_fname(self) -> str:
+        return self._fname
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        dirname = os.path.dirname(self._fname)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        tmp = f"{self._fname}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fout:
+            json.dump(self._data, fout, sort_keys=True)
+        os.replace(tmp, self._fname)
+        self._dirty = False
+
+
+ImageCacheEntry = TypedDict('ImageCacheEntry', {
+    "file": str,
+    "width": int,
+    "height": int,
+    "size": int,
+    "used": float,
+})
+
+
+# NOTE: a hit only refreshes the used stamp of an entry if it is older than
+# this many seconds so warm builds do not rewrite the index
+USED_RESOLUTION = 24 * 60 * 60
+
+
+class ImageCache:
+    # NOTE: derivatives are keyed by the source content and the output
+    # geometry. the least recently used entries are evicted beyond the limit
+    def __init__(self, cache_dir: str, limit: int) -> None:
+        self._dir = os.path.join(cache_dir, "img")
+        self._index = JSONStore(os.path.join(self._dir, "index.json"))
+        self._limit = limit
+
+    @staticmethod
+    def get_key(
+            fhash: str,
+            width: int,
+            height: int,
+            *,
+            fmt: str = "png") -> str:
+        # NOTE: the key uses the planned output size so requests that
+        # resolve to the same derivative share an entry
+        res = f"{fhash}:{width}x{height}"
+        if fmt != "png":
+            res = f"{res}:{fmt}"
+        return res
+
+    def get(self, key: str) -> tuple[str, int, int] | None:
+        entry: ImageCacheEntry | None = self._index.get(key)
+        if entry is None:
+            return None
+        cfile = entry["file"]
+        if not os.path.exists(os.path.join(self._dir, cfile)):
+            self._index.remove(key)
+            return None
+        cur = time.time()
+        if cur - entry["used"] > USED_RESOLUTION:
+            entry["used"] = cur
+            self._index.set(key, entry)
+        return (cfile, entry["width"], entry["height"])
+
+    def restore(self, cfile: str, ofname: str) -> None:
+        # NOTE: the output is replaced instead of overwritten in case it is
+        # a hardlink to a source file
+        tmp = f"{ofname}.{os.getpid()}.tmp"
+        shutil.copyfile(os.path.join(self._dir, cfile), tmp)
+        os.replace(tmp, ofname)
+
+    def put(
+            self,
+            key: str,
+            ofname: str,
+            width: int,
+            height: int) -> None:
+        _, ext = os.path.splitext(ofname)
+        cfile = f"{get_hash(key.encode('utf-8'))}{ext}"
+        os.makedirs(self._dir, exist_ok=True)
+        shutil.copyfile(ofname, os.path.join(self._dir, cfile))
+        size = os.path.getsize(ofname)
+        entry: ImageCacheEntry = {
+            "file": cfile,
+            "width": width,
+            "height": height,
+            "size": size,
+            "used": time.time(),
+        }
+        self._index.set(key, entry)
+
+    def _evict(self) -> None:
+        entries: list[tuple[float, str, ImageCacheEntry]] = []
+        total = 0
+        for key in self._index.keys():
+            entry: ImageCacheEntry = self._index.get(key)
+            entries.append((entry["used"], key, entry))
+            total += entry["size"]
+        entries.sort()
+        for _, key, entry in entries:
+            if total <= self._limit:
+                break
+            self._index.remove(key)
+            total -= entry["size"]
+            try:
+                os.remove(os.path.join(self._dir, entry["file"]))
+            except FileNotFoundError:
+                pass
+
+    def save(self) -> None:
+        self._evict()
+        self._index.save()
+
+
+HashCacheEntry = TypedDict('HashCacheEntry', {
+    "size": int,
+    "mtime": int,
+    "inode": int,
+    "hash": str,
+})
+
+
+# NOTE: files modified within this window of the hashing might be modified
+# again without changing their mtime on filesystems with coarse timestamps
+RACY_WINDOW = 2.0
+
+
+class HashCache:
+    # NOTE: remembers file hashes keyed by path and stat. a hash is reused
+    # only if size, mtime, and inode are all unchanged
+    # compute is safe to call from multiple threads
+    def __init__(self, cache_dir: str) -> None:
+        self._store = JSONStore(os.path.join(cache_dir, "filehashes.json"))
+        self._lock = threading.Lock()
+
+    def lookup(self, fname: str) -> str | None:
+        stat = os.stat(fname)
+        with self._lock:
+            entry: HashCacheEntry | None = self._store.get(
+                os.path.abspath(fname))
+        if (
+                entry is not None
+                and entry["size"] == stat.st_size
+                and entry["mtime"] == stat.st_mtime_ns
+                and entry["inode"] == stat.st_ino):
+            return entry["hash"]
+        return None
+
+    def compute(self, fname: str) -> str:
+        key = os.path.abspath(fname)
+        stat = os.stat(fname)
+        start = time.time()
+        res = get_file_hash(fname)
+        after = os.stat(fname)
+        with self._lock:
+            if (
+                    after.st_size != stat.st_size
+                    or after.st_mtime_ns != stat.st_mtime_ns
+                    or after.st_ino != stat.st_ino
+                    or start - after.st_mtime < RACY_WINDOW):
+                self._store.remove(key)
+                return res
+            self._store.set(key, {
+                "size": after.st_size,
+                "mtime": after.st_mtime_ns,
+                "inode": after.st_ino,
+                "hash": res,
+            })
+        return res
+
+    def get_file_hash(self, fname: str) -> str:
+        res = self.lookup(fname)
+        if res is None:
+            res = self.compute(fname)
+        return res
+
+    def save(self) -> None:
+        for key in self._store.keys():
+            if not os.path.exists(key):
+                self._store.remove(key)
+        self._store.save()
+
+
+DimensionCacheEntry = TypedDict('DimensionCacheEntry', {
+    "size": int,
+    "mtime": int,
+    "inode": int,
+    "width": int,
+    "height": int,
+})
+
+
+class DimensionCache:
+    # NOTE: remembers image dimensions keyed by path and stat like the
+    # HashCache. the probe is only called for new or changed files
+    def __init__(self, cache_dir: str) -> None:
+        self._store = JSONStore(os.path.join(cache_dir, "dimensions.json"))
+
+    def get_size(
+            self,
+            fname: str,
+            probe: Callable[[str], tuple[int, int]]) -> tuple[int, int]:
+        key = os.path.abspath(fname)
+        stat = os.stat(fname)
+        entry: DimensionCacheEntry | None = self._store.get(key)
+        if (
+                entry is not None
+                and entry["size"] == stat.st_size
+                and entry["mtime"] == stat.st_mtime_ns
+                and entry["inode"] == stat.st_ino):
+            return (entry["width"], entry["height"])
+        width, height = probe(fname)
+        if time.time() - stat.st_mtime < RACY_WINDOW:
+            self._store.remove(key)
+        else:
+            self._store.set(key, {
+                "size": stat.st_size,
+                "mtime": stat.st_mtime_ns,
+                "inode": stat.st_ino,
+                "width": width,
+                "height": height,
+            })
+        return (width, height)
+
+    def save(self) -> None:
+        for key in self._store.keys():
+            if not os.path.exists(key):
+                self._store.remove(key)
+        self._store.save()
+
+
+def hash_files(
+        fnames: Iterable[str],
+        *,
+        workers: int,
+        cache: HashCache | None = None) -> list[str]:
+    # NOTE: hashes the files concurrently. hashlib releases the GIL while
+    # hashing large buffers so threads are enough to keep all cores busy.
+    # the result has the same order as the input
+    files = list(fnames)
+    res: list[str | None] = [None] * len(files)
+    missing: list[int] = []
+    for (ix, fname) in enumerate(files):
+        if cache is not None:
+            res[ix] = cache.lookup(fname)
+        if res[ix] is None:
+            missing.append(ix)
+    compute = get_file_hash if cache is None else cache.compute
+    if len(missing) > 1 and workers > 1:
+        with ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="hash") as pool:
+            hashes = list(pool.map(compute, (files[ix] for ix in missing)))
+    else:
+        hashes = [compute(files[ix]) for ix in missing]
+    for (ix, fhash) in zip(missing, hashes):
+        res[ix] = fhash
+    return [fhash for fhash in res if fhash is not None]
+
+
+def get_deps_key(*deps: Any) -> str:
+    return get_hash(
+        json.dumps(deps, sort_keys=True, default=str).encode("utf-8"))
+
+
+ManifestEntry = TypedDict('ManifestEntry', {
+    "deps": str,
+    "size": int,
+    "mtime": int,
+    "meta": dict[str, Any],
+})
+
+
+class Manifest:
+    # NOTE: tracks which inputs every output of a build depends on. outputs
+    # are only reused if both their dependencies and their own stat are
+    # unchanged. outputs that are not produced anymore get removed
+    def __init__(
+            self,
+            cache_dir: str,
+            prefix: str,
+            *,
+            incremental: bool,
+            name: str = "manifest") -> None:
+        pkey = get_hash(os.path.abspath(prefix).encode("utf-8"))[:16]
+        self._prefix = prefix
+        self._incremental = incremental
+        self._cache_dir = cache_dir
+        self._pkey = pkey
+        self._store = JSONStore(
+            os.path.join(cache_dir, f"{name}-{pkey}.json"))
+        self._by_deps: dict[str, str] = {}
+        for output in self._store.keys():
+            entry: ManifestEntry = self._store.get(output)
+            self._by_deps[entry["deps"]] = output
+        self._produced: set[str] = set()
+
+    def _is_current(self, output: str, entry: ManifestEntry) -> bool:
+        try:
+            stat = os.stat(os.path.join(self._prefix, output))
+        except FileNotFoundError:
+            return entry["size"] < 0
+        return (
+            stat.st_size == entry["size"]
+            and stat.st_mtime_ns == entry["mtime"])
+
+    def is_fresh(self, output: str, deps: str) -> bool:
+        self._produced.add(output)
+        if not self._incremental:
+            return False
+        entry: ManifestEntry | None = self._store.get(output)
+        if entry is None or entry["deps"] != deps:
+            return False
+        return self._is_current(output, entry)
+
+    def find(self, deps: str) -> tuple[str, dict[str, Any]] | None:
+        if not self._incremental:
+            return None
+        output = self._by_deps.get(deps)
+        if output is None:
+            return None
+        entry: ManifestEntry | None = self._store.get(output)
+        if entry is None or entry["deps"] != deps or entry["size"] < 0:
+            return None
+        if not self._is_current(output, entry):
+            return None
+        self._produced.add(output)
+        return (output, entry["meta"])
+
+    def record(
+            self,
+            output: str,
+            deps: str,
+            meta: dict[str, Any] | None = None) -> None:
+        stat = os.stat(os.path.join(self._prefix, output))
+        entry: ManifestEntry = {
+            "deps": deps,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "meta": {} if meta is None else meta,
+        }
+        self._produced.add(output)
+        self._store.set(output, entry)
+        self._by_deps[deps] = output
+
+    def record_absent(self, output: str, deps: str) -> None:
+        # NOTE: remembers that the inputs intentionally produce no output
+        # file. the entry stays fresh as long as the file does not exist
+        entry: ManifestEntry = {
+            "deps": deps,
+            "size": -1,
+            "mtime": -1,
+            "meta": {},
+        }
+        self._produced.add(output)
+        self._store.set(output, entry)
+
+    def _get_shared(self) -> set[str]:
+        # NOTE: outputs of the other manifests (e.g., stage, compress) for
+        # the same prefix
+        res: set[str] = set()
+        own = os.path.abspath(self._store.get_fname())
+        for fname in glob.glob(
+                os.path.join(self._cache_dir, f"*-{self._pkey}.json")):
+            if os.path.abspath(fname) == own:
+                continue
+            res.update(JSONStore(fname).keys())
+        return res
+
+    def finish(self) -> list[str]:
+        # NOTE: a stale file is only removed if no other manifest tracks it
+        # and it is still exactly as recorded. a different stat means some
+        # other build step has written the file since. returns the removed
+        # files
+        stale = sorted(
+            output
+            for output in self._store.keys()
+            if output not in self._produced)
+        shared = self._get_shared() if stale else set()
+        removed = []
+        for output in stale:
+            entry: ManifestEntry = self._store.get(output)
+            self._store.remove(output)
+            if output in shared or entry["size"] < 0:
+                continue
+            if not self._is_current(output, entry):
+                continue
+            try:
+                os.remove(os.path.join(self._prefix, output))
+            except FileNotFoundError:
+                continue
+            removed.append(output)
+        self._store.save()
+        return removed
@@ -0,0 +1,185 @@
+# Homepage of Josua Krause
+# Copyright (C) 2024  Josua Krause
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import json
+import os
+import resource
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Any, Literal, NotRequired, TypedDict, TypeVar
+
+
+T = TypeVar('T')
+
+
+TraceCategory = Literal["stage", "entry"]
+
+
+TraceEvent = TypedDict('TraceEvent', {
+    "name": str,
+    "cat": str,
+    "ph": str,
+    "ts": float,
+    "dur": NotRequired[float],
+    "pid": int,
+    "tid": int,
+    "args": dict[str, Any],
+})
+
+
+# start, end, pid, tid
+Timing = tuple[int, int, int, int]
+
+
+def now() -> int:
+    # NOTE: the monotonic clock is shared between processes on the same
+    # machine so timings from worker processes can be merged
+    return time.monotonic_ns()
+
+
+def since(start: int) -> Timing:
+    return (start, now(), os.getpid(), threading.get_native_id())
+
+
+def timed(func: Callable[..., T], *args: Any) -> tuple[T, Timing]:
+    # NOTE: can be submitted to process pools. the timing is returned to the
+    # caller who can add it to the trace
+    start = now()
+    res = func(*args)
+    return (res, since(start))
+
+
+def get_peak_memory() -> tuple[int, int]:
+    # NOTE: ru_maxrss is in KiB on linux. returns the peak of this process
+    # and the peak of its largest child process in bytes
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return (own * 1024, children * 1024)
+
+
+class BuildTrace:
+    # NOTE: collects timing spans in the chrome trace event format. spans
+    # are only recorded after enable is called. recording spans is safe
+    # from multiple threads
+    def __init__(self) -> None:
+        self._events: list[TraceEvent] | None = None
+        self._lock = threading.Lock()
+        self._start = now()
+        self._quiet = False
+
+    def enable(self) -> None:
+        self._start = now()
+        self._events = []
+
+    def is_enabled(self) -> bool:
+        return self._events is not None
+
+    def set_quiet(self, quiet: bool) -> None:
+        self._quiet = quiet
+
+    def log(self, *values: Any) -> None:
+        # NOTE: for per entry progress output
+        if not self._quiet:
+            print(*values)
+
+    def _add(self, event: TraceEvent) -> None:
+        with self._lock:
+            if self._events is not None:
+                self._events.append(event)
+
+    def add_span(
+            self,
+            name: str,
+            cat: TraceCategory,
+            timing: Timing,
+            args: dict[str, Any] | None = None) -> None:
+        if self._events is None:
+            return
+        start, end, pid, tid = timing
+        self._add({
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": (start - self._start) / 1000,
+            "dur": (end - start) / 1000,
+            "pid": pid,
+            "tid": tid,
+            "args": {} if args is None else args,
+        })
+
+    def add_memory(self) -> None:
+        if self._events is None:
+            return
+        own, children = get_peak_memory()
+        self._add({
+            "name": "peak memory",
+            "cat": "memory",
+            "ph": "C",
+            "ts": (now() - self._start) / 1000,
+            "pid": os.getpid(),
+            "tid": threading.get_native_id(),
+            "args": {
+                "process": own,
+                "children": children,
+            },
+        })
+
+    @contextmanager
+    def span(
+            self,
+            name: str,
+            cat: TraceCategory = "stage",
+            **args: Any) -> Iterator[None]:
+        if self._events is None:
+            yield
+            return
+        start = now()
+        try:
+            yield
+        finally:
+            self.add_span(name, cat, since(start), args)
+            if cat == "stage":
+                self.add_memory()
+
+    def get_stage_times(self) -> dict[str, float]:
+        # NOTE: seconds spent in each stage. repeated stages are summed up
+        res: dict[str, float] = {}
+        with self._lock:
+            events = [] if self._events is None else list(self._events)
+        for event in events:
+            if event["cat"] != "stage":
+                continue
+            name = event["name"]
+            res[name] = res.get(name, 0.0) + event.get("dur", 0.0) / 1e6
+        return res
+
+    def save(self, fname: str) -> None:
+        if self._events is None:
+            return
+        self.add_memory()
+        with self._lock:
+            events = sorted(self._events, key=lambda event: event["ts"])
+        tmp = f"{fname}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fout:
+            json.dump({
+                "traceEvents": events,
+                "displayTimeUnit": "ms",
+            }, fout)
+        os.replace(tmp, fname)
+
+
+TRACE = BuildTrace()
@@ -0,0 +1,203 @@
+# Homepage of Josua Krause
+# Copyright (C) 2024  Josua Krause
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import argparse
+import gzip
+import os
+import sys
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+
+import brotli
+
+from buildcache import CACHE_DIR, get_deps_key, hash_files, HashCache, Manifest
+from filerules import FileRules, walk_files
+
+
+COMPRESSIBLE = frozenset([
+    ".bib",
+    ".css",
+    ".eot",
+    ".html",
+    ".ico",
+    ".js",
+    ".json",
+    ".map",
+    ".otf",
+    ".svg",
+    ".ttf",
+    ".txt",
+    ".xml",
+])
+FONTS = frozenset([
+    ".eot",
+    ".otf",
+    ".ttf",
+])
+BINARIES = frozenset([
+    ".ico",
+])
+# NOTE: smaller files do not benefit from compression
+MIN_SIZE = 256
+
+
+def get_brotli_mode(fname: str) -> int:
+    _, ext = os.path.splitext(fname)
+    if ext in FONTS:
+        return brotli.MODE_FONT
+    if ext in BINARIES:
+        return brotli.MODE_GENERIC
+    return brotli.MODE_TEXT
+
+
+def compress_gzip(content: bytes, _fname: str) -> bytes:
+    # NOTE: mtime is fixed so unchanged inputs give identical outputs
+    return gzip.compress(content, compresslevel=9, mtime=0)
+
+
+def compress_brotli(content: bytes, fname: str) -> bytes:
+    return brotli.compress(content, mode=get_brotli_mode(fname), quality=11)
+
+
+# NOTE: compressors get the content and the name of the source file
+COMPRESSORS: dict[str, Callable[[bytes, str], bytes]] = {
+    ".gz": compress_gzip,
+    ".br": compress_brotli,
+}
+
+
+def is_compressible(fname: str) -> bool:
+    _, ext = os.path.splitext(fname)
+    return ext in COMPRESSIBLE
+
+
+def compress_file(fname: str, ext: str) -> int | None:
+    # NOTE: siblings that would not be smaller than the original are not
+    # written. returns the size of the sibling
+    with open(fname, "rb") as fin:
+        content = fin.read()
+    res = COMPRESSORS[ext](content, fname)
+    ofname = f"{fname}{ext}"
+    if len(res) >= len(content):
+        try:
+            os.remove(ofname)
+        except FileNotFoundError:
+            pass
+        return None
+    tmp = f"{ofname}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as fout:
+            fout.write(res)
+        os.replace(tmp, ofname)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    return len(res)
+
+
+def compress_outputs(
+        prefix: str,
+        *,
+        manifest: Manifest,
+        hash_cache: HashCache,
+        parallel: int) -> tuple[int, int]:
+    fnames = sorted(
+        os.path.relpath(entry.path, prefix).replace(os.sep, "/")
+        for entry in walk_files(prefix, FileRules())
+        if is_compressible(entry.name) and entry.stat().st_size >= MIN_SIZE)
+    fhashes = hash_files(
+        (os.path.join(prefix, fname) for fname in fnames),
+        workers=parallel,
+        cache=hash_cache)
+    jobs: list[tuple[str, str, str]] = []
+    skipped = 0
+    for (fname, fhash) in zip(fnames, fhashes):
+        for ext in COMPRESSORS:
+            deps = get_deps_key(
+                fhash, ext, get_brotli_mode(fname) if ext == ".br" else None)
+            if manifest.is_fresh(f"{fname}{ext}", deps):
+                skipped += 1
+                continue
+            jobs.append((fname, ext, deps))
+    compressed = 0
+    if not jobs:
+        return (compressed, skipped)
+    with ProcessPoolExecutor(max_workers=parallel) as pool:
+        sizes = pool.map(
+            compress_file,
+            [os.path.join(prefix, fname) for (fname, _, _) in jobs],
+            [ext for (_, ext, _) in jobs],
+            chunksize=max(1, len(jobs) // (parallel * 4)))
+        for ((fname, ext, deps), size) in zip(jobs, sizes):
+            if size is None:
+                # NOTE: remembered so the file is not tried again until its
+                # content changes
+                manifest.record_absent(f"{fname}{ext}", deps)
+                continue
+            print(f"compressed: {fname}{ext} ({size} bytes)")
+            manifest.record(f"{fname}{ext}", deps)
+            compressed += 1
+    return (compressed, skipped)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog=f"python {os.path.basename(__file__)}",
+        description=(
+            "Write gzip and brotli compressed siblings for all "
+            "compressible files in the output folder"))
+    parser.add_argument(
+        "--prefix",
+        type=str,
+        help="specifies the output folder")
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=CACHE_DIR,
+        help="specifies the build cache folder")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of parallel processes for compressing files")
+    return parser.parse_args()
+
+
+def run() -> None:
+    args = parse_args()
+    prefix = args.prefix
+    manifest = Manifest(
+        args.cache_dir, prefix, incremental=True, name="compress")
+    hash_cache = HashCache(args.cache_dir)
+    compressed, skipped = compress_outputs(
+        prefix,
+        manifest=manifest,
+        hash_cache=hash_cache,
+        parallel=args.jobs)
+    hash_cache.save()
+    stale = manifest.finish()
+    for fname in stale:
+        print(f"removed stale output: {fname}")
+    print(
+        f"compressed {compressed} siblings, {skipped} unchanged, "
+        f"{len(stale)} removed",
+        file=sys.stderr)
+
+
+if __name__ == "__main__":
+    run()
@@ -20,47 +20,47 @@ set -ex
 
 if [ -z $NO_DEFAULT ]; then
   OUTPUT="www"
-  LIB_COPY="filelist.txt"
   PUBLISH=
 fi
 
-mkdir -p "${OUTPUT}"
-find . \
-  -not -path '*node_modules/*' \
-  -not -path '*.pytest_cache/*' \
-  -not -path '*.mypy_cache/*' \
-  -not -path '*.git*/*' \
-  -not -path '*'"${OUTPUT}/"'*' \
-  -type f \
-  -not -name '*.md' \
-  -not -name '*.py' \
-  -not -name '*.tmpl' \
-  -not -name '*.sh' \
-  -not -name '*.ini' \
-  -not -name '*.toml' \
-  -not -name "${LIB_COPY}" \
-  -not -name '.*' \
-  -not -name "Makefile" \
-  -not -name "requirements.txt" \
-  -not -name "jsconfig.json" \
-  -not -name "package-lock.json" \
-  -not -name "package.json" \
-  -not -name "tsconfig.json" \
-  -not -name "content.json" \
-  > "${LIB_COPY}"
-rsync -atv . "${OUTPUT}" --files-from "${LIB_COPY}"
+python stage.py \
+  --out "${OUTPUT}" \
+  --cache-dir .cache
 python create_page.py \
   --documents content.json \
   --template index.tmpl \
   --out "${OUTPUT}/index.html" \
-  --prefix "${OUTPUT}"
+  --prefix "${OUTPUT}" \
+  ${INCREMENTAL:+--incremental}
 PREV_DIR=`pwd`
+# NOTE: previous filetimes are taken from PREVIOUS_FILETIMES, the existing
+# output of the current sitemap mode for incremental builds, or the live
+# website otherwise. setting SITEMAP_SHARD_SIZE writes gzip shards and
+# sitemap_index.xml instead
+SITEMAP_PREVIOUS="${PREVIOUS_FILETIMES}"
+if [ -z "${SITEMAP_PREVIOUS}" ] && [ ! -z $INCREMENTAL ]; then
+  if [ ! -z "${SITEMAP_SHARD_SIZE}" ]; then
+    PREV_FILE="filetimes_index.xml"
+  else
+    PREV_FILE="filetimes.xml"
+  fi
+  if [ -f "${OUTPUT}/${PREV_FILE}" ]; then
+    SITEMAP_PREVIOUS="${OUTPUT}/${PREV_FILE}"
+  fi
+fi
+if [ ! -z "${SITEMAP_PREVIOUS}" ]; then
+  SITEMAP_PREVIOUS=`realpath "${SITEMAP_PREVIOUS}"`
+fi
 pushd "${OUTPUT}"
-find . \
-  -not -path '*lib/*' \
-  -not -path '*lib' \
-  | python "${PREV_DIR}/create_sitemap.py" "sitemap.xml" "filetimes.xml"
+python "${PREV_DIR}/create_sitemap.py" \
+  "sitemap.xml" "filetimes.xml" \
+  --cache-dir "${PREV_DIR}/.cache" \
+  ${SITEMAP_PREVIOUS:+--previous "${SITEMAP_PREVIOUS}"} \
+  ${SITEMAP_SHARD_SIZE:+--shard-size "${SITEMAP_SHARD_SIZE}"}
 popd
+python compress.py \
+  --prefix "${OUTPUT}" \
+  --cache-dir .cache
 
 if [ -z $PUBLISH ]; then
   echo "run 'make run-web' next"
@@ -14,24 +14,60 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 import argparse
+import functools
+import html
+import io
 import json
 import os
 import re
 import sys
+import unicodedata
 import zlib
-from collections.abc import Callable
+from collections.abc import Callable, Iterator
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from typing import Any, cast, get_args, Literal, NotRequired, Set, TypedDict
+from typing import (
+    Any,
+    cast,
+    get_args,
+    IO,
+    Literal,
+    NotRequired,
+    Set,
+    TypedDict,
+)
 
 import pytz
 from dateutil.parser import parse as tparse
-from PIL import Image
+from PIL import features, Image
+
+from buildcache import (
+    CACHE_DIR,
+    DimensionCache,
+    get_deps_key,
+    get_file_hash,
+    HashCache,
+    ImageCache,
+    Manifest,
+    MEBIBYTE,
+)
+from buildtrace import now, since, timed, Timing, TRACE
+from template import load_template, Template, TemplateValue
+from writer import OutputWriter
 
 
 ONGOING = "current"
 FADEOUT = "employment"
 
 
+DateInfo = TypedDict('DateInfo', {
+    "tuple": tuple[int, int, int],
+    "epoch": int,
+    "month": str,
+    "year": int,
+})
+
+
 Entry = TypedDict('Entry', {
     "abstract": list[str],
     "article": str,
@@ -41,7 +77,9 @@ Entry = TypedDict('Entry', {
     "bibtex": list[str],
     "conference": str,
     "date": str,
+    "date-info": DateInfo,
     "end-date": NotRequired[str],
+    "end-date-info": NotRequired[DateInfo | None],
     "demo": str,
     "external": str,
     "github": str,
@@ -104,7 +142,118 @@ def parse_entry(obj: dict[str, Any]) -> Entry:
     for key in obj.keys():
         if key not in ALLOWED_FIELDS:
             raise ValueError(f"unknown field: {key}")
-    return cast(Entry, obj)
+    res = cast(Entry, obj)
+    date_info = parse_date(res["date"])
+    if date_info is None:
+        raise ValueError(f"invalid start date: {res['date']}")
+    res["date-info"] = date_info
+    end_date = res.get("end-date")
+    if end_date is not None:
+        res["end-date-info"] = parse_date(end_date)
+    return res
+
+
+WHITESPACE = re.compile(r"\s*")
+NUMBER_CHARS = frozenset("+-.0123456789Ee")
+
+
+def get_stream_name(fin: IO[str]) -> str:
+    return getattr(fin, "name", "<stream>")
+
+
+class ContentTokenizer:
+    # NOTE: strings may contain raw newlines
+    def __init__(self, fin: IO[str], chunk_size: int) -> None:
+        self._fin = fin
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder(strict=False)
+        self._buff = ""
+        self._pos = 0
+
+    def _fill(self) -> bool:
+        chunk = self._fin.read(self._chunk_size)
+        if not chunk:
+            return False
+        self._buff = f"{self._buff[self._pos:]}{chunk}"
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            m = WHITESPACE.match(self._buff, self._pos)
+            assert m is not None
+            self._pos = m.end()
+            if self._pos < len(self._buff):
+                return self._buff[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        cur = self.peek()
+        if cur != char:
+            raise ValueError(
+                f"expected {char!r} but got {cur!r} in "
+                f"{get_stream_name(self._fin)}")
+        self._pos += 1
+
+    def skip(self, char: str) -> bool:
+        if self.peek() != char:
+            return False
+        self._pos += 1
+        return True
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                res, end = self._decoder.raw_decode(self._buff, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # NOTE: a number might continue in the next chunk. it is only
+            # complete once a different character or the end of the file
+            # follows it
+            if (
+                    isinstance(res, (int, float))
+                    and not isinstance(res, bool)
+                    and (
+                        end == len(self._buff)
+                        or self._buff[end] in NUMBER_CHARS)
+                    and self._fill()):
+                continue
+            self._pos = end
+            return res
+
+
+def iter_content(
+        fin: IO[str],
+        chunk_size: int = 64 * 1024) -> Iterator[tuple[str, Any]]:
+    # NOTE: streams the members of the top level object of a content file.
+    # elements of arrays are yielded one by one
+    tok = ContentTokenizer(fin, chunk_size)
+    tok.expect("{")
+    if tok.skip("}"):
+        return
+    while True:
+        key = tok.value()
+        if not isinstance(key, str):
+            raise ValueError(f"invalid key {key} in {get_stream_name(fin)}")
+        tok.expect(":")
+        if tok.skip("["):
+            if not tok.skip("]"):
+                while True:
+                    yield (key, tok.value())
+                    if not tok.skip(","):
+                        break
+                tok.expect("]")
+        else:
+            yield (key, tok.value())
+        if not tok.skip(","):
+            break
+    tok.expect("}")
+    if tok.peek():
+        raise ValueError(f"trailing content in {get_stream_name(fin)}")
 
 
 Group = TypedDict('Group', {
@@ -132,6 +281,240 @@ Event = TypedDict('Event', {
     "endTime": NotRequired[int],
     "link": str,
 })
+# NOTE: events stored column by column. times are in epoch days with every
+# time being the difference to the previous event. group values index into
+# the groups list. end times are days after the start time, null if the
+# event has no end, or -1 if it is ongoing.
+# the layout is precomputed: lane is the row of the event, x and x1 are the
+# horizontal start and end in resolution units of the full width (x1 is
+# null for point events), and domain is the time range in epoch days
+# the width corresponds to
+CompactTimeline = TypedDict('CompactTimeline', {
+    "groups": list[str],
+    "id": list[str],
+    "group": list[int],
+    "name": list[str],
+    "time": list[int],
+    "endTime": list[int | None],
+    "link": list[str],
+    "type_names": dict[str, str],
+    "type_order": list[str],
+    "lane": list[int],
+    "x": list[int],
+    "x1": list[int | None],
+    "domain": list[int],
+    "resolution": int,
+})
+
+
+TIMELINE_RESOLUTION = 10000
+# NOTE: ranged events are drawn until the end of their last month
+TIMELINE_END_PADDING = 31
+
+
+def to_days(epoch: int) -> int:
+    days, rem = divmod(epoch, DAY_SECONDS)
+    if rem:
+        raise ValueError(f"timeline time is not at day resolution: {epoch}")
+    return days
+
+
+def encode_timeline(
+        events: list[Event],
+        type_names: dict[str, str],
+        type_order: list[str]) -> CompactTimeline:
+    res: CompactTimeline = {
+        "groups": [],
+        "id": [],
+        "group": [],
+        "name": [],
+        "time": [],
+        "endTime": [],
+        "link": [],
+        "type_names": type_names,
+        "type_order": type_order,
+        "lane": [],
+        "x": [],
+        "x1": [],
+        "domain": [],
+        "resolution": TIMELINE_RESOLUTION,
+    }
+    group_ixs: dict[str, int] = {}
+    prev = 0
+    for event in sorted(events, key=lambda event: event["time"]):
+        group = event["group"]
+        group_ix = group_ixs.get(group)
+        if group_ix is None:
+            group_ix = len(res["groups"])
+            group_ixs[group] = group_ix
+            res["groups"].append(group)
+        time = to_days(event["time"])
+        end_time = event.get("endTime")
+        if end_time is not None and end_time >= 0:
+            end_time = to_days(end_time) - time
+            if end_time < 0:
+                raise ValueError(f"event ends before it starts: {event}")
+        res["id"].append(event["id"])
+        res["group"].append(group_ix)
+        res["name"].append(event["name"])
+        res["time"].append(time - prev)
+        res["endTime"].append(end_time)
+        res["link"].append(event["link"])
+        prev = time
+    layout_timeline(res)
+    return res
+
+
+def year_start_days(year_num: int) -> int:
+    return to_days(mktime(datetime(year=year_num, month=1, day=1)))
+
+
+def layout_timeline(timeline: CompactTimeline) -> None:
+    # NOTE: the zoom of the timeline is a pure transform so a single layout
+    # is valid for all zoom levels. the domain is extended to full years.
+    # every id gets its own lane ordered by its first occurrence
+    times: list[int] = []
+    cur = 0
+    for delta in timeline["time"]:
+        cur += delta
+        times.append(cur)
+    if not times:
+        timeline["domain"] = []
+        return
+    start_year = (EPOCH + timedelta(days=times[0])).year
+    end_year = (EPOCH + timedelta(days=times[-1])).year
+    start = year_start_days(start_year)
+    end = year_start_days(end_year)
+    if end < times[-1] or end == start:
+        end = year_start_days(end_year + 1)
+    timeline["domain"] = [start, end]
+
+    def get_x(days: int) -> int:
+        return round((days - start) * TIMELINE_RESOLUTION / (end - start))
+
+    lanes: dict[str, int] = {}
+    for (eid, time, end_time) in zip(
+            timeline["id"], times, timeline["endTime"]):
+        lane = lanes.get(eid)
+        if lane is None:
+            lane = len(lanes)
+            lanes[eid] = lane
+        timeline["lane"].append(lane)
+        timeline["x"].append(get_x(time))
+        if end_time is None:
+            timeline["x1"].append(None)
+        elif end_time < 0:
+            timeline["x1"].append(TIMELINE_RESOLUTION)
+        else:
+            timeline["x1"].append(
+                get_x(time + end_time + TIMELINE_END_PADDING))
+
+
+# NOTE: inverted index stored column by column. id, title and info describe
+# the entries in page order. terms are sorted by their UTF-16 code units,
+# the order of string comparisons in javascript, so prefixes can be looked
+# up with a binary search. every term has a postings list of alternating
+# entry index deltas and weights
+CompactSearch = TypedDict('CompactSearch', {
+    "id": list[str],
+    "title": list[str],
+    "info": list[str],
+    "terms": list[str],
+    "postings": list[list[int]],
+})
+SearchEntry = tuple[str, Entry, str]
+
+
+SEARCH_FIELDS: list[tuple[EntryField, int]] = [
+    ("title", 8),
+    ("short-title", 8),
+    ("keywords", 4),
+    ("authors", 2),
+    ("conference", 2),
+    ("short-conference", 2),
+    ("abstract", 1),
+]
+SEARCH_TOKEN = re.compile(r"[^\W_]+")
+SEARCH_STOPWORDS = frozenset([
+    "an",
+    "and",
+    "are",
+    "as",
+    "at",
+    "be",
+    "by",
+    "for",
+    "from",
+    "in",
+    "is",
+    "it",
+    "of",
+    "on",
+    "or",
+    "that",
+    "the",
+    "this",
+    "to",
+    "we",
+    "with",
+])
+
+
+def to_plain_text(text: str) -> str:
+    return html.unescape(re.sub(SPACES, " ", re.sub(TAG, " ", text))).strip()
+
+
+def tokenize(text: str) -> list[str]:
+    # NOTE: must match tokenize in js/search.js
+    text = unicodedata.normalize("NFKD", to_plain_text(text))
+    text = "".join(
+        char
+        for char in text
+        if not unicodedata.category(char).startswith("M")).lower()
+    return [
+        token
+        for token in SEARCH_TOKEN.findall(text)
+        if len(token) > 1 and token not in SEARCH_STOPWORDS
+    ]
+
+
+def get_search_order(term: str) -> bytes:
+    # NOTE: code point order differs from javascript for characters outside
+    # of the BMP
+    return term.encode("utf-16-be")
+
+
+def encode_search(entries: list[SearchEntry]) -> CompactSearch:
+    res: CompactSearch = {
+        "id": [],
+        "title": [],
+        "info": [],
+        "terms": [],
+        "postings": [],
+    }
+    weights: dict[str, dict[int, int]] = {}
+    for (ix, (entry_id, doc, info)) in enumerate(entries):
+        res["id"].append(entry_id)
+        res["title"].append(to_plain_text(doc["title"]))
+        res["info"].append(to_plain_text(info))
+        for (field, weight) in SEARCH_FIELDS:
+            if not chk(doc, field):
+                continue
+            value = doc[field]
+            text = " ".join(value) if isinstance(value, list) else f"{value}"
+            for token in tokenize(text):
+                term_weights = weights.setdefault(token, {})
+                term_weights[ix] = max(term_weights.get(ix, 0), weight)
+    for term in sorted(weights, key=get_search_order):
+        prev = 0
+        postings: list[int] = []
+        for (ix, weight) in sorted(weights[term].items()):
+            postings.append(ix - prev)
+            postings.append(weight)
+            prev = ix
+        res["terms"].append(term)
+        res["postings"].append(postings)
+    return res
 
 
 NL = "\n"
@@ -302,38 +685,119 @@ def datetuple(dtime: datetime) -> tuple[int, int, int]:
     return (dtime.year, dtime.month, dtime.day)
 
 
+MONTHS: dict[str, int] = {
+    month: ix + 1
+    for (ix, month) in enumerate([
+        "jan", "feb", "mar", "apr", "may", "jun",
+        "jul", "aug", "sep", "oct", "nov", "dec",
+    ])
+}
+DATE_YEAR = re.compile(r"^(\d{4})$")
+DATE_MONTH_DAY_YEAR = re.compile(
+    r"^([A-Za-z]+)\.?(?:\s+(\d{1,2}))?,\s*(\d{4})$")
+
+
+def get_dateinfo(dtime: datetime) -> DateInfo:
+    return {
+        "tuple": datetuple(dtime),
+        "epoch": mktime(dtime),
+        "month": monthtime(dtime),
+        "year": year(dtime),
+    }
+
+
+def parse_date(datestr: str) -> DateInfo | None:
+    # NOTE: the cached info is shared by all dates with the same string so
+    # every caller gets its own copy
+    res = parse_date_cached(datestr)
+    return None if res is None else res.copy()
+
+
+@functools.cache
+def parse_date_cached(datestr: str) -> DateInfo | None:
+    # NOTE: partial dates are normalized to the first day of the period.
+    # returns None for ongoing dates
+    datestr = datestr.strip()
+    if datestr == ONGOING:
+        return None
+    m = DATE_YEAR.match(datestr)
+    if m is not None:
+        return get_dateinfo(datetime(year=int(m.group(1)), month=1, day=1))
+    m = DATE_MONTH_DAY_YEAR.match(datestr)
+    if m is not None:
+        month = MONTHS.get(m.group(1)[:3].lower())
+        if month is not None:
+            day = m.group(2)
+            return get_dateinfo(datetime(
+                year=int(m.group(3)),
+                month=month,
+                day=int(day) if day is not None else 1))
+    return get_dateinfo(tparse(normdate(datestr)))
+
+
 def chk(doc: Entry, field: EntryField) -> bool:
     return field in doc and bool(doc[field])
 
 
+def with_newline(text: str) -> str:
+    return f"{text}\n"
+
+
 BADNESS = 0.1
 
 
-def resize_img(
-        prefix: str,
-        image: str,
+# NOTE: png is the fallback format every browser supports. the encoder
+# effort of webp and avif is lowered since the highest settings made cold
+# builds many times slower for a few percent smaller files
+ImageFormat = Literal["png", "webp", "avif"]
+IMAGE_SAVE_ARGS: dict[ImageFormat, dict[str, Any]] = {
+    "png": {"format": "PNG"},
+    "webp": {"format": "WEBP", "quality": 85, "method": 4},
+    "avif": {"format": "AVIF", "quality": 70, "speed": 8},
+}
+# NOTE: preferred formats first
+PREFERRED_FORMATS: tuple[ImageFormat, ...] = ("avif", "webp")
+MODERN_FORMATS: list[ImageFormat] = [
+    fmt for fmt in PREFERRED_FORMATS if features.check(fmt)
+]
+TEASER_WIDTHS = [800, 1600]
+TEASER_SIZES = "(min-width: 1200px) 800px, 90vw"
+
+
+def derivative_name(
+        image: str, width: int, height: int, fmt: ImageFormat = "png") -> str:
+    ext_ix = image.rindex(".")
+    return f"{image[:ext_ix]}_{width}x{height}.{fmt}"
+
+
+def probe_image_size(fname: str) -> tuple[int, int]:
+    # NOTE: opening an image only parses its header. the pixel data is not
+    # decoded
+    with Image.open(fname) as img:
+        return img.size
+
+
+def plan_resize(
+        iwidth: int,
+        iheight: int,
         width: int | None,
         height: int | None,
         *,
-        nostretch: bool = True,
-        noupscale: bool = False,
-        record_size: Callable[[int, int], None] | None = None) -> str:
-    img = Image.open(os.path.join(prefix, image))
-    iwidth = img.width
-    iheight = img.height
-
-    def record(owidth: int, oheight: int) -> None:
-        if record_size is None:
-            return
-        record_size(owidth, oheight)
-
+        nostretch: bool,
+        noupscale: bool,
+        fmt: ImageFormat) -> tuple[int, int] | None:
+    # NOTE: returns the size of the derivative or None if the original image
+    # can be used as is
     if iwidth == 1 and iheight == 1:
-        record(iwidth, iheight)
-        return image
+        return None
+    # NOTE: other formats always need a converted derivative
+    convert = fmt != "png"
     if ((width is None and height is None)
             or (width == iwidth and height == iheight)):
-        record(iwidth, iheight)
-        return image
+        if not convert:
+            return None
+        width = iwidth
+        height = iheight
     if width is None:
         assert height is not None
         width = iwidth * height // iheight
@@ -346,21 +810,413 @@ def resize_img(
             f"{iwidth}x{iheight} to {width}x{height} "
             f"(rw: {iwidth / width} rh: {iheight / height})")
     if noupscale and (iwidth < width or iheight < height):
-        record(iwidth, iheight)
-        return image
-    oimg = img.resize((width, height))
-    ext_ix = image.rindex(".")
-    oname = f"{image[:ext_ix]}_{oimg.width}x{oimg.height}.png"
+        if not convert:
+            return None
+        width = iwidth
+        height = iheight
+    return (width, height)
+
+
+def compute_resize(
+        prefix: str,
+        image: str,
+        width: int,
+        height: int,
+        *,
+        fmt: ImageFormat = "png") -> tuple[str, int, int]:
+    img = Image.open(os.path.join(prefix, image))
+    oimg = img if (width, height) == img.size else img.resize((width, height))
+    oname = derivative_name(image, oimg.width, oimg.height, fmt)
     ofname = os.path.join(prefix, oname)
     # if os.path.exists(ofname):
     #     raise ValueError(f"image already exists! {ofname}")
-    record(oimg.width, oimg.height)
-    oimg.save(ofname)
+    # NOTE: the same derivative might be produced by concurrent jobs
+    tmp = f"{ofname}.{os.getpid()}.tmp"
+    oimg.save(tmp, **IMAGE_SAVE_ARGS[fmt])
+    os.replace(tmp, ofname)
+    return (oname, oimg.width, oimg.height)
+
+
+# image, width, height, nostretch, noupscale, format
+ResizeJob = tuple[str, int | None, int | None, bool, bool, ImageFormat]
+# name, width, height
+ResizeResult = tuple[str, int, int]
+
+
+# NOTE: the png derivatives are the 2x fallbacks of the displayed sizes
+HEADER_JOBS: dict[str, ResizeJob] = {
+    "icon_medium": ("img/mediumlogo.png", None, 64, True, False, "png"),
+    "icon_scholar": ("img/scholarlogo.png", None, 64, True, False, "png"),
+    "icon_linkedin": ("img/linkedinlogo.png", None, 64, True, False, "png"),
+    "icon_researchgate": (
+        "img/researchgatelogo.png", None, 64, True, False, "png"),
+    "icon_github": ("img/github-mark.png", None, 64, True, False, "png"),
+    "icon_photo": ("img/photo.jpg", None, 128, True, False, "png"),
+}
+HEADER_ATTRS: dict[str, str] = {
+    "icon_medium": 'alt="Medium"',
+    "icon_scholar": 'alt="Google Scholar"',
+    "icon_linkedin": 'alt="LinkedIn"',
+    "icon_researchgate": 'alt="ResearchGate"',
+    "icon_github": 'alt="GitHub"',
+    "icon_photo": 'alt="Josua Krause"',
+}
+OGIMG_JOB: ResizeJob = ("img/photo.jpg", None, 630, True, False, "png")
+
+
+def halve(size: int | None) -> int | None:
+    return None if size is None else size // 2
+
+
+def display_size(
+        images: dict[ResizeJob, ResizeResult],
+        job: ResizeJob) -> tuple[int, int]:
+    # NOTE: the png derivatives have twice the display density. the size is
+    # planned like the 1x derivatives so both always agree
+    image, width, height, _, _, _ = job
+    _, iwidth, iheight = images[original_job(image)]
+    size = plan_resize(
+        iwidth,
+        iheight,
+        halve(width),
+        halve(height),
+        nostretch=False,
+        noupscale=False,
+        fmt="png")
+    return (iwidth, iheight) if size is None else size
+
+
+def density_jobs(
+        job: ResizeJob) -> list[tuple[ImageFormat, ResizeJob, ResizeJob]]:
+    image, width, height, nostretch, noupscale, _ = job
+    return [
+        (
+            fmt,
+            (image, halve(width), halve(height), nostretch, noupscale, fmt),
+            (image, width, height, nostretch, noupscale, fmt),
+        )
+        for fmt in MODERN_FORMATS
+    ]
+
+
+def teaser_jobs(teaser: str) -> list[tuple[ImageFormat, list[ResizeJob]]]:
+    return [
+        (
+            fmt,
+            [
+                (teaser, width, None, True, True, fmt)
+                for width in TEASER_WIDTHS
+            ],
+        )
+        for fmt in MODERN_FORMATS
+    ]
+
+
+def original_job(image: str) -> ResizeJob:
+    # NOTE: never produces a derivative. used to obtain the original size
+    return (image, None, None, False, True, "png")
+
+
+def picture(
+        fallback: str,
+        sources: list[str],
+        attrs: str,
+        size: tuple[int, int]) -> str:
+    width, height = size
+    img = (
+        f"<img src=\"{fallback}\" width=\"{width}\" height=\"{height}\" "
+        f"{attrs}>")
+    if not sources:
+        return img
+    return f"<picture>{''.join(sources)}{img}</picture>"
+
+
+def density_picture(
+        images: dict[ResizeJob, ResizeResult],
+        job: ResizeJob,
+        attrs: str,
+        *,
+        size: tuple[int, int] | None = None) -> str:
+    sources = []
+    for (fmt, job1x, job2x) in density_jobs(job):
+        name1x = images[job1x][0]
+        name2x = images[job2x][0]
+        if name1x == job[0] or name2x == job[0]:
+            continue
+        srcset = (
+            name1x if name1x == name2x else f"{name1x} 1x, {name2x} 2x")
+        sources.append(
+            f"<source type=\"image/{fmt}\" srcset=\"{srcset}\">")
+    return picture(
+        images[job][0],
+        sources,
+        attrs,
+        display_size(images, job) if size is None else size)
+
+
+def teaser_picture(
+        images: dict[ResizeJob, ResizeResult],
+        teaser: str,
+        attrs: str) -> str:
+    sources = []
+    for (fmt, jobs) in teaser_jobs(teaser):
+        variants = {
+            images[job][0]: images[job][1]
+            for job in jobs
+            if images[job][0] != teaser
+        }
+        if not variants:
+            continue
+        srcset = ", ".join(
+            f"{name} {width}w" for (name, width) in variants.items())
+        sources.append(
+            f"<source type=\"image/{fmt}\" srcset=\"{srcset}\" "
+            f"sizes=\"{TEASER_SIZES}\">")
+    _, twidth, theight = images[original_job(teaser)]
+    return picture(teaser, sources, attrs, (twidth, theight))
+
+
+LOGO_SIZE = (64, 64)
+
+
+def logo_job(doc: Entry) -> ResizeJob:
+    logo = doc["logo"] if chk(doc, "logo") else "img/nologo.png"
+    return (logo, 128, None, True, False, "png")
+
+
+def logo_picture(images: dict[ResizeJob, ResizeResult], doc: Entry) -> str:
+    # NOTE: logos always fill the same box regardless of their intrinsic
+    # size. the 1x1 nologo.png acts as a placeholder
+    sttl = doc["short-title"] if chk(doc, "short-title") else doc["title"]
+    width, height = LOGO_SIZE
+    return density_picture(
+        images,
+        logo_job(doc),
+        f"class=\"media-object\" title=\"{doc['title']}\" "
+        f"alt=\"{sttl}\" style=\"width: {width}px; height: {height}px;\"",
+        size=LOGO_SIZE)
+
+
+def ogimg_job(doc: Entry) -> ResizeJob:
+    if chk(doc, "logo") and doc["logo"] != "img/nologo.png":
+        ogimg = doc["logo"]
+    elif chk(doc, "teaser"):
+        ogimg = doc["teaser"]
+    else:
+        ogimg = "img/photo.jpg"
+    return (ogimg, None, 630, True, True, "png")
+
+
+def has_autopage(doc: Entry) -> bool:
+    return chk(doc, "href") and chk(doc, "autopage")
+
+
+def add_density_jobs(jobs: list[ResizeJob], job: ResizeJob) -> None:
+    jobs.append(job)
+    jobs.append(original_job(job[0]))
+    for (_, job1x, job2x) in density_jobs(job):
+        jobs.append(job1x)
+        jobs.append(job2x)
+
+
+def get_resize_jobs(docs: list[Entry]) -> list[ResizeJob]:
+    jobs: list[ResizeJob] = [OGIMG_JOB]
+    for job in HEADER_JOBS.values():
+        add_density_jobs(jobs, job)
+    for doc in docs:
+        add_density_jobs(jobs, logo_job(doc))
+        if has_autopage(doc):
+            jobs.append(ogimg_job(doc))
+            if chk(doc, "teaser"):
+                jobs.append(original_job(doc["teaser"]))
+                for (_, variants) in teaser_jobs(doc["teaser"]):
+                    jobs.extend(variants)
+    return jobs
+
+
+def run_resize_job(
+        prefix: str, job: ResizeJob, size: tuple[int, int]) -> ResizeResult:
+    image, _, _, _, _, fmt = job
+    width, height = size
+    return compute_resize(prefix, image, width, height, fmt=fmt)
+
+
+def timed_resize_job(
+        prefix: str,
+        job: ResizeJob,
+        size: tuple[int, int]) -> tuple[ResizeResult, Timing]:
+    return timed(run_resize_job, prefix, job, size)
+
+
+def resize_images(
+        prefix: str,
+        jobs: list[ResizeJob],
+        *,
+        parallel: int,
+        cache: ImageCache | None,
+        manifest: Manifest | None = None,
+        dims: DimensionCache | None = None,
+        hash_cache: HashCache | None = None) -> dict[ResizeJob, ResizeResult]:
+    res: dict[ResizeJob, ResizeResult] = {}
+    keys: dict[ResizeJob, str] = {}
+    sizes: dict[ResizeJob, tuple[int, int]] = {}
+    fhashes: dict[str, str] = {}
+    # NOTE: jobs that resolve to the same output are only run and recorded
+    # once. the other jobs share the result
+    outputs: dict[str, ResizeJob] = {}
+    aliases: dict[ResizeJob, ResizeJob] = {}
+    pending: list[ResizeJob] = []
+    for job in dict.fromkeys(jobs):
+        image, width, height, nostretch, noupscale, fmt = job
+        fname = os.path.join(prefix, image)
+        iwidth, iheight = (
+            probe_image_size(fname)
+            if dims is None
+            else dims.get_size(fname, probe_image_size))
+        size = plan_resize(
+            iwidth,
+            iheight,
+            width,
+            height,
+            nostretch=nostretch,
+            noupscale=noupscale,
+            fmt=fmt)
+        if size is None:
+            res[job] = (image, iwidth, iheight)
+            continue
+        oname = derivative_name(image, *size, fmt)
+        first = outputs.get(oname)
+        if first is not None:
+            aliases[job] = first
+            continue
+        outputs[oname] = job
+        sizes[job] = size
+        if cache is None and manifest is None:
+            pending.append(job)
+            continue
+        fhash = fhashes.get(image)
+        if fhash is None:
+            fhash = (
+                get_file_hash(fname)
+                if hash_cache is None
+                else hash_cache.get_file_hash(fname))
+            fhashes[image] = fhash
+        key = ImageCache.get_key(fhash, *size, fmt=fmt)
+        keys[job] = key
+        if manifest is not None:
+            fresh = manifest.find(key)
+            if fresh is not None:
+                oname, meta = fresh
+                res[job] = (oname, meta["width"], meta["height"])
+                continue
+        if cache is not None:
+            hit = cache.get(key)
+            if hit is not None:
+                cfile, owidth, oheight = hit
+                oname = derivative_name(image, owidth, oheight, fmt)
+                with TRACE.span("restore", "entry", file=oname):
+                    cache.restore(cfile, os.path.join(prefix, oname))
+                res[job] = (oname, owidth, oheight)
+                continue
+        pending.append(job)
+    timings: dict[ResizeJob, Timing] = {}
+    if parallel > 1 and len(pending) > 1:
+        with ProcessPoolExecutor(max_workers=parallel) as pool:
+            futures = {
+                job: pool.submit(timed_resize_job, prefix, job, sizes[job])
+                for job in pending
+            }
+            for job, future in futures.items():
+                res[job], timings[job] = future.result()
+    else:
+        for job in pending:
+            res[job], timings[job] = timed_resize_job(
+                prefix, job, sizes[job])
+    for job, timing in timings.items():
+        TRACE.add_span("resize", "entry", timing, {"file": res[job][0]})
+    if cache is not None:
+        for job in pending:
+            oname, owidth, oheight = res[job]
+            cache.put(keys[job], os.path.join(prefix, oname), owidth, oheight)
+    if manifest is not None:
+        for job, key in keys.items():
+            oname, owidth, oheight = res[job]
+            manifest.record(oname, key, {"width": owidth, "height": oheight})
+    for job, first in aliases.items():
+        res[job] = res[first]
+    return res
+
+
+def resize_img(
+        prefix: str,
+        image: str,
+        width: int | None,
+        height: int | None,
+        *,
+        nostretch: bool = True,
+        noupscale: bool = False,
+        fmt: ImageFormat = "png",
+        record_size: Callable[[int, int], None] | None = None,
+        cache: ImageCache | None = None) -> str:
+    job = (image, width, height, nostretch, noupscale, fmt)
+    oname, owidth, oheight = resize_images(
+        prefix, [job], parallel=1, cache=cache)[job]
+    if record_size is not None:
+        record_size(owidth, oheight)
     return oname
 
 
+@functools.cache
+def get_generator_hash() -> str:
+    return get_file_hash(__file__)
+
+
+PAGE_TEMPLATE = "page.tmpl"
+TIMELINE_FILE = "material/timeline.json"
+SEARCH_FILE = "material/search.json"
+PAGE_FIELDS = {
+    "abstract",
+    "authors",
+    "bibtex",
+    "canonical",
+    "conference",
+    "copyright",
+    "description",
+    "image",
+    "links",
+    "logo",
+    "ogdescription",
+    "ogimg",
+    "ogimgheight",
+    "ogimgwidth",
+    "ogtitle",
+    "talk",
+    "title",
+    "tracking",
+    "video",
+}
+INDEX_FIELDS = {
+    "content",
+    "copyright",
+    "description",
+    "description_add",
+    "description_long",
+    "knowledge",
+    "name",
+    "ogimg",
+    "ogimgheight",
+    "ogimgwidth",
+    "tracking",
+    *HEADER_JOBS,
+}
+
+
 def create_autopage(
-        content: str, doc: Entry, ofile: str, dry_run: bool) -> None:
+        page_tmpl: Template,
+        doc: Entry,
+        ofile: str,
+        *,
+        teaser: str) -> str:
     abstract = (
         "<h4>Abstract</h4><p style=\"text-align: justify;\">"
         f"{NL.join(doc['abstract'])}</p>" if chk(doc, "abstract") else "")
@@ -370,12 +1226,10 @@ def create_autopage(
     image = f"""
     <div class="row">
         <div class="col-md-9">
-            <img alt="{
-        doc['teaser_desc'] if chk(doc, 'teaser_desc') else doc['teaser']
-        }" src="{doc['teaser']}" style="margin: 0 5%; width: 90%;">
+            {teaser}
         </div>
     </div>
-    """ if chk(doc, "teaser") else ""
+    """ if teaser else ""
     if chk(doc, "video"):
         m = re.match("^https?://vimeo.com/(\\d+)$", doc['video'])
         if m is not None:
@@ -429,35 +1283,36 @@ def create_autopage(
     keywords = []
     if "keywords" in doc:
         keywords.extend(doc["keywords"])
-    output = content.format(
-        title=doc["title"],
-        conference=doc["conference"],
-        authors=doc["authors"],
-        image=image,
-        abstract=abstract,
-        links=(
+    values: dict[str, TemplateValue] = {
+        "title": doc["title"],
+        "conference": doc["conference"],
+        "authors": doc["authors"],
+        "image": image,
+        "abstract": abstract,
+        "links": (
             f"<h3 style=\"text-align: center;\">{' '.join(links)}</h3>"
             if links else ""),
-        bibtex=bibtex,
-        logo=doc['logo'] if chk(doc, 'logo') else "img/nologo.png",
-        video=video,
-        talk=talk,
-        tracking=GA_TRACKING,
-        description=(
+        "bibtex": bibtex,
+        "logo": doc['logo'] if chk(doc, 'logo') else "img/nologo.png",
+        "video": video,
+        "talk": talk,
+        "tracking": GA_TRACKING,
+        "description": (
             f"{doc['title']} by {doc['authors']} "
             f"appears in {doc['conference']}"),
-        copyright=COPYRIGHT,
-        canonical=os.path.basename(ofile),
-        ogtitle=doc.get("ogtitle", doc["title"]),
-        ogdescription=doc.get(
+        "copyright": COPYRIGHT,
+        "canonical": os.path.basename(ofile),
+        "ogtitle": doc.get("ogtitle", doc["title"]),
+        "ogdescription": doc.get(
             "ogdescription",
             f"by {doc['authors']} appears in {doc['conference']}"),
-        ogimg=doc["ogimg"],
-        ogimgwidth=doc["ogimgwidth"],
-        ogimgheight=doc["ogimgheight"])
-    if not dry_run:
-        with open(ofile, "w", encoding="utf-8") as fout:
-            fout.write(output)
+        "ogimg": doc["ogimg"],
+        "ogimgwidth": f"{doc['ogimgwidth']}",
+        "ogimgheight": f"{doc['ogimgheight']}",
+    }
+    out = io.StringIO()
+    page_tmpl.render(out, values)
+    return out.getvalue()
 
 
 def add_misc_links(
@@ -483,14 +1338,38 @@ def add_misc_links(
 
 
 def create_media(
-        prefix: str,
         types: list[Group],
         group_order: list[str],
         group_by: Callable[[Entry], str],
         docs: list[Entry],
         *,
         event_types: list[Group],
-        dry_run: bool) -> str:
+        images: dict[ResizeJob, ResizeResult],
+        dry_run: bool,
+        out: IO[str],
+        page_tmpl: Template,
+        writer: OutputWriter,
+        manifest: Manifest | None = None) -> None:
+
+    def emit(path: str, deps: str, render: Callable[[], str]) -> None:
+        if dry_run:
+            return
+        if manifest is not None and manifest.is_fresh(path, deps):
+            return
+        with TRACE.span("render", "entry", file=path):
+            content = render()
+        writer.write(
+            path,
+            content,
+            None if manifest is None else functools.partial(
+                manifest.record, path, deps))
+
+    if not dry_run:
+        out_dirs = [TIMELINE_FILE, SEARCH_FILE]
+        if any(chk(doc, "bibtex") for doc in docs):
+            out_dirs.append("bibtex/")
+        out_dirs.extend(doc["href"] for doc in docs if has_autopage(doc))
+        writer.makedirs(out_dirs)
     type_lookup: dict[str, Group] = {}
     for kind in types:
         type_lookup[kind["type"]] = kind
@@ -505,20 +1384,19 @@ def create_media(
         etype_order[kind["type"]] = len(event_types) - ix
     event_times: dict[str, Set[str]] = {}
     events: list[Event] = []
-    content = ""
+    search_entries: list[SearchEntry] = []
     auto_pages: list[Entry] = []
     for kind in types:
         if not kind["docs"]:
             continue
         fadeout = " fadeout" if kind["type"] == FADEOUT else ""
-        content += (
+        out.write(
             "<h3 class=\"group_header\" "
             f"id=\"{kind['type']}\">{kind['name']}</h3>"
             f"<div class=\"gdiv_{kind['type']}{fadeout}\">")
 
         def skey(t: Entry) -> tuple[int, int, int, int, str]:
-            tyear, tmonth, tday = datetuple(tparse(normdate(t["date"])))
-            print(t, tyear, tmonth, tday)
+            tyear, tmonth, tday = t["date-info"]["tuple"]
             return (
                 tyear,
                 tmonth,
@@ -527,38 +1405,23 @@ def create_media(
                 t["title"],
             )
 
-        def set_og(doc: Entry) -> Callable[[int, int], None]:
-
-            def inner(owidth: int, oheight: int) -> None:
-                doc["ogimgwidth"] = owidth
-                doc["ogimgheight"] = oheight
-
-            return inner
-
-        kind["docs"].sort(key=skey, reverse=True)
+        with TRACE.span("sort", "entry", group=kind["type"]):
+            kind["docs"].sort(key=skey, reverse=True)
         for doc in kind["docs"]:
+            start = now()
             id_str = (
                 f"{kind['name']}_{doc['title']}_"
-                f"{mktime(tparse(doc['date']))}")
-            print(f"hashing: {id_str}")
+                f"{doc['date-info']['epoch']}")
+            TRACE.log(f"hashing: {id_str}")
             hash_id = zlib.crc32(id_str.encode("utf-8")) & 0xffffffff
             entry_id = f"entry{hash_id:08x}"
             appendix = []
             if "href" in doc and doc["href"]:
                 if chk(doc, "autopage"):
-                    if chk(doc, "logo") and doc["logo"] != "img/nologo.png":
-                        ogimg = doc["logo"]
-                    elif chk(doc, "teaser"):
-                        ogimg = doc["teaser"]
-                    else:
-                        ogimg = "img/photo.jpg"
-                    doc["ogimg"] = resize_img(
-                        prefix,
-                        ogimg,
-                        None,
-                        630,
-                        noupscale=True,
-                        record_size=set_og(doc))
+                    ogimg, ogwidth, ogheight = images[ogimg_job(doc)]
+                    doc["ogimg"] = ogimg
+                    doc["ogimgwidth"] = ogwidth
+                    doc["ogimgheight"] = ogheight
                     auto_pages.append(doc)
                 appendix.append(
                     f"<a href=\"{doc['href']}\">[page]</a>")
@@ -566,12 +1429,10 @@ def create_media(
             if chk(doc, "bibtex"):
                 bibtex = (NL.join(doc["bibtex"])).strip()
                 bibtex_link = f"bibtex/{entry_id}.bib"
-                bibtex_filename = os.path.join(prefix, bibtex_link)
-                if not dry_run:
-                    if not os.path.exists(os.path.dirname(bibtex_filename)):
-                        os.makedirs(os.path.dirname(bibtex_filename))
-                    with open(bibtex_filename, "w", encoding="utf-8") as f:
-                        print(bibtex, file=f)
+                emit(
+                    bibtex_link,
+                    get_deps_key(bibtex),
+                    functools.partial(with_newline, bibtex))
                 appendix.append(
                     f"<a href=\"{bibtex_link}\" rel=\"nofollow\">[bibtex]</a>")
             authors = doc["authors"].replace(
@@ -613,39 +1474,30 @@ def create_media(
             </h4>
             <em>{doc['conference']} &mdash; {pub}</em>{appx}{awds}
             """
-            lsrc = (
-                resize_img(prefix, doc["logo"], 128, None)
-                if chk(doc, "logo")
-                else "img/nologo.png")
-            sttl = (
-                doc["short-title"]
-                if chk(doc, "short-title")
-                else doc["title"])
+            logo = logo_picture(images, doc)
             entry = f"""
             <a class="pull-left" href="#{entry_id}">
-              <img
-                class="media-object"
-                src="{lsrc}"
-                title="{doc['title']}"
-                alt="{sttl}"
-                style="width: 64px; height: 64px;">
+              {logo}
             </a>
             <div class="media-body">
               {body}
             </div>
             """
-            content += f"""
+            out.write(f"""
             <div class="media type_{doc['type']} mg_{kind['type']}">
               <div class="smt_anchor" id="{entry_id}"></div>
               {entry}
             </div>
-            """
+            """)
+            TRACE.add_span("render", "entry", since(start), {"id": entry_id})
+            search_entries.append(
+                (entry_id, doc, f"{doc['conference']} &mdash; {pub}"))
             otid = (
                 doc["short-conference"]
                 if chk(doc, "short-conference")
                 else doc["conference"])
             tid = otid
-            mtime = monthtime(tparse(doc["date"]))
+            mtime = doc["date-info"]["month"]
             if mtime not in event_times:
                 event_times[mtime] = set()
             num = 1
@@ -658,67 +1510,94 @@ def create_media(
                 "id": tid,
                 "group": doc["type"],
                 "name": doc["title"],
-                "time": mktime(tparse(doc["date"])),
+                "time": doc["date-info"]["epoch"],
                 "link": f"#{entry_id}",
             }
-            end_date = doc.get("end-date")
-            if end_date is not None:
-                if end_date == ONGOING:
+            if "end-date-info" in doc:
+                end_info = doc["end-date-info"]
+                if end_info is None:
                     event["endTime"] = -1
                 else:
-                    event["endTime"] = mktime(tparse(end_date))
+                    event["endTime"] = end_info["epoch"]
             events.append(event)
 
-        content += "</div>"
-    if not dry_run:
-        timeline_fn = os.path.join(prefix, "material/timeline.json")
-        if not os.path.exists(os.path.dirname(timeline_fn)):
-            os.makedirs(os.path.dirname(timeline_fn))
-        with open(timeline_fn, "w", encoding="utf-8") as tlout:
-            type_names = {}
-            for kind in event_types:
-                type_names[kind["type"]] = kind["name"]
-            print(json.dumps({
-                "events": events,
-                "type_names": type_names,
-                "type_order": group_order,
-            }, sort_keys=True, indent=2), file=tlout)
-    if auto_pages:
-        with open("page.tmpl", "r", encoding="utf-8") as tfin:
-            page_tmpl = tfin.read()
-        for doc in auto_pages:
-            create_autopage(
-                page_tmpl, doc, os.path.join(prefix, doc["href"]), dry_run)
-    return content
+        out.write("</div>")
+    type_names = {}
+    for kind in event_types:
+        type_names[kind["type"]] = kind["name"]
+    timeline = json.dumps(
+        encode_timeline(events, type_names, group_order),
+        sort_keys=True,
+        separators=(",", ":"))
+    emit(
+        TIMELINE_FILE,
+        get_deps_key(timeline),
+        functools.partial(with_newline, timeline))
+    with TRACE.span("index", "entry", file=SEARCH_FILE):
+        search = json.dumps(
+            encode_search(search_entries),
+            sort_keys=True,
+            separators=(",", ":"))
+    emit(
+        SEARCH_FILE,
+        get_deps_key(search),
+        functools.partial(with_newline, search))
+    generator = get_generator_hash()
+    for doc in auto_pages:
+        teaser = teaser_picture(
+            images,
+            doc["teaser"],
+            f"alt=\"{doc.get('teaser_desc') or doc['teaser']}\" "
+            "style=\"margin: 0 5%; width: 90%; height: auto;\"",
+        ) if chk(doc, "teaser") else ""
+        emit(
+            doc["href"],
+            get_deps_key(generator, page_tmpl.get_hash(), doc, teaser),
+            functools.partial(
+                create_autopage,
+                page_tmpl,
+                doc,
+                doc["href"],
+                teaser=teaser))
 
 
 def apply_template(
         tmpl: str,
         docs: str,
         prefix: str,
+        out: IO[str],
+        writer: OutputWriter,
         *,
         is_ordered_by_type: bool,
-        dry_run: bool) -> str:
-    resize_img(prefix, "img/mediumlogo.png", None, 64)
-    resize_img(prefix, "img/scholarlogo.png", None, 64)
-    resize_img(prefix, "img/linkedinlogo.png", None, 64)
-    resize_img(prefix, "img/researchgatelogo.png", None, 64)
-    resize_img(prefix, "img/github-mark.png", None, 64)
-    resize_img(prefix, "img/photo.jpg", None, 128)
-    ogimg = resize_img(prefix, "img/photo.jpg", None, 630)
-    with open(tmpl, "r", encoding="utf-8") as tfin:
-        content = tfin.read()
-    with open(docs, "r", encoding="utf-8") as dfin:
-        data = dfin.read()
-
-        def sanitize(m: re.Match) -> str:
-            return m.group(0).replace("\n", "\\n")
-
-        data = re.sub(
-            r'''"([^"]|\\\\")*":\s*"([^"]|\\\\")*"''', sanitize, data)
-        dobj = json.loads(data)
-        all_groups = [parse_group(tobj) for tobj in dobj["types"]]
-        all_docs = [parse_entry(doc) for doc in dobj["documents"]]
+        dry_run: bool,
+        parallel: int = 1,
+        cache: ImageCache | None = None,
+        page_template: str = PAGE_TEMPLATE,
+        manifest: Manifest | None = None,
+        dims: DimensionCache | None = None,
+        hash_cache: HashCache | None = None,
+        cache_dir: str | None = None) -> None:
+    with TRACE.span("load"):
+        index_tmpl = load_template(tmpl, INDEX_FIELDS, cache_dir)
+        page_tmpl = load_template(page_template, PAGE_FIELDS, cache_dir)
+    all_groups: list[Group] = []
+    all_docs: list[Entry] = []
+    with TRACE.span("parse"), open(docs, "r", encoding="utf-8") as dfin:
+        for (key, obj) in iter_content(dfin):
+            if key == "types":
+                all_groups.append(parse_group(obj))
+            elif key == "documents":
+                all_docs.append(parse_entry(obj))
+    with TRACE.span("resize"):
+        images = resize_images(
+            prefix,
+            get_resize_jobs(all_docs),
+            parallel=parallel,
+            cache=cache,
+            manifest=manifest,
+            dims=dims,
+            hash_cache=hash_cache)
+    ogimg, ogwidth, ogheight = images[OGIMG_JOB]
 
     def get_type(doc: Entry) -> str:
         return doc["type"]
@@ -726,7 +1605,7 @@ def apply_template(
     def get_date(doc: Entry) -> str:
         if doc["type"] == FADEOUT:
             return "employment"
-        return f"{year(tparse(doc['date']))}"
+        return f"{doc['date-info']['year']}"
 
     if is_ordered_by_type:
         type_order = all_groups
@@ -763,24 +1642,39 @@ def apply_template(
         group["type"]
         for group in all_groups
     ]
-    media = create_media(
-        prefix,
-        type_order,
-        group_order,
-        group_by,
-        all_docs,
-        event_types=all_groups,
-        dry_run=dry_run)
-    return content.format(
-        name="Josua Krause (Joschi)",
-        description=DESCRIPTION_SHORT,
-        description_long=DESCRIPTION,
-        description_add=DESCRIPTION_ADD,
-        content=media,
-        tracking=GA_TRACKING,
-        knowledge=LD_JSON_KNOWLEDGE,
-        copyright=COPYRIGHT,
-        ogimg=ogimg)
+
+    def media(mout: IO[str]) -> None:
+        create_media(
+            type_order,
+            group_order,
+            group_by,
+            all_docs,
+            event_types=all_groups,
+            images=images,
+            dry_run=dry_run,
+            out=mout,
+            page_tmpl=page_tmpl,
+            writer=writer,
+            manifest=manifest)
+
+    with TRACE.span("render"):
+        index_tmpl.render(out, {
+            "name": "Josua Krause (Joschi)",
+            "description": DESCRIPTION_SHORT,
+            "description_long": DESCRIPTION,
+            "description_add": DESCRIPTION_ADD,
+            "content": media,
+            "tracking": GA_TRACKING,
+            "knowledge": LD_JSON_KNOWLEDGE,
+            "copyright": COPYRIGHT,
+            "ogimg": ogimg,
+            "ogimgwidth": f"{ogwidth}",
+            "ogimgheight": f"{ogheight}",
+            **{
+                field: density_picture(images, job, HEADER_ATTRS[field])
+                for (field, job) in HEADER_JOBS.items()
+            },
+        })
 
 
 def parse_args() -> argparse.Namespace:
@@ -809,29 +1703,118 @@ def parse_args() -> argparse.Namespace:
         "--dry",
         action="store_true",
         help="do not produce any output")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of parallel processes for image processing")
+    parser.add_argument(
+        "--write-jobs",
+        type=int,
+        default=8,
+        help="number of parallel threads for writing output files")
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=CACHE_DIR,
+        help="specifies the build cache folder")
+    parser.add_argument(
+        "--cache-limit",
+        type=int,
+        default=256,
+        help="maximum size of cached images in MiB")
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="do not cache resized images")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help=(
+            "only regenerate outputs whose inputs changed since the last "
+            "build into the same prefix"))
+    parser.add_argument(
+        "--profile",
+        type=str,
+        default=None,
+        help="write a chrome trace of the build timings to this file")
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="do not print progress for every entry")
     return parser.parse_args()
 
 
 def run() -> None:
     args = parse_args()
+    TRACE.set_quiet(args.quiet)
+    if args.profile is not None:
+        TRACE.enable()
     tmpl = args.template
     docs = args.documents
     prefix = args.prefix
     out = args.out
     dry_run = args.dry
-    content = apply_template(
-        tmpl,
-        docs,
-        prefix,
-        is_ordered_by_type=False,
-        dry_run=dry_run)
+    cache = None
+    dims = None
+    hash_cache = None
+    if not args.no_cache:
+        cache = ImageCache(args.cache_dir, args.cache_limit * MEBIBYTE)
+        dims = DimensionCache(args.cache_dir)
+        hash_cache = HashCache(args.cache_dir)
+    writer = OutputWriter(prefix, workers=args.write_jobs)
+    manifest = None
     if not dry_run:
-        if out != "-":
+        manifest = Manifest(
+            args.cache_dir, prefix, incremental=args.incremental)
+
+    def write(outf: IO[str]) -> None:
+        apply_template(
+            tmpl,
+            docs,
+            prefix,
+            outf,
+            writer,
+            is_ordered_by_type=False,
+            dry_run=dry_run,
+            parallel=args.jobs,
+            cache=cache,
+            manifest=manifest,
+            dims=dims,
+            hash_cache=hash_cache,
+            cache_dir=args.cache_dir)
+        with TRACE.span("write"):
+            writer.finish()
+
+    if dry_run:
+        with open(os.devnull, "w", encoding="utf-8") as outf:
+            write(outf)
+    elif out != "-":
+        good = False
+        try:
             with open(out, "w", encoding="utf-8") as outf:
-                outf.write(content)
-        else:
-            sys.stdout.write(content)
-            sys.stdout.flush()
+                write(outf)
+            good = True
+        finally:
+            if not good:
+                try:
+                    os.remove(out)
+                except FileNotFoundError:
+                    pass
+    else:
+        write(sys.stdout)
+        sys.stdout.flush()
+    if cache is not None:
+        cache.save()
+    if dims is not None:
+        dims.save()
+    if hash_cache is not None:
+        hash_cache.save()
+    if manifest is not None:
+        for stale in manifest.finish():
+            TRACE.log(f"removed stale output: {stale}")
+    if args.profile is not None:
+        TRACE.save(args.profile)
 
 
 if __name__ == "__main__":
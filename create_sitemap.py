@@ -13,25 +13,36 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
-import hashlib
+import argparse
+import glob
+import gzip
+import io
 import os
 import sys
 import time
 import xml.etree.ElementTree as ET
-from collections.abc import Callable, Iterable
+from collections.abc import Callable
+from concurrent.futures import Future
 from datetime import datetime
 from email.utils import parsedate_to_datetime
-from io import BytesIO
-from typing import IO, TypedDict
+from typing import cast, IO
+from urllib.parse import urlsplit
 
 import pytz
 import requests
 
+from buildcache import CACHE_DIR, hash_files, HashCache, MEBIBYTE
+from buildtrace import TRACE
+from filerules import FileRules, walk_files
+from probe import Prober, ValidatorCache, ValidatorEntry
+
 
 TZ = pytz.timezone("US/Eastern")
 
 
 SITEMAP_INTERNAL = "filetimes.xml"
+SITEMAP_RULES = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "sitemap_rules.json")
 
 
 SITEMAP_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
@@ -54,128 +65,264 @@ SITEMAP_HEADER_INTERNAL = """<?xml version="1.0" encoding="UTF-8"?>
 
 
 ENTRY_TEMPLATE = """  <url>
-    <loc>{base}{path}</loc>
+    <loc>{url}</loc>
     <lastmod>{mod}</lastmod>
   </url>
 """
 
 
 ENTRY_TEMPLATE_INTERNAL = """  <url>
-    <loc>{base}{path}</loc>
+    <loc>{url}</loc>
     <lastmod>{mod}</lastmod>
     <joschi:filehash>{fhash}</joschi:filehash>
   </url>
 """
 
 
-FileCache = TypedDict('FileCache', {
-    "lastmod": str,
-    "filehash": str,
-})
+SITEMAP_FOOTER = "</urlset>\n"
+
+
+SITEMAP_INDEX_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+"""
+
+
+SITEMAP_INDEX_TEMPLATE = """  <sitemap>
+    <loc>{url}</loc>
+    <lastmod>{mod}</lastmod>
+  </sitemap>
+"""
 
 
-CACHED_FILE_LOOKUP: dict[str, FileCache] = {
+# NOTE: the protocol limits a sitemap to 50,000 urls and 50MB uncompressed
+SITEMAP_MAX_URLS = 50000
+SITEMAP_MAX_SIZE = 50 * MEBIBYTE
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+# time, url, lastmod, filehash
+SitemapRecord = tuple[float, str, str, str]
+
+
+# NOTE: used if a page cannot be accessed and has no stored validators
+SEED_VALIDATORS: dict[str, ValidatorEntry] = {
     "https://medium.josuakrause.com/": {
-        "lastmod": "2023-12-19T17:31:09.104979-05:00",
-        "filehash":
+        "etag": None,
+        "modified": "Tue, 19 Dec 2023 22:31:09 GMT",
+        "hash":
             "d968bcd4f808dbb9c629de59455c9016f17901dc80614a0971da011e00a99e03",
     },
 }
 
 
-def get_hash(content: bytes) -> str:
-    blake = hashlib.blake2b(digest_size=32)
-    blake.update(content)
-    return blake.hexdigest()
+REMOTE_PAGES: list[tuple[str, str, str]] = [
+    ("mdsjs", "/", ""),
+    ("medium", "/", ""),
+    ("bubblesets-js", "/", ""),
+    ("searchspace", "/", ""),
+    ("searchspace", "/", "demo0.html"),
+    ("searchspace", "/", "demo1.html"),
+    ("searchspace", "/", "demo2.html"),
+    ("jk-js", "/", ""),
+]
+
+
+Filetimes = dict[str, tuple[str, str | None]]
+
+
+def open_xml(buff: io.BufferedReader) -> IO[bytes]:
+    # NOTE: shards are gzip compressed regardless of the transfer encoding
+    if buff.peek(2)[:2] == GZIP_MAGIC:
+        return cast(IO[bytes], gzip.GzipFile(fileobj=buff, mode="rb"))
+    return cast(IO[bytes], buff)
+
+
+def read_filetimes(fin: IO[bytes], res: Filetimes) -> list[str]:
+    # NOTE: entries are freed right after reading them so memory does not
+    # grow with the size of the file. returns the shards if the file is a
+    # sitemap index
+    shards: list[str] = []
+    # NOTE: many entries share the same modification time
+    times: dict[str, str] = {}
+    root = None
+    buff = io.BufferedReader(cast(io.RawIOBase, fin))
+    with buff, open_xml(buff) as xml_in:
+        for (event, elem) in ET.iterparse(xml_in, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                continue
+            tag = elem.tag.rsplit("}", 1)[-1]
+            if tag not in ("url", "sitemap"):
+                continue
+            fname = None
+            ftime = None
+            fhash = None
+            for el in elem:
+                if el.tag.endswith("loc"):
+                    fname = el.text
+                elif el.tag.endswith("lastmod"):
+                    ftime = el.text
+                elif el.tag.endswith("filehash"):
+                    fhash = el.text
+            elem.clear()
+            if root is not None:
+                root.clear()
+            if tag == "sitemap":
+                if fname is not None:
+                    shards.append(fname)
+                continue
+            if fname is None or ftime is None:
+                print(
+                    "WARNING: incomplete entry "
+                    f"loc={fname} lastmod={ftime}", file=sys.stderr)
+                continue
+            if ".josuakrause.com/" not in fname:
+                print(
+                    "WARNING: invalid entry "
+                    f"loc={fname} lastmod={ftime}", file=sys.stderr)
+                continue
+            res[fname] = (times.setdefault(ftime, ftime), fhash)
+    return shards
+
+
+def load_previous_filetimes(fname: str) -> Filetimes:
+    res: Filetimes = {}
+    try:
+        with open(fname, "rb") as fin:
+            shards = read_filetimes(fin, res)
+        for shard in shards:
+            # NOTE: shards are expected next to their index
+            shard_name = os.path.join(
+                os.path.dirname(fname),
+                os.path.basename(urlsplit(shard).path))
+            with open(shard_name, "rb") as fin:
+                read_filetimes(fin, res)
+    except FileNotFoundError as exc:
+        print(
+            f"WARNING: no previous filetimes at {exc.filename}",
+            file=sys.stderr)
+        return {}
+    except ET.ParseError as exc:
+        print(
+            f"WARNING: ignoring malformed previous filetimes: {exc}",
+            file=sys.stderr)
+        return {}
+    return res
 
 
 def get_previous_filetimes(
         domain: Callable[[str], str],
-        root: str) -> dict[str, tuple[str, str | None]]:
-    url = f"{domain('')}{root}{SITEMAP_INTERNAL}"
-    req = requests.get(url, timeout=10, allow_redirects=True)
-    if req.status_code != 200:
-        return {}
-    tree = ET.parse(BytesIO(req.content))
-    res: dict[str, tuple[str, str | None]] = {}
-    for entry in tree.getroot():
-        fname = None
-        ftime = None
-        fhash = None
-        for el in entry:
-            if el.tag.endswith("loc"):
-                fname = el.text
-            elif el.tag.endswith("lastmod"):
-                ftime = el.text
-            elif el.tag.endswith("filehash"):
-                fhash = el.text
-        if fname is None or ftime is None:
-            print(
-                "WARNING: incomplete entry "
-                f"loc={fname} lastmod={ftime}", file=sys.stderr)
-            continue
-        if ".josuakrause.com/" not in fname:
-            print(
-                "WARNING: invalid entry "
-                f"loc={fname} lastmod={ftime}", file=sys.stderr)
+        root: str,
+        prober: Prober,
+        names: list[str]) -> Filetimes:
+    res: Filetimes = {}
+
+    def read_url(url: str) -> list[str] | None:
+        with prober.request("GET", url, stream=True) as req:
+            if req.status_code != 200:
+                return None
+            req.raw.decode_content = True
+            return read_filetimes(cast(IO[bytes], req.raw), res)
+
+    for name in names:
+        shards = read_url(f"{domain('')}{root}{name}")
+        if shards is None:
             continue
-        res[fname] = (ftime, fhash)
+        for shard in shards:
+            if read_url(shard) is None:
+                print(
+                    f"WARNING: could not access {shard}", file=sys.stderr)
+                return {}
+        return res
+    return {}
+
+
+def get_local_files(
+        base_dir: str, rules: FileRules) -> list[tuple[str, str, str]]:
+    res: list[tuple[str, str, str]] = []
+    for entry in walk_files(base_dir, rules, include_dirs=True):
+        fname = os.path.relpath(entry.path, base_dir).replace(os.sep, "/")
+        check_file = entry.path
+        if entry.is_dir():
+            # NOTE: folders are only pages if they have an index. they are
+            # listed without a trailing slash
+            check_file = os.path.join(entry.path, "index.html")
+            try:
+                mtime = os.stat(check_file).st_mtime
+            except FileNotFoundError:
+                continue
+        else:
+            mtime = entry.stat().st_mtime
+        dtime = datetime.fromtimestamp(mtime, tz=TZ)
+        dtime = dtime.replace(microsecond=0)
+        res.append((fname, dtime.isoformat(), check_file))
+    res.sort()
     return res
 
 
-def has_private_folder(filename: str) -> bool:
-    fname = os.path.basename(filename)
-    if fname.startswith(".") and fname != ".":
-        return True
-    rec = os.path.dirname(filename)
-    if not rec:
-        return False
-    return has_private_folder(rec)
-
-
 def create_sitemap(
         domain: Callable[[str], str],
         root: str,
-        out: IO[str],
-        internal_out: IO[str],
-        lines: Iterable[str]) -> None:
-    out.write(SITEMAP_HEADER)
-    out.flush()
-    internal_out.write(SITEMAP_HEADER_INTERNAL)
-    internal_out.flush()
-    prev_times = get_previous_filetimes(domain, root)
-    entries: list[tuple[datetime, Callable[[], None]]] = []
-
-    def get_online_hash(subdomain: str, path: str, fname: str) -> str:
+        local_files: list[tuple[str, str, str]],
+        *,
+        base_dir: str = ".",
+        prober: Prober,
+        hash_cache: HashCache | None = None,
+        validators: ValidatorCache | None = None,
+        prev_times: Filetimes | None = None,
+        prev_names: list[str] | None = None,
+        jobs: int = 1) -> list[SitemapRecord]:
+    vcache = (
+        ValidatorCache(None, seed=SEED_VALIDATORS)
+        if validators is None
+        else validators)
+    # NOTE: remote pages are probed concurrently while local files are hashed
+    pending: dict[str, Future[requests.Response]] = {}
+    for (subdomain, path, fname) in REMOTE_PAGES:
         url = f"{domain(subdomain)}{path}{fname}"
-        cache = CACHED_FILE_LOOKUP.get(url)
-        if cache is not None:
-            return cache["filehash"]
-        print(f"hash from url: {url}")
-        res = requests.get(url, timeout=10, allow_redirects=True)
-        if res.status_code != 200:
-            raise ValueError(f"failed to access {url} with {res.status_code}")
-        return get_hash(res.content)
+        pending[url] = prober.submit(
+            "GET", url, headers=vcache.get_headers(url))
+    if prev_times is None:
+        with TRACE.span("parse"):
+            prev_times = get_previous_filetimes(
+                domain,
+                root,
+                prober,
+                [SITEMAP_INTERNAL] if prev_names is None else prev_names)
+    records: list[SitemapRecord] = []
+    file_hashes: dict[str, str] = {}
+
+    def get_online(url: str) -> ValidatorEntry | None:
+        TRACE.log(f"hash from url: {url}")
+        future = pending.pop(url, None)
+        try:
+            if future is None:
+                res = prober.request(
+                    "GET", url, headers=vcache.get_headers(url))
+            else:
+                res = future.result()
+        except requests.RequestException as exc:
+            print(f"WARNING: failed to access {url}: {exc}", file=sys.stderr)
+            return vcache.get(url)
+        entry = vcache.update(url, res)
+        if entry is None:
+            print(
+                f"WARNING: failed to access {url} with {res.status_code}",
+                file=sys.stderr)
+            return vcache.get(url)
+        if res.status_code == 304:
+            TRACE.log(f"not modified: {url}")
+        return entry
 
     def get_file_hash(check_file: str) -> str:
-        print(f"hash from file: {check_file}")
-        with open(f"{check_file}", "rb") as fin:
-            return get_hash(fin.read())
-
-    def get_online_mod(subdomain: str, path: str, fname: str) -> str | None:
-        url = f"{domain(subdomain)}{path}{fname}"
-        cache = CACHED_FILE_LOOKUP.get(url)
-        if cache is not None:
-            return cache["lastmod"]
-        res = requests.head(url, timeout=10, allow_redirects=True)
-        if res.status_code != 200:
-            return None
-        lmod = res.headers.get("last-modified")
-        if lmod is None:
-            return None
-        dout = parsedate_to_datetime(lmod)
-        dout = dout.astimezone(TZ)
-        return dout.isoformat()
+        TRACE.log(f"hash from file: {check_file}")
+        res = file_hashes.get(check_file)
+        if res is not None:
+            return res
+        if hash_cache is not None:
+            return hash_cache.get_file_hash(check_file)
+        return hash_files([check_file], workers=1)[0]
 
     def write_entry(
             subdomain: str,
@@ -183,143 +330,264 @@ def create_sitemap(
             fname: str,
             mod: str,
             *,
-            check_file: str | None = None,
-            check_online: bool = False) -> None:
-        print(f"processing: {domain(subdomain)}{path}{fname}")
-        if check_online:
-            online_mod = get_online_mod(subdomain, path, fname)
-            if online_mod is not None:
-                mod = online_mod
+            check_file: str | None = None) -> None:
+        url = f"{domain(subdomain)}{path}{fname}"
+        TRACE.log(f"processing: {url}")
+        old_mod, old_hash = prev_times.get(url, (None, None))
+        if check_file is None:
+            online = get_online(url)
+            if online is None:
+                if old_hash is None:
+                    raise ValueError(f"failed to access {url}")
+                print(
+                    f"WARNING: using previous entry for {url}",
+                    file=sys.stderr)
+                online = {
+                    "etag": None,
+                    "modified": None,
+                    "hash": old_hash,
+                }
+            if online["modified"] is not None:
+                dout = parsedate_to_datetime(online["modified"])
+                mod = dout.astimezone(TZ).isoformat()
             else:
                 print("WARNING: could not access url for mod time")
-        old_mod, old_hash = prev_times.get(
-            f"{domain(subdomain)}{path}{fname}", (None, None))
-        if check_file is None:
-            fhash = get_online_hash(subdomain, path, fname)
+            fhash = online["hash"]
         else:
             fhash = get_file_hash(check_file)
         if old_mod is not None and old_hash is not None:
             if old_hash == fhash:
                 mod = old_mod
             else:
-                print(f"file hash differs: new[{fhash}] != old[{old_hash}]")
+                TRACE.log(
+                    f"file hash differs: new[{fhash}] != old[{old_hash}]")
         if mod != old_mod:
-            print(f"file change detected: new[{mod}] != old[{old_mod}]")
-
-        def write_out() -> None:
-            out.write(ENTRY_TEMPLATE.format(
-                base=f"{domain(subdomain)}{path}", path=fname, mod=mod))
-            internal_out.write(ENTRY_TEMPLATE_INTERNAL.format(
-                base=f"{domain(subdomain)}{path}",
-                path=fname,
-                mod=mod,
-                fhash=fhash))
-
-        entries.append((datetime.fromisoformat(mod), write_out))
-
-    def process_line(subdomain: str, line: str) -> str | None:
-        filename = os.path.normpath(line.strip())
-        print(f"checking: {domain(subdomain)}{root}{filename}")
-        if has_private_folder(filename):
-            return None
-        fname = os.path.basename(filename)
-        if filename == ".":
-            return None
-        if fname.endswith(".js"):
-            return None
-        if fname.endswith(".css"):
-            return None
-        if fname.endswith(".json"):
-            return None
-        if fname.endswith(".zip"):
-            return None
-        if fname.endswith(".bib"):
-            return None
-        if fname.endswith(".key"):
-            return None
-        if fname.endswith(".png"):
-            return None
-        if fname.endswith(".jpg"):
-            return None
-        if fname.endswith(".jpeg"):
-            return None
-        if fname.endswith(".jar"):
-            return None
-        if fname.endswith(".md5"):
-            return None
-        if fname.endswith(".sha1"):
-            return None
-        if fname.endswith(".pom"):
-            return None
-        if fname.endswith(".xml"):
-            return None
-        if fname.endswith("index.html"):
-            return None
-        if fname.endswith("404.html"):
-            return None
-        if fname.endswith("sitemap.xml"):
-            return None
-        if fname.endswith("robots.txt"):
-            return None
-        if fname.endswith("LICENSE"):
-            return None
-        if os.path.isdir(filename) and not os.path.exists(
-                os.path.join(filename, "index.html")):
-            return None
-        dtime = datetime.fromtimestamp(os.path.getmtime(filename), tz=TZ)
-        dtime = dtime.replace(microsecond=0)
-        mtime = dtime.isoformat()
-        filename = filename.rstrip(".")
-        write_entry(subdomain, root, filename, mtime, check_file=filename)
-        return os.path.dirname(filename)
-
-    for line in sorted(set(lines)):
-        if not line.strip():
-            continue
-        if process_line("www", line) is None:
-            print(f"rejecting {line}")
-
-    curtime = datetime.fromtimestamp(time.time(), tz=TZ).isoformat()
-    # NOTE: duplicate, non-canonical, and redirect
-    # write_entry(root, "", curtime)
-    write_entry("www", "/", "", curtime, check_file="index.html")
-    write_entry("mdsjs", "/", "", curtime, check_online=True)
-    write_entry("medium", "/", "", curtime, check_online=True)
-    write_entry("bubblesets-js", "/", "", curtime, check_online=True)
-    write_entry("searchspace", "/", "", curtime, check_online=True)
-    write_entry("searchspace", "/", "demo0.html", curtime, check_online=True)
-    write_entry("searchspace", "/", "demo1.html", curtime, check_online=True)
-    write_entry("searchspace", "/", "demo2.html", curtime, check_online=True)
-    write_entry("jk-js", "/", "", curtime, check_online=True)
-
-    entries.sort(key=lambda elem: elem[0], reverse=True)
-    for _, entry_cb in entries:
-        entry_cb()
-    out.write("</urlset>\n")
+            TRACE.log(f"file change detected: new[{mod}] != old[{old_mod}]")
+        records.append(
+            (datetime.fromisoformat(mod).timestamp(), url, mod, fhash))
+
+    # NOTE: all local files are hashed up front to use all cores
+    index_file = os.path.join(base_dir, "index.html")
+    check_files = [check_file for (_, _, check_file) in local_files]
+    check_files.append(index_file)
+    with TRACE.span("hash"):
+        file_hashes.update(zip(
+            check_files,
+            hash_files(check_files, workers=jobs, cache=hash_cache)))
+    with TRACE.span("compare"):
+        for (filename, mtime, check_file) in local_files:
+            write_entry("www", root, filename, mtime, check_file=check_file)
+
+        curtime = datetime.fromtimestamp(time.time(), tz=TZ).isoformat()
+        # NOTE: duplicate, non-canonical, and redirect
+        # write_entry(root, "", curtime)
+        write_entry("www", "/", "", curtime, check_file=index_file)
+    with TRACE.span("probe"):
+        for (subdomain, path, fname) in REMOTE_PAGES:
+            write_entry(subdomain, path, fname, curtime)
+
+    with TRACE.span("sort"):
+        records.sort(key=lambda record: record[0], reverse=True)
+    return records
+
+
+def write_entries(
+        out: IO[str],
+        internal_out: IO[str],
+        records: list[SitemapRecord]) -> None:
+    out.write(SITEMAP_HEADER)
+    internal_out.write(SITEMAP_HEADER_INTERNAL)
+    for (_, url, mod, fhash) in records:
+        out.write(ENTRY_TEMPLATE.format(url=url, mod=mod))
+        internal_out.write(ENTRY_TEMPLATE_INTERNAL.format(
+            url=url, mod=mod, fhash=fhash))
+    out.write(SITEMAP_FOOTER)
     out.flush()
-    internal_out.write("</urlset>\n")
+    internal_out.write(SITEMAP_FOOTER)
     internal_out.flush()
 
 
-def usage() -> None:
-    print(f"""
-usage: {sys.argv[0]} [-h] <file> <internal>
--h: print help
-<file>: specifies the output file
-<internal>: specifies the internal output file
-""".strip(), file=sys.stderr)
-    sys.exit(1)
+def get_shard_names(fname: str) -> tuple[str, str]:
+    base, _ = os.path.splitext(fname)
+    return (f"{base}_index.xml", f"{base}-{{ix}}.xml.gz")
+
+
+def get_shard_files(fname: str) -> list[str]:
+    _, shard = get_shard_names(fname)
+    return sorted(glob.glob(
+        glob.escape(shard).replace(glob.escape("{ix}"), "*")))
+
+
+def remove_files(fnames: list[str]) -> None:
+    for fname in fnames:
+        try:
+            os.remove(fname)
+        except FileNotFoundError:
+            pass
+
+
+def update_robots(fname: str, sitemap_url: str) -> None:
+    # NOTE: points the sitemap line at the active sitemap. the file is
+    # replaced since it might be a hardlink to the source
+    try:
+        with open(fname, "r", encoding="utf-8") as fin:
+            lines = fin.read().splitlines()
+    except FileNotFoundError:
+        return
+    res = [
+        f"Sitemap: {sitemap_url}" if line.startswith("Sitemap:") else line
+        for line in lines
+    ]
+    if res == lines:
+        return
+    tmp = f"{fname}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fout:
+        fout.write("\n".join(res))
+        fout.write("\n")
+    os.replace(tmp, fname)
+
+
+def open_shard(fname: str) -> IO[str]:
+    # NOTE: mtime is fixed so unchanged shards stay byte identical
+    return io.TextIOWrapper(
+        cast(IO[bytes], gzip.GzipFile(
+            fname, "wb", compresslevel=9, mtime=0)),
+        encoding="utf-8")
+
+
+def write_shards(
+        output: str,
+        internal: str,
+        records: list[SitemapRecord],
+        *,
+        base_url: str,
+        shard_size: int) -> list[str]:
+    # NOTE: shards are cut by number of urls and by size. the sitemap index
+    # is written last. shards left over from earlier builds are removed
+    index_out, shard_out = get_shard_names(output)
+    index_int, shard_int = get_shard_names(internal)
+    shards: list[tuple[str, str, str]] = []
+    pos = 0
+    while pos < len(records):
+        ix = len(shards) + 1
+        fout = shard_out.format(ix=ix)
+        fint = shard_int.format(ix=ix)
+        # NOTE: the limit is in bytes and includes the closing tag. the
+        # internal shard is the larger one
+        size = len(
+            f"{SITEMAP_HEADER_INTERNAL}{SITEMAP_FOOTER}".encode("utf-8"))
+        end = pos
+        with open_shard(fout) as out, open_shard(fint) as internal_out:
+            out.write(SITEMAP_HEADER)
+            internal_out.write(SITEMAP_HEADER_INTERNAL)
+            while end < len(records) and end - pos < shard_size:
+                (_, url, mod, fhash) = records[end]
+                entry = ENTRY_TEMPLATE_INTERNAL.format(
+                    url=url, mod=mod, fhash=fhash)
+                entry_size = len(entry.encode("utf-8"))
+                if end > pos and size + entry_size > SITEMAP_MAX_SIZE:
+                    break
+                size += entry_size
+                out.write(ENTRY_TEMPLATE.format(url=url, mod=mod))
+                internal_out.write(entry)
+                end += 1
+            out.write(SITEMAP_FOOTER)
+            internal_out.write(SITEMAP_FOOTER)
+        # NOTE: records are sorted so the first one is the most recent
+        shards.append((fout, fint, records[pos][2]))
+        pos = end
+    for (index, pos) in [(index_out, 0), (index_int, 1)]:
+        with open(index, "w", encoding="utf-8") as fidx:
+            fidx.write(SITEMAP_INDEX_HEADER)
+            for shard in shards:
+                fidx.write(SITEMAP_INDEX_TEMPLATE.format(
+                    url=f"{base_url}{os.path.basename(shard[pos])}",
+                    mod=shard[2]))
+            fidx.write("</sitemapindex>\n")
+    written = {fname for shard in shards for fname in shard[:2]}
+    remove_files([
+        fname
+        for fname in get_shard_files(output) + get_shard_files(internal)
+        if fname not in written
+    ])
+    return [index_out, index_int]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog=f"python {os.path.basename(__file__)}",
+        description=(
+            "Create the sitemap for all files in the input folder"))
+    parser.add_argument(
+        "output",
+        type=str,
+        help="specifies the output file")
+    parser.add_argument(
+        "internal",
+        type=str,
+        help="specifies the internal output file")
+    parser.add_argument(
+        "--input",
+        type=str,
+        default=".",
+        help="specifies the folder containing the website")
+    parser.add_argument(
+        "--rules",
+        type=str,
+        default=SITEMAP_RULES,
+        help="specifies which files are excluded from the sitemap")
+    parser.add_argument(
+        "--previous",
+        type=str,
+        default=None,
+        help=(
+            "specifies the filetimes of the previous build. "
+            "default is to download them from the website"))
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=CACHE_DIR,
+        help="specifies the build cache folder")
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="do not cache file hashes and remote page validators")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of parallel threads for hashing files")
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=0,
+        help=(
+            "write gzip compressed shards of at most this many urls and a "
+            "sitemap index instead of single files. 0 writes single files"))
+    parser.add_argument(
+        "--profile",
+        type=str,
+        default=None,
+        help="write a chrome trace of the timings to this file")
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="do not print progress for every url")
+    return parser.parse_args()
 
 
 def run() -> None:
-    args = sys.argv[:]
-    args.pop(0)
-    if "-h" in args:
-        usage()
-    if len(args) != 2:
-        usage()
-    output = args[0]
-    internal = args[1]
+    args = parse_args()
+    TRACE.set_quiet(args.quiet)
+    if args.profile is not None:
+        TRACE.enable()
+    output = args.output
+    internal = args.internal
+    hash_cache = None
+    validators = ValidatorCache(None, seed=SEED_VALIDATORS)
+    if not args.no_cache:
+        hash_cache = HashCache(args.cache_dir)
+        validators = ValidatorCache(args.cache_dir, seed=SEED_VALIDATORS)
 
     def domain(subdomain: str) -> str:
         if not subdomain:
@@ -327,19 +595,76 @@ def run() -> None:
         return f"https://{subdomain}.josuakrause.com"
 
     root = "/"
+    # NOTE: the sitemap index and robots.txt refer to the same host
+    site_url = f"{domain('')}{root}"
+    base_dir = args.input
+    with TRACE.span("load"):
+        local_files = get_local_files(base_dir, FileRules.load(args.rules))
+    # NOTE: the previous file is read before it might get overwritten
+    prev_times = None
+    if args.previous is not None:
+        with TRACE.span("parse"):
+            prev_times = load_previous_filetimes(args.previous)
+    internal_names = [
+        os.path.basename(internal),
+        os.path.basename(get_shard_names(internal)[0]),
+    ]
+    if args.shard_size > 0:
+        internal_names.reverse()
+    prober = Prober()
+    try:
+        records = create_sitemap(
+            domain,
+            root,
+            local_files,
+            base_dir=base_dir,
+            prober=prober,
+            hash_cache=hash_cache,
+            validators=validators,
+            prev_times=prev_times,
+            prev_names=internal_names,
+            jobs=args.jobs)
+    finally:
+        prober.close()
+    if hash_cache is not None:
+        hash_cache.save()
+    validators.save()
+    outputs = [output, internal]
     good = False
     try:
-        with open(output, "w", encoding="utf-8") as f_out:
-            with open(internal, "w", encoding="utf-8") as f_int:
-                create_sitemap(
-                    domain, root, f_out, f_int, sys.stdin.readlines())
+        with TRACE.span("write"):
+            if args.shard_size > 0:
+                outputs = [
+                    get_shard_names(output)[0],
+                    get_shard_names(internal)[0],
+                ]
+                write_shards(
+                    output,
+                    internal,
+                    records,
+                    base_url=site_url,
+                    shard_size=min(args.shard_size, SITEMAP_MAX_URLS))
+                # NOTE: the single file sitemaps would be stale now
+                remove_files([output, internal])
+            else:
+                with open(output, "w", encoding="utf-8") as f_out:
+                    with open(internal, "w", encoding="utf-8") as f_int:
+                        write_entries(f_out, f_int, records)
+                remove_files([
+                    get_shard_names(output)[0],
+                    get_shard_names(internal)[0],
+                    *get_shard_files(output),
+                    *get_shard_files(internal),
+                ])
+            update_robots(
+                os.path.join(base_dir, "robots.txt"),
+                f"{site_url}{os.path.basename(outputs[0])}")
         good = True
     finally:
         if not good:
-            try:
-                os.remove(output)
-            except FileNotFoundError:
-                pass
+            remove_files(outputs)
+    if args.profile is not None:
+        TRACE.save(args.profile)
 
 
 if __name__ == "__main__":
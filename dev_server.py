@@ -0,0 +1,413 @@
+# Homepage of Josua Krause
+# Copyright (C) 2024  Josua Krause
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import argparse
+import mimetypes
+import os
+import posixpath
+import sys
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import cast, TypedDict
+from urllib.parse import unquote, urlsplit
+
+from buildcache import (
+    CACHE_DIR,
+    DimensionCache,
+    get_hash,
+    HashCache,
+    ImageCache,
+    Manifest,
+    MEBIBYTE,
+)
+from buildtrace import now, TRACE
+from create_page import apply_template
+from filerules import FileRules, walk_files
+from stage import stage_files, STAGE_RULES
+from writer import OutputWriter
+
+
+DEV_DIR = os.path.join(CACHE_DIR, "dev")
+# NOTE: changes to these inputs require rendering the pages again. all
+# other watched inputs only need to be staged
+PAGE_INPUTS = ["content.json", "index.tmpl", "page.tmpl", "img"]
+WATCHED = [*PAGE_INPUTS, "js"]
+LIVE_RELOAD_PATH = "/__livereload"
+LIVE_RELOAD_SCRIPT = (
+    "<script>new EventSource(\"" + LIVE_RELOAD_PATH + "\").onmessage = "
+    "() => window.location.reload();</script>").encode("utf-8")
+KEEP_ALIVE = 15.0
+
+
+StoreEntry = TypedDict('StoreEntry', {
+    "size": int,
+    "mtime": int,
+    "content": bytes,
+    "etag": str,
+    "type": str,
+})
+
+
+class MemoryStore:
+    # NOTE: keeps the content of served outputs in memory. entries are keyed
+    # by path and only read again after a rebuild changed the file
+    def __init__(self, prefix: str) -> None:
+        self._prefix = prefix
+        self._entries: dict[str, StoreEntry] = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> StoreEntry | None:
+        fname = os.path.join(self._prefix, path)
+        try:
+            stat = os.stat(fname)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        if not os.path.isfile(fname):
+            return None
+        with self._lock:
+            entry = self._entries.get(path)
+        if (
+                entry is not None
+                and entry["size"] == stat.st_size
+                and entry["mtime"] == stat.st_mtime_ns):
+            return entry
+        return self.load(path, stat)
+
+    def load(self, path: str, stat: os.stat_result) -> StoreEntry:
+        fname = os.path.join(self._prefix, path)
+        with open(fname, "rb") as fin:
+            content = fin.read()
+        ctype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if ctype == "text/html":
+            content = inject_live_reload(content)
+        entry: StoreEntry = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "content": content,
+            "etag": f"\"{get_hash(content)[:32]}\"",
+            "type": ctype,
+        }
+        with self._lock:
+            self._entries[path] = entry
+        return entry
+
+
+def inject_live_reload(content: bytes) -> bytes:
+    ix = content.rfind(b"</body>")
+    if ix < 0:
+        return content
+    return content[:ix] + LIVE_RELOAD_SCRIPT + content[ix:]
+
+
+class LiveReload:
+    # NOTE: every successful rebuild starts a new generation. open browsers
+    # wait for the generation to change
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._generation = 0
+
+    def get_generation(self) -> int:
+        with self._cond:
+            return self._generation
+
+    def notify(self) -> None:
+        with self._cond:
+            self._generation += 1
+            self._cond.notify_all()
+
+    def wait(self, generation: int, timeout: float) -> int:
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._generation != generation, timeout)
+            return self._generation
+
+
+class DevServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+            self,
+            address: tuple[str, int],
+            *,
+            store: MemoryStore,
+            reload: LiveReload) -> None:
+        super().__init__(address, DevHandler)
+        self.store = store
+        self.reload = reload
+
+
+class DevHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args: object) -> None:
+        pass
+
+    def _get_server(self) -> DevServer:
+        return cast(DevServer, self.server)
+
+    def _live_reload(self) -> None:
+        reload = self._get_server().reload
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        generation = reload.get_generation()
+        try:
+            while True:
+                cur = reload.wait(generation, KEEP_ALIVE)
+                if cur != generation:
+                    generation = cur
+                    self.wfile.write(b"data: reload\n\n")
+                else:
+                    self.wfile.write(b": keep-alive\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _send_cache_headers(self, entry: StoreEntry) -> None:
+        # NOTE: a 304 has to repeat the validators and caching headers of the
+        # full response
+        self.send_header("ETag", entry["etag"])
+        self.send_header("Cache-Control", "no-cache")
+
+    def _respond(self, *, body: bool) -> None:
+        path = unquote(urlsplit(self.path).path)
+        if path == LIVE_RELOAD_PATH:
+            self._live_reload()
+            return
+        path = posixpath.normpath(path).lstrip("/")
+        if path in ("", "."):
+            path = "index.html"
+        elif path.startswith(".."):
+            self.send_error(403)
+            return
+        store = self._get_server().store
+        entry = store.get(path)
+        if entry is None:
+            entry = store.get(posixpath.join(path, "index.html"))
+        if entry is None:
+            self.send_error(404)
+            return
+        if self.headers.get("If-None-Match") == entry["etag"]:
+            self.send_response(304)
+            self._send_cache_headers(entry)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", entry["type"])
+        self.send_header("Content-Length", f"{len(entry['content'])}")
+        self._send_cache_headers(entry)
+        self.end_headers()
+        if body:
+            self.wfile.write(entry["content"])
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        self._respond(body=True)
+
+    def do_HEAD(self) -> None:  # pylint: disable=invalid-name
+        self._respond(body=False)
+
+
+def snapshot(src_dir: str) -> dict[str, tuple[int, int]]:
+    res: dict[str, tuple[int, int]] = {}
+    rules = FileRules()
+    for name in WATCHED:
+        path = os.path.join(src_dir, name)
+        if os.path.isdir(path):
+            for entry in walk_files(path, rules):
+                stat = entry.stat()
+                res[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        elif os.path.exists(path):
+            stat = os.stat(path)
+            res[path] = (stat.st_size, stat.st_mtime_ns)
+    return res
+
+
+def get_changed(
+        before: dict[str, tuple[int, int]],
+        after: dict[str, tuple[int, int]]) -> list[str]:
+    return sorted(
+        fname
+        for fname in before.keys() | after.keys()
+        if before.get(fname) != after.get(fname))
+
+
+def needs_render(src_dir: str, changed: list[str]) -> bool:
+    for fname in changed:
+        name = os.path.relpath(fname, src_dir).split(os.sep)[0]
+        if name in PAGE_INPUTS:
+            return True
+    return False
+
+
+class Builder:
+    # NOTE: stages the static files and renders the pages into the dev
+    # folder. both steps only touch outputs whose inputs changed
+    def __init__(self, src_dir: str, prefix: str, cache_dir: str) -> None:
+        self._src_dir = src_dir
+        self._prefix = prefix
+        self._cache_dir = cache_dir
+        self._rules = FileRules.load(STAGE_RULES)
+        self._hash_cache = HashCache(cache_dir)
+        self._cache = ImageCache(cache_dir, 256 * MEBIBYTE)
+        self._dims = DimensionCache(cache_dir)
+
+    def build(self, *, render: bool) -> None:
+        os.makedirs(self._prefix, exist_ok=True)
+        with TRACE.span("stage"):
+            stage_files(
+                self._src_dir,
+                self._prefix,
+                self._rules,
+                manifest=Manifest(
+                    self._cache_dir,
+                    self._prefix,
+                    incremental=True,
+                    name="stage"),
+                hash_cache=self._hash_cache,
+                allow_link=True)
+        if render:
+            self.render()
+        self._hash_cache.save()
+        self._cache.save()
+        self._dims.save()
+
+    def render(self) -> None:
+        manifest = Manifest(self._cache_dir, self._prefix, incremental=True)
+        writer = OutputWriter(self._prefix)
+        index = os.path.join(self._prefix, "index.html")
+        tmp = f"{index}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as out:
+                apply_template(
+                    os.path.join(self._src_dir, "index.tmpl"),
+                    os.path.join(self._src_dir, "content.json"),
+                    self._prefix,
+                    out,
+                    writer,
+                    is_ordered_by_type=False,
+                    dry_run=False,
+                    parallel=os.cpu_count() or 1,
+                    cache=self._cache,
+                    page_template=os.path.join(self._src_dir, "page.tmpl"),
+                    manifest=manifest,
+                    dims=self._dims,
+                    hash_cache=self._hash_cache,
+                    cache_dir=self._cache_dir)
+                with TRACE.span("write"):
+                    writer.finish()
+            os.replace(tmp, index)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        manifest.finish()
+
+
+def watch(
+        src_dir: str,
+        builder: Builder,
+        reload: LiveReload,
+        *,
+        interval: float) -> None:
+    # NOTE: polls the stat of the watched inputs. failed builds keep the
+    # previous outputs and are retried on the next change
+    before = snapshot(src_dir)
+    while True:
+        time.sleep(interval)
+        after = snapshot(src_dir)
+        changed = get_changed(before, after)
+        if not changed:
+            continue
+        before = after
+        start = now()
+        try:
+            builder.build(render=needs_render(src_dir, changed))
+        except Exception:  # pylint: disable=broad-exception-caught
+            traceback.print_exc()
+            print("WARNING: rebuild failed", file=sys.stderr)
+            continue
+        print(
+            f"rebuilt {len(changed)} changed inputs in "
+            f"{(now() - start) / 1e6:.0f}ms",
+            file=sys.stderr)
+        reload.notify()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog=f"python {os.path.basename(__file__)}",
+        description=(
+            "Serve the website and rebuild it when its inputs change"))
+    parser.add_argument(
+        "--input",
+        type=str,
+        default=".",
+        help="specifies the source folder")
+    parser.add_argument(
+        "--out",
+        type=str,
+        default=DEV_DIR,
+        help="specifies the folder for the build outputs")
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=CACHE_DIR,
+        help="specifies the build cache folder")
+    parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="specifies the address to listen on")
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8000,
+        help="specifies the port to listen on")
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=0.2,
+        help="seconds between checks for changed inputs")
+    return parser.parse_args()
+
+
+def run() -> None:
+    args = parse_args()
+    TRACE.set_quiet(True)
+    builder = Builder(args.input, args.out, args.cache_dir)
+    builder.build(render=True)
+    reload = LiveReload()
+    server = DevServer(
+        (args.host, args.port),
+        store=MemoryStore(args.out),
+        reload=reload)
+    threading.Thread(
+        target=watch,
+        args=(args.input, builder, reload),
+        kwargs={"interval": args.interval},
+        daemon=True).start()
+    print(
+        f"serving on http://{args.host}:{server.server_address[1]}/",
+        file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,104 @@
+# Homepage of Josua Krause
+# Copyright (C) 2024  Josua Krause
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import fnmatch
+import json
+import os
+import re
+from collections.abc import Iterable, Iterator
+from typing import TypedDict
+
+
+RulesConfig = TypedDict('RulesConfig', {
+    "dirs": list[str],
+    "extensions": list[str],
+    "names": list[str],
+    "globs": list[str],
+})
+
+
+def compile_globs(globs: Iterable[str]) -> re.Pattern[str] | None:
+    patterns = [fnmatch.translate(glob) for glob in globs]
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{pattern})" for pattern in patterns))
+
+
+class FileRules:
+    # NOTE: all rules match the basename only. names starting with a dot
+    # are always excluded
+    def __init__(
+            self,
+            *,
+            dirs: Iterable[str] = (),
+            extensions: Iterable[str] = (),
+            names: Iterable[str] = (),
+            globs: Iterable[str] = ()) -> None:
+        self._dirs = compile_globs(dirs)
+        self._extensions = frozenset(extensions)
+        self._names = frozenset(names)
+        self._globs = compile_globs(globs)
+
+    @staticmethod
+    def load(fname: str, *, extra_dirs: Iterable[str] = ()) -> 'FileRules':
+        with open(fname, "r", encoding="utf-8") as fin:
+            config: RulesConfig = json.load(fin)
+        return FileRules(
+            dirs=[*config.get("dirs", []), *extra_dirs],
+            extensions=config.get("extensions", []),
+            names=config.get("names", []),
+            globs=config.get("globs", []))
+
+    def is_excluded_dir(self, name: str) -> bool:
+        if name.startswith("."):
+            return True
+        return self._dirs is not None and self._dirs.match(name) is not None
+
+    def is_excluded_file(self, name: str) -> bool:
+        if name.startswith("."):
+            return True
+        if name in self._names:
+            return True
+        dot = name.rfind(".")
+        if dot > 0 and name[dot:] in self._extensions:
+            return True
+        return self._globs is not None and self._globs.match(name) is not None
+
+
+def walk_files(
+        root: str,
+        rules: FileRules,
+        *,
+        include_dirs: bool = False,
+        exclude: Iterable[str] = ()) -> Iterator[os.DirEntry[str]]:
+    # NOTE: excluded directories are pruned before descending into them.
+    # no stat call is necessary for excluded entries. directories in
+    # exclude are skipped by their resolved path
+    skip = {os.path.realpath(path) for path in exclude}
+    stack = [root]
+    while stack:
+        cur = stack.pop()
+        with os.scandir(cur) as it:
+            for entry in it:
+                if entry.is_dir():
+                    if rules.is_excluded_dir(entry.name):
+                        continue
+                    if skip and os.path.realpath(entry.path) in skip:
+                        continue
+                    stack.append(entry.path)
+                    if include_dirs:
+                        yield entry
+                elif not rules.is_excluded_file(entry.name):
+                    yield entry
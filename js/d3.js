@@ -25,6 +25,9 @@
  *  name: string,
  *  time: number,
  *  endTime?: number,
+ *  lane: number,
+ *  x: number,
+ *  x1?: number,
  * }} TimelineEvent
  */
 /**
@@ -32,8 +35,27 @@
  *  type_names: { [key: string]: string },
  *  type_order: string[],
  *  events: TimelineEvent[],
+ *  domain: number[],
  * }} TimelineData
  */
+/**
+ * @typedef {{
+ *  groups: string[],
+ *  id: string[],
+ *  group: number[],
+ *  name: string[],
+ *  time: number[],
+ *  endTime: (number | null)[],
+ *  link: string[],
+ *  type_names: { [key: string]: string },
+ *  type_order: string[],
+ *  lane: number[],
+ *  x: number[],
+ *  x1: (number | null)[],
+ *  domain: number[],
+ *  resolution: number,
+ * }} CompactTimelineData
+ */
 /**
  * @template T
  * @typedef D3Selection<T>
@@ -93,7 +115,7 @@
  * @typedef D3
  * @prop {<T>(query: string) => D3Selection<T>} select
  * @prop {<T>(query: string) => D3Selection<T>} selectAll
- * @prop {(url: string, cb: (err: Error | null, data: TimelineData) => void) => void} json
+ * @prop {(url: string, cb: (err: Error | null, data: CompactTimelineData) => void) => void} json
  * @prop {{ category10: () => D3Scale<string> }} scale
  * @prop {{ scale: () => D3Scale<number> }} time
  * @prop {{ axis: () => D3Axis }} svg
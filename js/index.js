@@ -18,7 +18,7 @@
 // @ts-check
 
 import { getD3 } from './d3.js';
-import { Timeline } from './timeline.js';
+import { decodeTimeline, Timeline } from './timeline.js';
 
 /** @typedef {import("./d3").D3} D3 */
 
@@ -35,7 +35,27 @@ async function adjustSizes() {
   });
 }
 
+function setupSearch() {
+  const form = /** @type {HTMLFormElement | null} */ (
+    document.getElementById('search-form')
+  );
+  const input = /** @type {HTMLInputElement | null} */ (
+    document.getElementById('search-input')
+  );
+  const list = document.getElementById('search-results');
+  if (!form || !input || !list) {
+    return;
+  }
+  // NOTE: the search module and its index are only loaded once needed
+  const load = async () => {
+    const { initSearch } = await import('./search.js');
+    await initSearch(form, input, list);
+  };
+  input.addEventListener('focus', load, { once: true });
+}
+
 async function start() {
+  setupSearch();
   const d3 = await getD3();
   if (!d3) {
     console.warn('could not load d3');
@@ -57,7 +77,7 @@ async function start() {
     radius,
     textHeight,
   );
-  d3.json('material/timeline.json', (err, data) => {
+  d3.json('material/timeline.json', (err, compact) => {
     if (err) {
       console.warn(err);
       d3.select('#timeline-row').style({
@@ -65,9 +85,11 @@ async function start() {
       });
       return;
     }
+    const data = decodeTimeline(compact);
     timeline.typeNames(data.type_names);
     timeline.typeOrder(data.type_order);
     timeline.events(data.events);
+    timeline.domain(data.domain);
     timeline.initVisibleGroups({ '.type_committee': false });
     timeline.update();
   });
@@ -0,0 +1,234 @@
+/*
+ * Homepage of Josua Krause
+ * Copyright (C) 2016–2024  Josua Krause
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ */
+// @ts-check
+
+/**
+ * @typedef {{
+ *  id: string[],
+ *  title: string[],
+ *  info: string[],
+ *  terms: string[],
+ *  postings: number[][],
+ * }} CompactSearchIndex
+ */
+/** @typedef {{ id: string, title: string, info: string }} SearchResult */
+
+const SEARCH_FILE = 'material/search.json';
+const MAX_RESULTS = 10;
+// NOTE: must match SEARCH_STOPWORDS in create_page.py
+const STOPWORDS = new Set([
+  'an',
+  'and',
+  'are',
+  'as',
+  'at',
+  'be',
+  'by',
+  'for',
+  'from',
+  'in',
+  'is',
+  'it',
+  'of',
+  'on',
+  'or',
+  'that',
+  'the',
+  'this',
+  'to',
+  'we',
+  'with',
+]);
+
+/**
+ * @param {string} text
+ * @return {string[]}
+ */
+export function tokenize(text) {
+  // NOTE: must match tokenize in create_page.py
+  const plain = text
+    .normalize('NFKD')
+    .replace(/\p{M}/gu, '')
+    .toLowerCase();
+  return (plain.match(/[\p{L}\p{N}]+/gu) ?? []).filter(
+    (token) => token.length > 1 && !STOPWORDS.has(token),
+  );
+}
+
+/**
+ * @param {string[]} terms
+ * @param {string} prefix
+ * @return {number}
+ */
+function lowerBound(terms, prefix) {
+  // NOTE: terms are sorted by UTF-16 code units which is the order of `<`
+  let lo = 0;
+  let hi = terms.length;
+  while (lo < hi) {
+    const mid = (lo + hi) >>> 1;
+    if (terms[mid] < prefix) {
+      lo = mid + 1;
+    } else {
+      hi = mid;
+    }
+  }
+  return lo;
+}
+
+/**
+ * @param {CompactSearchIndex} index
+ * @param {string} token
+ * @return {Map<number, number>}
+ */
+function matchToken(index, token) {
+  // NOTE: every token is matched as a prefix. exact matches count double
+  /** @type {Map<number, number>} */
+  const scores = new Map();
+  const { terms, postings } = index;
+  for (
+    let tix = lowerBound(terms, token);
+    tix < terms.length && terms[tix].startsWith(token);
+    tix += 1
+  ) {
+    const factor = terms[tix] === token ? 2 : 1;
+    const posting = postings[tix];
+    let ix = 0;
+    for (let pos = 0; pos < posting.length; pos += 2) {
+      ix += posting[pos];
+      const score = posting[pos + 1] * factor;
+      scores.set(ix, Math.max(scores.get(ix) ?? 0, score));
+    }
+  }
+  return scores;
+}
+
+/**
+ * @param {CompactSearchIndex} index
+ * @param {string} query
+ * @param {number} limit
+ * @return {SearchResult[]}
+ */
+export function search(index, query, limit) {
+  const tokens = tokenize(query);
+  if (!tokens.length) {
+    return [];
+  }
+  /** @type {Map<number, number> | null} */
+  let total = null;
+  for (const token of tokens) {
+    const scores = matchToken(index, token);
+    /** @type {Map<number, number>} */
+    const next = new Map();
+    scores.forEach((score, ix) => {
+      if (total === null) {
+        next.set(ix, score);
+      } else if (total.has(ix)) {
+        next.set(ix, total.get(ix) + score);
+      }
+    });
+    total = next;
+    if (!total.size) {
+      return [];
+    }
+  }
+  return [...total.entries()]
+    .sort(([aix, ascore], [bix, bscore]) => bscore - ascore || aix - bix)
+    .slice(0, limit)
+    .map(([ix]) => ({
+      id: index.id[ix],
+      title: index.title[ix],
+      info: index.info[ix],
+    }));
+}
+
+/** @type {Promise<CompactSearchIndex> | null} */
+let indexPromise = null;
+
+/** @return {Promise<CompactSearchIndex>} */
+function loadIndex() {
+  if (indexPromise === null) {
+    indexPromise = fetch(SEARCH_FILE).then((resp) => {
+      if (!resp.ok) {
+        throw new Error(`could not load ${SEARCH_FILE}: ${resp.status}`);
+      }
+      return resp.json();
+    });
+    indexPromise.catch(() => {
+      indexPromise = null;
+    });
+  }
+  return indexPromise;
+}
+
+/**
+ * @param {HTMLFormElement} form
+ * @param {HTMLInputElement} input
+ * @param {HTMLElement} list
+ */
+export async function initSearch(form, input, list) {
+  /** @type {SearchResult[]} */
+  let results = [];
+
+  const update = async () => {
+    const query = input.value;
+    let index;
+    try {
+      index = await loadIndex();
+    } catch (err) {
+      console.warn(err);
+      return;
+    }
+    if (query !== input.value) {
+      return;
+    }
+    results = search(index, query, MAX_RESULTS);
+    list.replaceChildren(
+      ...results.map((result) => {
+        const item = document.createElement('li');
+        const link = document.createElement('a');
+        link.href = `#${result.id}`;
+        link.textContent = result.title;
+        const info = document.createElement('small');
+        info.textContent = result.info;
+        link.append(document.createElement('br'), info);
+        link.addEventListener('click', () => {
+          list.replaceChildren();
+        });
+        item.append(link);
+        return item;
+      }),
+    );
+  };
+
+  input.addEventListener('input', update);
+  input.addEventListener('keydown', (evt) => {
+    if (evt.key === 'Escape') {
+      input.value = '';
+      results = [];
+      list.replaceChildren();
+    }
+  });
+  form.addEventListener('submit', (evt) => {
+    evt.preventDefault();
+    if (results.length) {
+      window.location.hash = results[0].id;
+      list.replaceChildren();
+    }
+  });
+  await update();
+}
@@ -23,8 +23,51 @@
  * @typedef {import("./d3").D3Selection<T>} D3Selection<T>
  */
 /** @typedef {import("./d3").TimelineEvent} TimelineEvent */
+/** @typedef {import("./d3").TimelineData} TimelineData */
+/** @typedef {import("./d3").CompactTimelineData} CompactTimelineData */
 /** @typedef {{ x: number, y: number, width: number, height: number }} Rect */
 
+const SECONDS_PER_DAY = 24 * 60 * 60;
+const MILLIS_PER_DAY = SECONDS_PER_DAY * 1000;
+
+/**
+ * @param {CompactTimelineData} data
+ * @return {TimelineData}
+ */
+export function decodeTimeline(data) {
+  /** @type {TimelineEvent[]} */
+  const events = [];
+  let days = 0;
+  data.id.forEach((id, ix) => {
+    days += data.time[ix];
+    /** @type {TimelineEvent} */
+    const event = {
+      id,
+      group: data.groups[data.group[ix]],
+      name: data.name[ix],
+      time: days * SECONDS_PER_DAY,
+      link: data.link[ix],
+      lane: data.lane[ix],
+      x: data.x[ix] / data.resolution,
+    };
+    const endTime = data.endTime[ix];
+    if (endTime !== null) {
+      event.endTime = endTime < 0 ? -1 : (days + endTime) * SECONDS_PER_DAY;
+    }
+    const x1 = data.x1[ix];
+    if (x1 !== null) {
+      event.x1 = x1 / data.resolution;
+    }
+    events.push(event);
+  });
+  return {
+    type_names: data.type_names,
+    type_order: data.type_order,
+    events,
+    domain: data.domain.map((day) => day * MILLIS_PER_DAY),
+  };
+}
+
 export class Timeline {
   constructor(
     /** @type {D3} */ d3,
@@ -75,6 +118,8 @@ export class Timeline {
     this._typeOrder = [];
     /** @type {TimelineEvent[]} */
     this._events = [];
+    /** @type {number[]} */
+    this._domain = [];
     /** @type {{ [key: string]: boolean }} */
     this._initVisibleGroups = {};
   }
@@ -100,6 +145,13 @@ export class Timeline {
     return this._events;
   }
 
+  domain(/** @type {number[] | null} */ domain) {
+    if (domain) {
+      this._domain = domain;
+    }
+    return this._domain;
+  }
+
   initVisibleGroups(
     /** @type {{ [key: string]: boolean } | null} */ initVisibleGroups,
   ) {
@@ -150,12 +202,11 @@ export class Timeline {
 
   update() {
     const d3 = this._d3;
-    /** @type {{ [key: string]: number }} */
-    const types = {};
     /** @type {{ [key: string]: boolean }} */
     const groups = {};
+    let lanes = 0;
     this._events.forEach((e) => {
-      types[e.id] = Math.min(+e.time, types[e.id] ?? Number.POSITIVE_INFINITY);
+      lanes = Math.max(lanes, e.lane + 1);
       groups[e.group] = true;
     });
     const groupScale = d3.scale.category10().domain(this._typeOrder);
@@ -300,27 +351,11 @@ export class Timeline {
     };
 
     updateLegendColor();
-    const typeList = Object.keys(types);
-    typeList.sort((ta, tb) => {
-      return d3.ascending(types[ta], types[tb]);
-    });
-    /** @type {number} */
-    let minY = 0;
-    /** @type {{ [key: string]: number }} */
-    const yPos = {};
-    typeList.forEach((tid, ix) => {
-      yPos[tid] = this._h - ix * (this._radius + 1);
-      minY = Math.min(this._h - ix * (this._radius + 1), minY);
-    });
-    const times = this._events.map((e) => {
-      return +e.time * 1000;
-    });
-    const xScale = d3.time
-      .scale()
-      .domain([d3.min(times), d3.max(times)])
-      .range([0, this._w])
-      .nice();
-    const visScale = xScale.copy();
+    const laneY = (/** @type {number} */ lane) => {
+      return this._h - lane * (this._radius + 1);
+    };
+    const minY = Math.min(laneY(lanes - 1), 0);
+    const visScale = d3.time.scale().domain(this._domain).range([0, this._w]);
     const xAxis = d3.svg
       .axis()
       .scale(visScale)
@@ -430,22 +465,16 @@ export class Timeline {
     sel
       .attr({
         x: (e) => {
-          return xScale(+e.time * 1000);
+          return e.x * this._w;
         },
         y: (e) => {
-          return yPos[e.id];
+          return laneY(e.lane);
         },
         width: (e) => {
-          if (!e.endTime) {
+          if (e.x1 === undefined) {
             return this._radius;
           }
-          if (+e.endTime < 0) {
-            return this._w - xScale(+e.time * 1000);
-          }
-          return (
-            xScale((+e.endTime + 31 * 24 * 60 * 60) * 1000) -
-            xScale(+e.time * 1000)
-          );
+          return (e.x1 - e.x) * this._w;
         },
         height: this._radius,
         fill: (e) => {
@@ -0,0 +1,175 @@
+# Homepage of Josua Krause
+# Copyright (C) 2024  Josua Krause
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, TypedDict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from buildcache import get_hash, JSONStore
+from buildtrace import TRACE
+
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class Prober:
+    # NOTE: issues http requests concurrently through one pooled session.
+    # the number of concurrent requests to the same host is limited and
+    # failing requests are retried with exponential backoff
+    def __init__(
+            self,
+            *,
+            workers: int = 16,
+            per_host: int = 4,
+            retries: int = 3,
+            backoff: float = 0.5,
+            timeout: float = 10.0) -> None:
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUS,
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            raise_on_status=False)
+        adapter = HTTPAdapter(
+            pool_connections=workers,
+            pool_maxsize=workers,
+            max_retries=retry)
+        self._session = requests.Session()
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="probe")
+        self._per_host = per_host
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._hosts: dict[str, threading.Semaphore] = {}
+
+    def _get_host_slots(self, url: str) -> threading.Semaphore:
+        host = urlsplit(url).netloc
+        with self._lock:
+            res = self._hosts.get(host)
+            if res is None:
+                res = threading.Semaphore(self._per_host)
+                self._hosts[host] = res
+            return res
+
+    def request(
+            self,
+            method: str,
+            url: str,
+            **kwargs: Any) -> requests.Response:
+        with self._get_host_slots(url), TRACE.span(
+                "probe", "entry", method=method, url=url):
+            return self._session.request(
+                method,
+                url,
+                timeout=self._timeout,
+                allow_redirects=True,
+                **kwargs)
+
+    def submit(
+            self,
+            method: str,
+            url: str,
+            **kwargs: Any) -> Future[requests.Response]:
+        return self._pool.submit(self.request, method, url, **kwargs)
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+        self._session.close()
+
+
+ValidatorEntry = TypedDict('ValidatorEntry', {
+    "etag": str | None,
+    "modified": str | None,
+    "hash": str,
+})
+
+
+class ValidatorCache:
+    # NOTE: stores the http validators and the content hash of remote pages
+    # so that unchanged pages are answered with a 304 without a body. if no
+    # cache folder is given nothing is stored and all requests are full.
+    # seed entries are used for urls that have no stored entry
+    def __init__(
+            self,
+            cache_dir: str | None,
+            *,
+            seed: dict[str, ValidatorEntry] | None = None) -> None:
+        self._store = None
+        if cache_dir is not None:
+            self._store = JSONStore(
+                os.path.join(cache_dir, "validators.json"))
+        self._seed = {} if seed is None else seed
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> ValidatorEntry | None:
+        res = None
+        if self._store is not None:
+            with self._lock:
+                res = self._store.get(url)
+        if res is None:
+            res = self._seed.get(url)
+        return res
+
+    def get_headers(self, url: str) -> dict[str, str]:
+        entry = self.get(url)
+        if entry is None:
+            return {}
+        res: dict[str, str] = {}
+        if entry["etag"] is not None:
+            res["If-None-Match"] = entry["etag"]
+        if entry["modified"] is not None:
+            res["If-Modified-Since"] = entry["modified"]
+        return res
+
+    def update(
+            self,
+            url: str,
+            response: requests.Response) -> ValidatorEntry | None:
+        etag = response.headers.get("etag")
+        modified = response.headers.get("last-modified")
+        if response.status_code == 304:
+            entry = self.get(url)
+            if entry is None:
+                return None
+            entry = {
+                "etag": entry["etag"] if etag is None else etag,
+                "modified": (
+                    entry["modified"] if modified is None else modified),
+                "hash": entry["hash"],
+            }
+        elif response.status_code == 200:
+            entry = {
+                "etag": etag,
+                "modified": modified,
+                "hash": get_hash(response.content),
+            }
+        else:
+            return None
+        if self._store is not None:
+            with self._lock:
+                self._store.set(url, entry)
+        return entry
+
+    def save(self) -> None:
+        if self._store is not None:
+            self._store.save()
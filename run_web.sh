@@ -20,7 +20,6 @@ set -ex
 
 if [ -z $NO_DEFAULT ]; then
   OUTPUT="www"
-  LIB_COPY="filelist.txt"
 fi
 
 if hash open 2>/dev/null; then
@@ -28,4 +27,3 @@ if hash open 2>/dev/null; then
 fi
 python -m http.server || true
 rm -rf "${OUTPUT}"
-rm -f "${LIB_COPY}"
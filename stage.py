@@ -0,0 +1,216 @@
+# Homepage of Josua Krause
+# Copyright (C) 2024  Josua Krause
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import argparse
+import errno
+import fcntl
+import os
+import shutil
+import sys
+from typing import get_args, Literal, TypedDict
+
+from buildcache import CACHE_DIR, get_deps_key, HashCache, Manifest
+from filerules import FileRules, walk_files
+
+
+STAGE_RULES = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "stage_rules.json")
+# NOTE: from linux/fs.h
+FICLONE = 0x40049409
+
+
+TransferMode = Literal["linked", "cloned", "copied"]
+
+
+StageStats = TypedDict('StageStats', {
+    "files": dict[TransferMode, int],
+    "bytes": dict[TransferMode, int],
+    "unchanged": int,
+    "removed": int,
+})
+
+
+def clone_file(src: str, dst: str) -> TransferMode:
+    # NOTE: tries a reflink first and falls back to copy_file_range which
+    # lets the kernel copy without passing the data through user space
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return "cloned"
+        except OSError:
+            pass
+        size = os.fstat(fsrc.fileno()).st_size
+        try:
+            offset = 0
+            while offset < size:
+                count = os.copy_file_range(
+                    fsrc.fileno(), fdst.fileno(), size - offset)
+                if count == 0:
+                    break
+                offset += count
+            if offset == size:
+                return "copied"
+        except (AttributeError, OSError):
+            pass
+        fsrc.seek(0)
+        fdst.seek(0)
+        fdst.truncate()
+        shutil.copyfileobj(fsrc, fdst)
+        return "copied"
+
+
+def transfer_file(src: str, dst: str, *, allow_link: bool) -> TransferMode:
+    # NOTE: the destination is replaced atomically so that a hardlinked
+    # destination never gets written through to its source
+    tmp = f"{dst}.{os.getpid()}.tmp"
+    try:
+        mode: TransferMode | None = None
+        if allow_link:
+            try:
+                os.link(src, tmp)
+                mode = "linked"
+            except OSError as exc:
+                if exc.errno not in (
+                        errno.EXDEV, errno.EPERM, errno.EMLINK,
+                        errno.ENOTSUP):
+                    raise
+        if mode is None:
+            mode = clone_file(src, tmp)
+            shutil.copystat(src, tmp)
+        os.replace(tmp, dst)
+        return mode
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def stage_files(
+        src_dir: str,
+        out_dir: str,
+        rules: FileRules,
+        *,
+        manifest: Manifest,
+        hash_cache: HashCache,
+        allow_link: bool) -> StageStats:
+    stats: StageStats = {
+        "files": {mode: 0 for mode in get_args(TransferMode)},
+        "bytes": {mode: 0 for mode in get_args(TransferMode)},
+        "unchanged": 0,
+        "removed": 0,
+    }
+    dirs: set[str] = set()
+    # NOTE: the output folder might be inside the source folder
+    for entry in walk_files(src_dir, rules, exclude=[out_dir]):
+        src = entry.path
+        fname = os.path.relpath(src, src_dir).replace(os.sep, "/")
+        dst = os.path.join(out_dir, fname)
+        stat = entry.stat()
+        deps = get_deps_key(stat.st_size, stat.st_mtime_ns)
+        if manifest.is_fresh(fname, deps):
+            stats["unchanged"] += 1
+            continue
+        try:
+            dst_stat: os.stat_result | None = os.stat(dst)
+        except FileNotFoundError:
+            dst_stat = None
+        if (
+                dst_stat is not None
+                and dst_stat.st_size == stat.st_size
+                and (
+                    dst_stat.st_mtime_ns == stat.st_mtime_ns
+                    or hash_cache.get_file_hash(src)
+                    == hash_cache.get_file_hash(dst))):
+            os.utime(dst, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            manifest.record(fname, deps)
+            stats["unchanged"] += 1
+            continue
+        dirname = os.path.dirname(dst)
+        if dirname not in dirs:
+            os.makedirs(dirname, exist_ok=True)
+            dirs.add(dirname)
+        mode = transfer_file(src, dst, allow_link=allow_link)
+        print(f"{mode}: {fname}")
+        manifest.record(fname, deps)
+        stats["files"][mode] += 1
+        stats["bytes"][mode] += stat.st_size
+    for stale in manifest.finish():
+        print(f"removed stale file: {stale}")
+        stats["removed"] += 1
+    return stats
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog=f"python {os.path.basename(__file__)}",
+        description="Stage static files into the output folder")
+    parser.add_argument(
+        "--input",
+        type=str,
+        default=".",
+        help="specifies the source folder")
+    parser.add_argument(
+        "--out",
+        type=str,
+        help="specifies the output folder")
+    parser.add_argument(
+        "--rules",
+        type=str,
+        default=STAGE_RULES,
+        help="specifies which files are not staged")
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=CACHE_DIR,
+        help="specifies the build cache folder")
+    parser.add_argument(
+        "--no-link",
+        action="store_true",
+        help="always copy files instead of creating hardlinks")
+    return parser.parse_args()
+
+
+def run() -> None:
+    args = parse_args()
+    src_dir = args.input
+    out_dir = args.out
+    if os.path.abspath(src_dir) == os.path.abspath(out_dir):
+        raise ValueError("input and output folder must be different")
+    rules = FileRules.load(args.rules)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = Manifest(
+        args.cache_dir, out_dir, incremental=True, name="stage")
+    hash_cache = HashCache(args.cache_dir)
+    stats = stage_files(
+        src_dir,
+        out_dir,
+        rules,
+        manifest=manifest,
+        hash_cache=hash_cache,
+        allow_link=not args.no_link)
+    hash_cache.save()
+    transfers = ", ".join(
+        f"{stats['files'][mode]} {mode} ({stats['bytes'][mode]} bytes)"
+        for mode in get_args(TransferMode))
+    print(
+        f"staged {transfers}, {stats['unchanged']} unchanged, "
+        f"{stats['removed']} removed",
+        file=sys.stderr)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,16 @@
+# pylint: disable=unused-argument
+
+MODE_GENERIC: int
+MODE_TEXT: int
+MODE_FONT: int
+
+
+def compress(
+        string: bytes,
+        mode: int = ...,
+        quality: int = ...,
+        lgwin: int = ...,
+        lgblock: int = ...) -> bytes: ...
+
+
+def decompress(string: bytes) -> bytes: ...
@@ -0,0 +1,108 @@
+# Homepage of Josua Krause
+# Copyright (C) 2024  Josua Krause
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import string
+from collections.abc import Callable, Iterable
+from typing import IO
+
+from buildcache import get_hash, JSONStore
+
+
+TemplateValue = str | Callable[[IO[str]], None]
+# literal, field
+Segment = tuple[str, str | None]
+
+
+def parse_template(content: str) -> list[Segment]:
+    res: list[Segment] = []
+    for (literal, field, spec, conv) in string.Formatter().parse(content):
+        if field is not None:
+            if conv is not None:
+                raise ValueError(
+                    f"conversions are not supported: {field}!{conv}")
+            if spec:
+                raise ValueError(
+                    f"format specs are not supported: {field}:{spec}")
+            if not field.isidentifier():
+                raise ValueError(f"invalid placeholder: {field}")
+        res.append((literal, field))
+    return res
+
+
+class Template:
+    def __init__(
+            self, name: str, thash: str, segments: list[Segment]) -> None:
+        self._name = name
+        self._hash = thash
+        self._segments = segments
+        self._fields = {
+            field for (_, field) in segments if field is not None
+        }
+
+    def name(self) -> str:
+        return self._name
+
+    def get_hash(self) -> str:
+        return self._hash
+
+    def fields(self) -> set[str]:
+        return set(self._fields)
+
+    def check(self, provided: Iterable[str]) -> None:
+        missing = self._fields.difference(provided)
+        if missing:
+            raise ValueError(
+                f"{self._name} has unknown placeholders: "
+                f"{', '.join(sorted(missing))}")
+
+    def render(self, out: IO[str], values: dict[str, TemplateValue]) -> None:
+        for (literal, field) in self._segments:
+            if literal:
+                out.write(literal)
+            if field is None:
+                continue
+            value = values[field]
+            if isinstance(value, str):
+                out.write(value)
+            else:
+                value(out)
+
+
+def load_template(
+        fname: str,
+        provided: Iterable[str],
+        cache_dir: str | None = None) -> Template:
+    with open(fname, "r", encoding="utf-8") as fin:
+        content = fin.read()
+    thash = get_hash(content.encode("utf-8"))
+    store = None
+    segments: list[Segment] | None = None
+    if cache_dir is not None:
+        store = JSONStore(os.path.join(cache_dir, "templates.json"))
+        cached = store.get(fname)
+        if cached is not None and cached["hash"] == thash:
+            segments = [(seg[0], seg[1]) for seg in cached["segments"]]
+    if segments is None:
+        segments = parse_template(content)
+        if store is not None:
+            store.set(fname, {
+                "hash": thash,
+                "segments": segments,
+            })
+            store.save()
+    res = Template(fname, thash, segments)
+    res.check(provided)
+    return res
@@ -0,0 +1,83 @@
+# Homepage of Josua Krause
+# Copyright (C) 2024  Josua Krause
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import shutil
+import threading
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from create_page import HEADER_JOBS, OGIMG_JOB
+from dev_server import DevServer, LiveReload, MemoryStore
+
+from .util import StandInServer
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def stand_in() -> Iterator[StandInServer]:
+    server = StandInServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+@pytest.fixture
+def base_dir(tmp_path: Path) -> str:
+    res = os.path.join(tmp_path, "www")
+    os.makedirs(res)
+    with open(os.path.join(res, "index.html"), "w", encoding="utf-8") as fout:
+        fout.write("<html></html>\n")
+    return res
+
+
+@pytest.fixture
+def dev_src_dir(tmp_path: Path) -> str:
+    # NOTE: the page inputs without content.json
+    res = os.path.join(tmp_path, "src")
+    os.makedirs(os.path.join(res, "img"))
+    for fname in ["index.tmpl", "page.tmpl"]:
+        shutil.copy2(os.path.join(ROOT, fname), os.path.join(res, fname))
+    for job in {*HEADER_JOBS.values(), OGIMG_JOB}:
+        Image.new("RGB", (256, 256), (200, 0, 0)).save(
+            os.path.join(res, job[0]))
+    Image.new("RGBA", (1, 1)).save(os.path.join(res, "img", "nologo.png"))
+    return res
+
+
+@pytest.fixture
+def dev_server(tmp_path: Path) -> Iterator[DevServer]:
+    server = DevServer(
+        ("127.0.0.1", 0),
+        store=MemoryStore(os.path.join(tmp_path, "out")),
+        reload=LiveReload())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
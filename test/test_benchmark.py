@@ -0,0 +1,84 @@
+# Homepage of Josua Krause
+# Copyright (C) 2024  Josua Krause
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import pytest
+
+from benchmark import compare, get_sizes, Results, SIZE_PRESETS
+
+
+BASELINE: Results = {
+    "100/page/load": 1.0,
+    "100/page/render": 0.1,
+    "100/page/total": 2.0,
+    "100/sitemap/probe": 0.0,
+    "100/sitemap/total": 0.5,
+}
+
+
+@pytest.mark.parametrize("results, expected", [
+    ({}, []),
+    (BASELINE, []),
+    # NOTE: faster is never a regression
+    ({key: secs / 2 for (key, secs) in BASELINE.items()}, []),
+    # NOTE: within the relative threshold
+    ({"100/page/load": 1.19, "100/page/total": 2.3}, []),
+    # NOTE: above the threshold but below min_seconds
+    ({"100/page/render": 0.14}, []),
+    # NOTE: a stage that was zero in the baseline
+    ({"100/sitemap/probe": 0.04}, []),
+    ({"100/sitemap/probe": 0.2}, ["100/sitemap/probe"]),
+    # NOTE: keys missing from the baseline are not compared
+    ({"1000/page/total": 100.0}, []),
+    (
+        {
+            "100/page/load": 1.5,
+            "100/page/render": 0.11,
+            "100/page/total": 2.5,
+            "100/sitemap/total": 0.7,
+            "1000/page/total": 100.0,
+        },
+        ["100/page/load", "100/page/total", "100/sitemap/total"],
+    ),
+])
+def test_compare(
+        results: Results,
+        expected: list[str],
+        capsys: pytest.CaptureFixture[str]) -> None:
+    assert compare(
+        results, BASELINE, threshold=0.2, min_seconds=0.05) == expected
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == len(results)
+    for (line, key) in zip(lines, results):
+        assert line.startswith(key)
+        assert line.endswith("REGRESSION") == (key in expected)
+
+
+def test_compare_delta(capsys: pytest.CaptureFixture[str]) -> None:
+    assert not compare(
+        {"100/page/load": 1.5, "100/sitemap/probe": 0.2},
+        BASELINE,
+        threshold=0.6,
+        min_seconds=0.5)
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split() == ["100/page/load", "1.500s", "1.000s", "+50.0%"]
+    assert lines[1].split() == ["100/sitemap/probe", "0.200s", "0.000s"]
+
+
+def test_get_sizes() -> None:
+    assert get_sizes(["quick"]) == SIZE_PRESETS["quick"]
+    assert get_sizes(["12", "full"]) == [12, *SIZE_PRESETS["full"]]
+    for value in ["0", "-5", "1.5", "huge"]:
+        with pytest.raises(ValueError, match="invalid size"):
+            get_sizes([value])
@@ -0,0 +1,222 @@
+# Homepage of Josua Krause
+# Copyright (C) 2024  Josua Krause
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+import buildcache
+from buildcache import get_file_hash, hash_files, HashCache, Manifest
+
+
+def write_output(prefix: str, output: str, content: str) -> None:
+    with open(os.path.join(prefix, output), "w", encoding="utf-8") as fout:
+        fout.write(content)
+
+
+def get_dirs(tmp_path: Path) -> tuple[str, str]:
+    cache_dir = os.path.join(tmp_path, "cache")
+    prefix = os.path.join(tmp_path, "www")
+    os.makedirs(prefix)
+    return (cache_dir, prefix)
+
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_manifest_stale(tmp_path: Path, incremental: bool) -> None:
+    cache_dir, prefix = get_dirs(tmp_path)
+    manifest = Manifest(cache_dir, prefix, incremental=incremental)
+    for output in ["keep.html", "rewritten.html", "stale.html"]:
+        manifest.is_fresh(output, f"deps:{output}")
+        write_output(prefix, output, output)
+        manifest.record(output, f"deps:{output}")
+    assert not manifest.finish()
+    # NOTE: a step without a manifest writes the file in the meantime
+    write_output(prefix, "rewritten.html", "sitemap")
+    manifest = Manifest(cache_dir, prefix, incremental=incremental)
+    assert manifest.is_fresh("keep.html", "deps:keep.html") == incremental
+    assert manifest.finish() == ["stale.html"]
+    assert os.path.exists(os.path.join(prefix, "keep.html"))
+    assert os.path.exists(os.path.join(prefix, "rewritten.html"))
+    assert not os.path.exists(os.path.join(prefix, "stale.html"))
+    manifest = Manifest(cache_dir, prefix, incremental=incremental)
+    manifest.is_fresh("keep.html", "deps:keep.html")
+    assert not manifest.finish()
+    assert os.path.exists(os.path.join(prefix, "keep.html"))
+
+
+def test_manifest_shared(tmp_path: Path) -> None:
+    cache_dir, prefix = get_dirs(tmp_path)
+    page = Manifest(cache_dir, prefix, incremental=True)
+    write_output(prefix, "moved.html", "page")
+    page.record("moved.html", "deps:page")
+    write_output(prefix, "both.html", "page")
+    page.record("both.html", "deps:page")
+    assert not page.finish()
+    # NOTE: the stage now provides both files. moved.html gets rewritten
+    # while both.html is recorded unchanged by the stage
+    stage = Manifest(cache_dir, prefix, incremental=True, name="stage")
+    write_output(prefix, "moved.html", "stage file")
+    stage.record("moved.html", "deps:stage")
+    stage.record("both.html", "deps:stage")
+    assert not stage.finish()
+    compress = Manifest(cache_dir, prefix, incremental=True, name="compress")
+    assert not compress.finish()
+    page = Manifest(cache_dir, prefix, incremental=True)
+    assert not page.finish()
+    assert os.path.exists(os.path.join(prefix, "moved.html"))
+    assert os.path.exists(os.path.join(prefix, "both.html"))
+    # NOTE: a different prefix does not share outputs
+    other = os.path.join(tmp_path, "other")
+    os.makedirs(other)
+    write_output(other, "both.html", "other")
+    manifest = Manifest(cache_dir, other, incremental=True)
+    manifest.record("both.html", "deps:other")
+    assert not manifest.finish()
+    manifest = Manifest(cache_dir, other, incremental=True)
+    assert manifest.finish() == ["both.html"]
+    assert os.path.exists(os.path.join(prefix, "both.html"))
+
+
+def test_manifest_absent(tmp_path: Path) -> None:
+    cache_dir, prefix = get_dirs(tmp_path)
+    manifest = Manifest(cache_dir, prefix, incremental=True, name="compress")
+    manifest.record_absent("small.txt.gz", "deps:small")
+    assert not manifest.finish()
+    manifest = Manifest(cache_dir, prefix, incremental=True, name="compress")
+    assert manifest.is_fresh("small.txt.gz", "deps:small")
+    assert not manifest.is_fresh("small.txt.gz", "deps:changed")
+    assert manifest.find("deps:small") is None
+    assert not manifest.finish()
+    # NOTE: a file appearing later makes the entry outdated. it does not
+    # belong to the manifest so it is kept once the entry is stale
+    write_output(prefix, "small.txt.gz", "other")
+    manifest = Manifest(cache_dir, prefix, incremental=True, name="compress")
+    assert not manifest.is_fresh("small.txt.gz", "deps:small")
+    assert not manifest.finish()
+    manifest = Manifest(cache_dir, prefix, incremental=True, name="compress")
+    assert not manifest.finish()
+    assert os.path.exists(os.path.join(prefix, "small.txt.gz"))
+
+
+# NOTE: far enough in the past to be outside of the racy window
+OLD_MTIME = 1_000_000_000_000_000_000
+
+
+def write_old(fname: str, content: bytes, mtime: int = OLD_MTIME) -> None:
+    with open(fname, "wb") as fout:
+        fout.write(content)
+    os.utime(fname, ns=(mtime, mtime))
+
+
+def count_hashes(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    res: list[str] = []
+
+    def counting_hash(fname: str) -> str:
+        res.append(fname)
+        return get_file_hash(fname)
+
+    monkeypatch.setattr(buildcache, "get_file_hash", counting_hash)
+    return res
+
+
+def test_hash_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    cache_dir = os.path.join(tmp_path, "cache")
+    fname = os.path.join(tmp_path, "file.txt")
+    write_old(fname, b"content")
+    expected = get_file_hash(fname)
+    hashed = count_hashes(monkeypatch)
+    cache = HashCache(cache_dir)
+    assert cache.lookup(fname) is None
+    assert cache.get_file_hash(fname) == expected
+    assert cache.get_file_hash(fname) == expected
+    assert len(hashed) == 1
+    cache.save()
+    cache = HashCache(cache_dir)
+    assert cache.lookup(fname) == expected
+    assert cache.get_file_hash(fname) == expected
+    assert len(hashed) == 1
+
+    # NOTE: the mtime changes
+    write_old(fname, b"content", OLD_MTIME + 10 ** 9)
+    assert cache.lookup(fname) is None
+    assert cache.get_file_hash(fname) == expected
+    assert len(hashed) == 2
+    # NOTE: the size changes but the mtime is restored
+    write_old(fname, b"changed content", OLD_MTIME + 10 ** 9)
+    assert cache.lookup(fname) is None
+    assert cache.get_file_hash(fname) != expected
+    assert len(hashed) == 3
+    # NOTE: the file is replaced by a file with the same size and mtime
+    other = os.path.join(tmp_path, "other.txt")
+    write_old(other, b"CHANGED CONTENT", OLD_MTIME + 10 ** 9)
+    os.replace(other, fname)
+    assert cache.lookup(fname) is None
+    assert cache.get_file_hash(fname) == get_file_hash(fname)
+    assert len(hashed) == 4
+
+
+def test_hash_cache_racy(
+        tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    cache_dir = os.path.join(tmp_path, "cache")
+    fname = os.path.join(tmp_path, "file.txt")
+    with open(fname, "wb") as fout:
+        fout.write(b"content")
+    hashed = count_hashes(monkeypatch)
+    cache = HashCache(cache_dir)
+    # NOTE: a file modified just now might change again within the same
+    # mtime so its hash is not stored
+    cache.get_file_hash(fname)
+    cache.get_file_hash(fname)
+    assert len(hashed) == 2
+    assert cache.lookup(fname) is None
+
+
+def test_hash_cache_save(tmp_path: Path) -> None:
+    cache_dir = os.path.join(tmp_path, "cache")
+    fnames = [os.path.join(tmp_path, f"file{ix}.txt") for ix in range(2)]
+    for fname in fnames:
+        write_old(fname, fname.encode("utf-8"))
+    cache = HashCache(cache_dir)
+    for fname in fnames:
+        cache.get_file_hash(fname)
+    os.remove(fnames[0])
+    cache.save()
+    with open(
+            os.path.join(cache_dir, "filehashes.json"),
+            "r",
+            encoding="utf-8") as fin:
+        stored = json.load(fin)
+    assert list(stored) == [os.path.abspath(fnames[1])]
+
+
+@pytest.mark.parametrize("use_cache", [False, True])
+def test_hash_files(tmp_path: Path, use_cache: bool) -> None:
+    fnames = []
+    for ix in range(8):
+        fname = os.path.join(tmp_path, f"file{ix}.bin")
+        # NOTE: some files span multiple read chunks
+        write_old(fname, bytes([ix]) * (ix * 300_000 + 1))
+        fnames.append(fname)
+    # NOTE: duplicates keep their position in the result
+    fnames.append(fnames[0])
+    cache = HashCache(os.path.join(tmp_path, "cache")) if use_cache else None
+    expected = [get_file_hash(fname) for fname in fnames]
+    assert len(set(expected)) == 8
+    assert hash_files(fnames, workers=1, cache=cache) == expected
+    assert hash_files(fnames, workers=4, cache=cache) == expected
+    assert hash_files(reversed(fnames), workers=4) == expected[::-1]
+    assert not hash_files([], workers=4)
@@ -0,0 +1,145 @@
+# Homepage of Josua Krause
+# Copyright (C) 2024  Josua Krause
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import json
+import os
+import threading
+from pathlib import Path
+
+from buildtrace import BuildTrace, now, since, timed
+
+
+# NOTE: timestamps are floats in microseconds
+EPS = 1e-6
+
+
+def get_end(event: dict) -> float:
+    return event["ts"] + event["dur"]
+
+
+def load_trace(fname: str) -> list[dict]:
+    with open(fname, "r", encoding="utf-8") as fin:
+        obj = json.load(fin)
+    assert obj["displayTimeUnit"] == "ms"
+    events = obj["traceEvents"]
+    assert isinstance(events, list)
+    for event in events:
+        assert isinstance(event["name"], str)
+        assert isinstance(event["cat"], str)
+        assert event["ph"] in ("X", "C")
+        assert isinstance(event["ts"], (int, float))
+        assert isinstance(event["pid"], int)
+        assert isinstance(event["tid"], int)
+        assert isinstance(event["args"], dict)
+        if event["ph"] == "X":
+            assert event["dur"] >= 0
+        else:
+            assert "dur" not in event
+    return events
+
+
+def test_disabled(tmp_path: Path) -> None:
+    trace = BuildTrace()
+    assert not trace.is_enabled()
+    with trace.span("load"):
+        pass
+    trace.add_span("resize", "entry", since(now()))
+    assert not trace.get_stage_times()
+    fname = os.path.join(tmp_path, "trace.json")
+    trace.save(fname)
+    assert not os.path.exists(fname)
+
+
+def test_trace(tmp_path: Path) -> None:
+    trace = BuildTrace()
+    trace.enable()
+    with trace.span("load"):
+        with trace.span("restore", "entry", file="a.png"):
+            pass
+        with trace.span("restore", "entry", file="b.png"):
+            pass
+    try:
+        with trace.span("parse"):
+            raise ValueError("broken")
+    except ValueError:
+        pass
+    _, timing = timed(sum, [1, 2, 3])
+    trace.add_span("resize", "entry", timing, {"file": "c.png"})
+    fname = os.path.join(tmp_path, "trace.json")
+    trace.save(fname)
+    assert not os.path.exists(f"{fname}.tmp")
+    events = load_trace(fname)
+    assert [event["ts"] for event in events] == sorted(
+        event["ts"] for event in events)
+    spans = [event for event in events if event["ph"] == "X"]
+    assert sorted(
+        (event["name"], event["cat"]) for event in spans) == [
+        ("load", "stage"),
+        ("parse", "stage"),
+        ("resize", "entry"),
+        ("restore", "entry"),
+        ("restore", "entry"),
+    ]
+    # NOTE: a memory counter after each stage and one more when saving
+    counters = [event for event in events if event["ph"] == "C"]
+    assert len(counters) == 3
+    assert all(event["name"] == "peak memory" for event in counters)
+    assert all(event["args"]["process"] > 0 for event in counters)
+    # NOTE: nested spans end before their parent ends
+    load = next(event for event in spans if event["name"] == "load")
+    restores = [event for event in spans if event["name"] == "restore"]
+    assert sorted(event["args"]["file"] for event in restores) == [
+        "a.png",
+        "b.png",
+    ]
+    for event in restores:
+        assert event["ts"] >= load["ts"]
+        assert get_end(event) <= get_end(load) + EPS
+    assert get_end(restores[0]) <= restores[1]["ts"] + EPS
+    stage_times = trace.get_stage_times()
+    assert sorted(stage_times) == ["load", "parse"]
+    assert stage_times["load"] == load["dur"] / 1e6
+
+
+def test_trace_threads(tmp_path: Path) -> None:
+    trace = BuildTrace()
+    trace.enable()
+
+    def work(ix: int) -> None:
+        for _ in range(50):
+            with trace.span("render", "entry", id=ix):
+                pass
+
+    with trace.span("render"):
+        threads = [
+            threading.Thread(target=work, args=(ix,)) for ix in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    fname = os.path.join(tmp_path, "trace.json")
+    trace.save(fname)
+    events = load_trace(fname)
+    entries = [event for event in events if event["cat"] == "entry"]
+    assert len(entries) == 200
+    assert len({event["tid"] for event in entries}) == 4
+    # NOTE: spans of the same thread never overlap
+    by_tid: dict[int, list[dict]] = {}
+    for event in entries:
+        by_tid.setdefault(event["tid"], []).append(event)
+    for tid_events in by_tid.values():
+        tid_events.sort(key=lambda event: event["ts"])
+        for (prev, cur) in zip(tid_events, tid_events[1:]):
+            assert get_end(prev) <= cur["ts"] + EPS
@@ -0,0 +1,92 @@
+# Homepage of Josua Krause
+# Copyright (C) 2024  Josua Krause
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import gzip
+import os
+import random
+from pathlib import Path
+
+import brotli
+
+from buildcache import HashCache, Manifest
+from compress import compress_outputs
+
+
+CONTENT = b"<html><body>" + b"<p>compressible text</p>\n" * 64 + b"</body>"
+
+
+def write_file(prefix: str, fname: str, content: bytes) -> None:
+    with open(os.path.join(prefix, fname), "wb") as fout:
+        fout.write(content)
+
+
+def read_file(prefix: str, fname: str) -> bytes:
+    with open(os.path.join(prefix, fname), "rb") as fin:
+        return fin.read()
+
+
+def run_compress(tmp_path: Path, prefix: str) -> tuple[int, int, list[str]]:
+    cache_dir = os.path.join(tmp_path, "cache")
+    manifest = Manifest(cache_dir, prefix, incremental=True, name="compress")
+    hash_cache = HashCache(cache_dir)
+    compressed, skipped = compress_outputs(
+        prefix, manifest=manifest, hash_cache=hash_cache, parallel=1)
+    hash_cache.save()
+    return (compressed, skipped, manifest.finish())
+
+
+def test_compress_outputs(tmp_path: Path) -> None:
+    prefix = os.path.join(tmp_path, "www")
+    os.makedirs(prefix)
+    write_file(prefix, "index.html", CONTENT)
+    write_file(prefix, "page.html", CONTENT.replace(b"text", b"page"))
+    write_file(prefix, "small.css", b"a{}")
+    write_file(prefix, "photo.png", CONTENT)
+    # NOTE: siblings of incompressible files are not written. the manifest
+    # remembers that so they are not tried again
+    write_file(prefix, "random.txt", random.Random(0).randbytes(1024))
+    assert run_compress(tmp_path, prefix) == (4, 0, [])
+    assert sorted(os.listdir(prefix)) == [
+        "index.html",
+        "index.html.br",
+        "index.html.gz",
+        "page.html",
+        "page.html.br",
+        "page.html.gz",
+        "photo.png",
+        "random.txt",
+        "small.css",
+    ]
+    for fname in ["index.html", "page.html"]:
+        content = read_file(prefix, fname)
+        assert gzip.decompress(read_file(prefix, f"{fname}.gz")) == content
+        assert brotli.decompress(read_file(prefix, f"{fname}.br")) == content
+
+    assert run_compress(tmp_path, prefix) == (0, 6, [])
+
+    os.remove(os.path.join(prefix, "page.html"))
+    write_file(prefix, "index.html", CONTENT.replace(b"text", b"new"))
+    assert run_compress(tmp_path, prefix) == (
+        2, 2, ["page.html.br", "page.html.gz"])
+    assert sorted(os.listdir(prefix)) == [
+        "index.html",
+        "index.html.br",
+        "index.html.gz",
+        "photo.png",
+        "random.txt",
+        "small.css",
+    ]
+    assert gzip.decompress(read_file(prefix, "index.html.gz")) == read_file(
+        prefix, "index.html")
@@ -0,0 +1,366 @@
+# Homepage of Josua Krause
+# Copyright (C) 2024  Josua Krause
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import bisect
+import io
+import json
+import re
+from typing import Any
+
+import pytest
+
+from create_page import (
+    add_density_jobs,
+    CompactSearch,
+    CompactTimeline,
+    DAY_SECONDS,
+    display_size,
+    encode_search,
+    encode_timeline,
+    Event,
+    get_search_order,
+    iter_content,
+    layout_timeline,
+    logo_job,
+    logo_picture,
+    original_job,
+    parse_date,
+    parse_entry,
+    plan_resize,
+    ResizeJob,
+    ResizeResult,
+    TIMELINE_END_PADDING,
+    TIMELINE_RESOLUTION,
+    tokenize,
+    year_start_days,
+)
+
+
+def expected_content(text: str) -> list[tuple[str, Any]]:
+    res: list[tuple[str, Any]] = []
+    for (key, value) in json.loads(text, strict=False).items():
+        if isinstance(value, list):
+            res.extend((key, elem) for elem in value)
+        else:
+            res.append((key, value))
+    return res
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 8, 64 * 1024])
+def test_iter_content(chunk_size: int) -> None:
+    text = (
+        '{"a": 1.5e10, "b": [1, 2], "c": -0.25, "d": "x\ny", '
+        '"e": [true, null, {"f": [12345, 6.5E-3]}], "g": [], "h": 42}')
+    res = list(iter_content(io.StringIO(text), chunk_size))
+    assert res == expected_content(text)
+    assert res[0] == ("a", 1.5e10)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64 * 1024])
+def test_iter_content_file(chunk_size: int) -> None:
+    with open("content.json", "r", encoding="utf-8") as fin:
+        text = fin.read()
+    res = list(iter_content(io.StringIO(text), chunk_size))
+    assert res == expected_content(text)
+
+
+@pytest.mark.parametrize("text", ['{"a": 1', '{"a": 1]', '{"a": 1} 2'])
+def test_iter_content_errors(text: str) -> None:
+    with pytest.raises(ValueError, match="<stream>"):
+        list(iter_content(io.StringIO(text), 1))
+
+
+@pytest.mark.parametrize("size", [(150, 128), (128, 150), (64, 64)])
+def test_display_size(size: tuple[int, int]) -> None:
+    iwidth, iheight = size
+    image = "img/logo.png"
+    job: ResizeJob = (image, None, 64, True, False, "png")
+    images: dict[ResizeJob, ResizeResult] = {
+        original_job(image): (image, iwidth, iheight),
+    }
+    planned = plan_resize(
+        iwidth,
+        iheight,
+        None,
+        32,
+        nostretch=False,
+        noupscale=False,
+        fmt="webp")
+    assert display_size(images, job) == planned
+
+
+def test_parse_entry_dates() -> None:
+    # NOTE: dates are parsed through a cache. entries must not share them
+    first = parse_entry({"date": "Mar 3, 2020", "end-date": "2021"})
+    end_info = first.get("end-date-info")
+    assert end_info is not None
+    expected = first["date-info"].copy()
+    expected_end = end_info.copy()
+    first["date-info"]["year"] = 1999
+    end_info["year"] = 1999
+    second = parse_entry({"date": "Mar 3, 2020", "end-date": "2021"})
+    assert second["date-info"] == expected
+    assert second.get("end-date-info") == expected_end
+    assert expected["year"] == 2020
+    assert expected_end["year"] == 2021
+
+
+def test_tokenize() -> None:
+    assert tokenize("The <b>Café</b> of Ünïcode, A_B and x2") == [
+        "cafe",
+        "unicode",
+        "x2",
+    ]
+
+
+def match_prefix(index: CompactSearch, prefix: str) -> dict[int, int]:
+    # NOTE: mirrors matchToken in js/search.js
+    terms = index["terms"]
+    res: dict[int, int] = {}
+    tix = bisect.bisect_left(
+        terms, get_search_order(prefix), key=get_search_order)
+    while tix < len(terms) and terms[tix].startswith(prefix):
+        factor = 2 if terms[tix] == prefix else 1
+        posting = index["postings"][tix]
+        ix = 0
+        for pos in range(0, len(posting), 2):
+            ix += posting[pos]
+            res[ix] = max(res.get(ix, 0), posting[pos + 1] * factor)
+        tix += 1
+    return res
+
+
+def test_encode_search() -> None:
+    entries = [
+        parse_entry({
+            "title": "Visual Analytics",
+            "date": "2020",
+            "keywords": ["graphs"],
+        }),
+        parse_entry({
+            "title": "Other",
+            "date": "2020",
+            "abstract": ["Visualization of graph data"],
+        }),
+        parse_entry({
+            "title": "Graph \U00010400x \ufa0ex",
+            "date": "2020",
+        }),
+    ]
+    index = encode_search([
+        (f"entry{ix}", entry, f"info {ix}")
+        for (ix, entry) in enumerate(entries)
+    ])
+    assert index["id"] == ["entry0", "entry1", "entry2"]
+    assert index["title"][2] == "Graph \U00010400x \ufa0ex"
+    terms = index["terms"]
+    assert sorted(terms, key=get_search_order) == terms
+    # NOTE: javascript compares surrogates which sort before U+FA0E
+    assert terms.index("\U00010428x") < terms.index("\ufa0ex")
+    assert index["postings"][terms.index("graph")] == [1, 1, 1, 8]
+    assert match_prefix(index, "graph") == {0: 4, 1: 2, 2: 16}
+    assert match_prefix(index, "visual") == {0: 16, 1: 1}
+    assert match_prefix(index, "\U00010428") == {2: 8}
+    assert match_prefix(index, "\ufa0e") == {2: 8}
+    assert not match_prefix(index, "missing")
+
+
+def test_logo_size() -> None:
+    docs = [
+        parse_entry({
+            "title": "With Logo",
+            "date": "2020",
+            "logo": "img/logo.png",
+        }),
+        parse_entry({"title": "Without Logo", "date": "2020"}),
+    ]
+    images: dict[ResizeJob, ResizeResult] = {}
+    for doc in docs:
+        jobs: list[ResizeJob] = []
+        add_density_jobs(jobs, logo_job(doc))
+        for job in jobs:
+            image, width, _, _, _, fmt = job
+            if image == "img/nologo.png":
+                # NOTE: the 1x1 placeholder has no derivatives
+                images[job] = (image, 1, 1)
+            elif width is None:
+                images[job] = (image, 300, 150)
+            else:
+                images[job] = (f"img/logo_{width}.{fmt}", width, width // 2)
+    for doc in docs:
+        html = logo_picture(images, doc)
+        img = re.search(r"<img [^>]*>", html)
+        assert img is not None
+        assert 'width="64" height="64"' in img.group(0)
+        assert 'style="width: 64px; height: 64px;"' in img.group(0)
+        assert f'title="{doc["title"]}"' in img.group(0)
+    assert "<source" in logo_picture(images, docs[0])
+    assert "<source" not in logo_picture(images, docs[1])
+
+
+def get_epoch(datestr: str) -> int:
+    info = parse_date(datestr)
+    assert info is not None
+    return info["epoch"]
+
+
+def decode_timeline(timeline: CompactTimeline) -> list[Event]:
+    # NOTE: mirrors the decoding in the timeline script
+    res: list[Event] = []
+    days = 0
+    for (ix, delta) in enumerate(timeline["time"]):
+        days += delta
+        event: Event = {
+            "id": timeline["id"][ix],
+            "group": timeline["groups"][timeline["group"][ix]],
+            "name": timeline["name"][ix],
+            "time": days * DAY_SECONDS,
+            "link": timeline["link"][ix],
+        }
+        end_time = timeline["endTime"][ix]
+        if end_time is not None:
+            event["endTime"] = (
+                -1 if end_time < 0 else (days + end_time) * DAY_SECONDS)
+        res.append(event)
+    return res
+
+
+def test_encode_timeline() -> None:
+    events: list[Event] = [
+        {
+            "id": "job",
+            "group": "employment",
+            "name": "Ongoing Job",
+            "time": get_epoch("Mar, 2019"),
+            "endTime": -1,
+            "link": "#entry1",
+        },
+        {
+            "id": "paper",
+            "group": "paper",
+            "name": "Paper",
+            "time": get_epoch("Jun 3, 2018"),
+            "link": "#entry2",
+        },
+        {
+            "id": "degree",
+            "group": "education",
+            "name": "Degree",
+            "time": get_epoch("2014"),
+            "endTime": get_epoch("Feb, 2018"),
+            "link": "#entry3",
+        },
+        {
+            "id": "paper",
+            "group": "paper",
+            "name": "Same Day Paper",
+            "time": get_epoch("Jun 3, 2018"),
+            "link": "#entry4",
+        },
+    ]
+    timeline = encode_timeline(
+        events, {"paper": "Papers"}, ["paper", "education", "employment"])
+    assert timeline["groups"] == ["education", "paper", "employment"]
+    assert timeline["time"][2] == 0
+    assert timeline["endTime"] == [
+        (get_epoch("Feb, 2018") - get_epoch("2014")) // DAY_SECONDS,
+        None,
+        None,
+        -1,
+    ]
+    assert decode_timeline(timeline) == sorted(
+        events, key=lambda event: event["time"])
+    assert not encode_timeline([], {}, [])["time"]
+    with pytest.raises(ValueError, match="ends before it starts"):
+        encode_timeline([{
+            "id": "broken",
+            "group": "paper",
+            "name": "Broken",
+            "time": get_epoch("2020"),
+            "endTime": get_epoch("2019"),
+            "link": "#entry5",
+        }], {}, [])
+
+
+def test_layout_timeline() -> None:
+    events: list[Event] = [
+        {
+            "id": id_name,
+            "group": "paper",
+            "name": f"{id_name} {datestr}",
+            "time": get_epoch(datestr),
+            "link": "#entry",
+        }
+        for (id_name, datestr) in [
+            ("a", "Mar, 2015"),
+            ("b", "Apr, 2015"),
+            ("a", "Jun, 2016"),
+            ("c", "Jun, 2016"),
+            ("b", "Jan, 2017"),
+        ]
+    ]
+    events[0]["endTime"] = get_epoch("Dec, 2016")
+    events[1]["endTime"] = -1
+    timeline = encode_timeline(events, {}, [])
+    # NOTE: every id keeps its own lane whether its events overlap with
+    # other events or not
+    assert timeline["lane"] == [0, 1, 0, 2, 1]
+    # NOTE: the domain is extended to full years
+    assert timeline["domain"] == [year_start_days(2015), year_start_days(2017)]
+    start = timeline["domain"][0]
+    end = timeline["domain"][1]
+    days = [
+        (event["time"] - get_epoch("2015")) // DAY_SECONDS
+        for event in events
+    ]
+    assert timeline["x"] == [
+        round(day * TIMELINE_RESOLUTION / (end - start)) for day in days
+    ]
+    assert timeline["x"][0] > 0
+    assert timeline["x1"][0] == round(
+        (
+            (get_epoch("Dec, 2016") - get_epoch("2015")) // DAY_SECONDS
+            + TIMELINE_END_PADDING
+        ) * TIMELINE_RESOLUTION / (end - start))
+    assert timeline["x1"][1] == TIMELINE_RESOLUTION
+    assert timeline["x1"][2:] == [None, None, None]
+
+
+@pytest.mark.parametrize("first, last, domain", [
+    ("Jan 1, 2015", "Jan 1, 2015", (2015, 2016)),
+    ("Jan 1, 2015", "Jan 1, 2016", (2015, 2016)),
+    ("Jun, 2015", "Jan 2, 2016", (2015, 2017)),
+])
+def test_layout_timeline_domain(
+        first: str, last: str, domain: tuple[int, int]) -> None:
+    timeline = encode_timeline([
+        {
+            "id": datestr,
+            "group": "paper",
+            "name": datestr,
+            "time": get_epoch(datestr),
+            "link": "#entry",
+        }
+        for datestr in [first, last]
+    ], {}, [])
+    assert timeline["domain"] == [year_start_days(year) for year in domain]
+    assert 0 <= min(timeline["x"])
+    assert max(timeline["x"]) <= TIMELINE_RESOLUTION
+    # NOTE: the layout can be recomputed from the encoded events
+    timeline["lane"] = []
+    timeline["x"] = []
+    timeline["x1"] = []
+    layout_timeline(timeline)
+    assert timeline["domain"] == [year_start_days(year) for year in domain]
@@ -0,0 +1,311 @@
+# Homepage of Josua Krause
+# Copyright (C) 2024  Josua Krause
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import gzip
+import os
+from datetime import datetime
+from email.utils import formatdate
+from pathlib import Path
+
+import pytest
+
+import create_sitemap as sitemap_module
+from buildcache import get_hash
+from create_sitemap import (
+    create_sitemap,
+    ENTRY_TEMPLATE,
+    ENTRY_TEMPLATE_INTERNAL,
+    get_local_files,
+    load_previous_filetimes,
+    REMOTE_PAGES,
+    SITEMAP_FOOTER,
+    SITEMAP_HEADER_INTERNAL,
+    SITEMAP_RULES,
+    SitemapRecord,
+    TZ,
+    write_shards,
+)
+from filerules import FileRules
+from probe import Prober, ValidatorCache
+
+from .util import Reply, StandInServer
+
+
+MODIFIED = formatdate(0, usegmt=True)
+
+
+def get_paths() -> list[str]:
+    return [
+        f"/{subdomain}{path}{fname}"
+        for (subdomain, path, fname) in REMOTE_PAGES
+    ]
+
+
+def get_body(path: str) -> bytes:
+    return f"page {path}".encode("utf-8")
+
+
+def get_etag(path: str) -> str:
+    return f"\"{get_hash(get_body(path))[:16]}\""
+
+
+def run_sitemap(
+        stand_in: StandInServer,
+        base_dir: str,
+        validators: ValidatorCache,
+        *,
+        retries: int = 3) -> dict[str, SitemapRecord]:
+    prober = Prober(retries=retries, backoff=0.0)
+    try:
+        records = create_sitemap(
+            lambda subdomain: stand_in.url(f"/{subdomain}"),
+            "/",
+            [],
+            base_dir=base_dir,
+            prober=prober,
+            validators=validators,
+            prev_times={})
+    finally:
+        prober.close()
+    return {record[1]: record for record in records}
+
+
+def script(stand_in: StandInServer, reply: Reply | None) -> None:
+    stand_in.received.clear()
+    for path in get_paths():
+        stand_in.replies[path] = [
+            (
+                200,
+                {"ETag": get_etag(path), "Last-Modified": MODIFIED},
+                get_body(path),
+            ) if reply is None else reply,
+        ]
+
+
+def check_records(
+        stand_in: StandInServer, records: dict[str, SitemapRecord]) -> None:
+    mod = datetime.fromtimestamp(0, tz=TZ).isoformat()
+    for path in get_paths():
+        _, _, rmod, fhash = records[stand_in.url(path)]
+        assert rmod == mod
+        assert fhash == get_hash(get_body(path))
+
+
+def test_validators_stored(
+        stand_in: StandInServer, base_dir: str, tmp_path: Path) -> None:
+    cache_dir = os.path.join(tmp_path, "cache")
+    vcache = ValidatorCache(cache_dir)
+    script(stand_in, None)
+    records = run_sitemap(stand_in, base_dir, vcache)
+    check_records(stand_in, records)
+    for (_, _, headers, _) in stand_in.received:
+        assert "if-none-match" not in headers
+        assert "if-modified-since" not in headers
+    vcache.save()
+    stored = ValidatorCache(cache_dir)
+    for path in get_paths():
+        assert stored.get(stand_in.url(path)) == {
+            "etag": get_etag(path),
+            "modified": MODIFIED,
+            "hash": get_hash(get_body(path)),
+        }
+
+
+def test_validators_not_modified(
+        stand_in: StandInServer, base_dir: str, tmp_path: Path) -> None:
+    vcache = ValidatorCache(os.path.join(tmp_path, "cache"))
+    script(stand_in, None)
+    run_sitemap(stand_in, base_dir, vcache)
+    # NOTE: a 304 never carries a body so the hash can only be the stored one
+    script(stand_in, (304, {}, b""))
+    records = run_sitemap(stand_in, base_dir, vcache)
+    check_records(stand_in, records)
+    received = {
+        path: headers for (path, _, headers, _) in stand_in.received
+    }
+    assert sorted(received) == sorted(get_paths())
+    for (path, headers) in received.items():
+        assert headers["if-none-match"] == get_etag(path)
+        assert headers["if-modified-since"] == MODIFIED
+        assert vcache.get(stand_in.url(path)) == {
+            "etag": get_etag(path),
+            "modified": MODIFIED,
+            "hash": get_hash(get_body(path)),
+        }
+
+
+def test_validators_server_error(
+        stand_in: StandInServer, base_dir: str, tmp_path: Path) -> None:
+    vcache = ValidatorCache(os.path.join(tmp_path, "cache"))
+    script(stand_in, None)
+    run_sitemap(stand_in, base_dir, vcache)
+    script(stand_in, (500, {}, b"error"))
+    records = run_sitemap(stand_in, base_dir, vcache, retries=0)
+    check_records(stand_in, records)
+    assert sorted(stand_in.get_paths()) == sorted(get_paths())
+
+
+def test_validators_seed(
+        stand_in: StandInServer, base_dir: str, tmp_path: Path) -> None:
+    seed_path = get_paths()[0]
+    seed_url = stand_in.url(seed_path)
+    seed_hash = get_hash(b"seeded")
+    vcache = ValidatorCache(
+        os.path.join(tmp_path, "cache"),
+        seed={
+            seed_url: {
+                "etag": None,
+                "modified": MODIFIED,
+                "hash": seed_hash,
+            },
+        })
+    script(stand_in, None)
+    stand_in.replies[seed_path] = [(500, {}, b"error")]
+    records = run_sitemap(stand_in, base_dir, vcache, retries=0)
+    _, _, mod, fhash = records[seed_url]
+    assert mod == datetime.fromtimestamp(0, tz=TZ).isoformat()
+    assert fhash == seed_hash
+    received = {
+        path: headers for (path, _, headers, _) in stand_in.received
+    }
+    assert received[seed_path]["if-modified-since"] == MODIFIED
+
+
+def test_shards_size_in_bytes(
+        tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    mod = datetime.fromtimestamp(0, tz=TZ).isoformat()
+    fhash = get_hash(b"page")
+    records: list[SitemapRecord] = [
+        (0.0, f"https://www.example.com/\u00fcber-{ix}.html", mod, fhash)
+        for ix in range(4)
+    ]
+    entry = ENTRY_TEMPLATE_INTERNAL.format(
+        url=records[0][1], mod=mod, fhash=fhash)
+    # NOTE: two entries fit when counting characters but not bytes
+    limit = len(SITEMAP_HEADER_INTERNAL) + 2 * len(entry)
+    monkeypatch.setattr(sitemap_module, "SITEMAP_MAX_SIZE", limit)
+    write_shards(
+        os.path.join(tmp_path, "sitemap.xml"),
+        os.path.join(tmp_path, "filetimes.xml"),
+        records,
+        base_url="https://example.com/",
+        shard_size=10)
+    shards = sorted(
+        fname
+        for fname in os.listdir(tmp_path)
+        if fname.startswith("filetimes-"))
+    assert len(shards) == 4
+    for fname in shards:
+        with gzip.open(os.path.join(tmp_path, fname), "rb") as fin:
+            content = fin.read()
+        assert len(content) <= limit
+        assert content.endswith(SITEMAP_FOOTER.encode("utf-8"))
+    with open(
+            os.path.join(tmp_path, "sitemap_index.xml"),
+            "r",
+            encoding="utf-8") as fin:
+        index = fin.read()
+    assert "<loc>https://example.com/sitemap-1.xml.gz</loc>" in index
+
+
+def test_local_files(tmp_path: Path) -> None:
+    base_dir = os.path.join(tmp_path, "www")
+    for fname in [
+            "index.html",
+            "page.html",
+            "project/index.html",
+            "project/demo.html",
+            "assets/logo.png",
+            "lib/page.html"]:
+        path = os.path.join(base_dir, *fname.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as fout:
+            fout.write(fname)
+    local_files = get_local_files(base_dir, FileRules.load(SITEMAP_RULES))
+    # NOTE: folders with an index are listed without a trailing slash like
+    # in the previous filetimes.xml
+    assert [
+        (fname, check_file)
+        for (fname, _, check_file) in local_files
+    ] == [
+        ("page.html", os.path.join(base_dir, "page.html")),
+        ("project", os.path.join(base_dir, "project", "index.html")),
+        ("project/demo.html", os.path.join(base_dir, "project", "demo.html")),
+    ]
+
+
+def write_filetimes(fname: str, entries: list[str]) -> None:
+    with open(fname, "w", encoding="utf-8") as fout:
+        fout.write(SITEMAP_HEADER_INTERNAL)
+        for entry in entries:
+            fout.write(entry)
+        fout.write(SITEMAP_FOOTER)
+
+
+def test_load_previous_filetimes(tmp_path: Path) -> None:
+    fname = os.path.join(tmp_path, "filetimes.xml")
+    mod = datetime.fromtimestamp(0, tz=TZ).isoformat()
+    write_filetimes(fname, [
+        ENTRY_TEMPLATE_INTERNAL.format(
+            url="https://www.josuakrause.com/page.html",
+            mod=mod,
+            fhash="abc"),
+        ENTRY_TEMPLATE.format(
+            url="https://www.josuakrause.com/nohash.html", mod=mod),
+        # NOTE: entries without lastmod are skipped
+        "  <url><loc>https://www.josuakrause.com/nomod.html</loc></url>\n",
+        ENTRY_TEMPLATE_INTERNAL.format(
+            url="https://www.example.com/page.html", mod=mod, fhash="abc"),
+    ])
+    assert load_previous_filetimes(fname) == {
+        "https://www.josuakrause.com/page.html": (mod, "abc"),
+        "https://www.josuakrause.com/nohash.html": (mod, None),
+    }
+
+
+def test_load_previous_filetimes_missing(tmp_path: Path) -> None:
+    fname = os.path.join(tmp_path, "filetimes.xml")
+    assert not load_previous_filetimes(fname)
+
+
+def test_load_previous_filetimes_malformed(tmp_path: Path) -> None:
+    fname = os.path.join(tmp_path, "filetimes.xml")
+    mod = datetime.fromtimestamp(0, tz=TZ).isoformat()
+    write_filetimes(fname, [
+        ENTRY_TEMPLATE_INTERNAL.format(
+            url="https://www.josuakrause.com/page.html",
+            mod=mod,
+            fhash="abc"),
+        "  <url><loc>https://www.josuakrause.com/broken.html</url>\n",
+    ])
+    assert not load_previous_filetimes(fname)
+
+
+def test_load_previous_filetimes_shards(tmp_path: Path) -> None:
+    mod = datetime.fromtimestamp(0, tz=TZ).isoformat()
+    records: list[SitemapRecord] = [
+        (0.0, f"https://www.josuakrause.com/{ix}.html", mod, f"hash{ix}")
+        for ix in range(5)
+    ]
+    write_shards(
+        os.path.join(tmp_path, "sitemap.xml"),
+        os.path.join(tmp_path, "filetimes.xml"),
+        records,
+        base_url="https://www.josuakrause.com/",
+        shard_size=2)
+    assert load_previous_filetimes(
+        os.path.join(tmp_path, "filetimes_index.xml")) == {
+            url: (rmod, fhash) for (_, url, rmod, fhash) in records
+        }
@@ -0,0 +1,138 @@
+# Homepage of Josua Krause
+# Copyright (C) 2024  Josua Krause
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import http.client
+import json
+import os
+from pathlib import Path
+
+from dev_server import (
+    Builder,
+    DevServer,
+    get_changed,
+    LIVE_RELOAD_SCRIPT,
+    needs_render,
+    snapshot,
+)
+
+
+# NOTE: explicit times so changes are visible on coarse filesystems
+MTIME = 1_500_000_000 * 1_000_000_000
+
+
+def write_file(root: str, fname: str, content: str, mtime: int) -> None:
+    path = os.path.join(root, *fname.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as fout:
+        fout.write(content)
+    os.utime(path, ns=(mtime, mtime))
+
+
+def write_content(src_dir: str, title: str, mtime: int) -> None:
+    write_file(src_dir, "content.json", json.dumps({
+        "types": [
+            {
+                "type": "paper",
+                "name": "Papers",
+                "color": "black",
+            },
+        ],
+        "documents": [
+            {
+                "type": "paper",
+                "title": title,
+                "authors": "Josua Krause",
+                "conference": "Some Conference",
+                "date": "Mar, 2019",
+                "published": True,
+                "href": "entry.html",
+                "autopage": True,
+            },
+        ],
+    }), mtime)
+
+
+def request(
+        server: DevServer,
+        path: str,
+        headers: dict[str, str] | None = None,
+        ) -> tuple[int, str | None, bytes]:
+    conn = http.client.HTTPConnection(
+        "127.0.0.1", server.server_address[1], timeout=10)
+    try:
+        conn.request("GET", path, headers={} if headers is None else headers)
+        resp = conn.getresponse()
+        return (resp.status, resp.getheader("ETag"), resp.read())
+    finally:
+        conn.close()
+
+
+def rebuild(
+        src_dir: str,
+        builder: Builder,
+        before: dict[str, tuple[int, int]]) -> list[str]:
+    # NOTE: the same steps the watch loop takes after polling
+    changed = get_changed(before, snapshot(src_dir))
+    builder.build(render=needs_render(src_dir, changed))
+    return changed
+
+
+def test_rebuild(
+        tmp_path: Path,
+        dev_src_dir: str,
+        dev_server: DevServer) -> None:
+    write_content(dev_src_dir, "First title", MTIME)
+    builder = Builder(
+        dev_src_dir,
+        os.path.join(tmp_path, "out"),
+        os.path.join(tmp_path, "cache"))
+    builder.build(render=True)
+    before = snapshot(dev_src_dir)
+    status, etag, body = request(dev_server, "/")
+    assert status == 200
+    assert etag is not None
+    assert b"First title" in body
+    assert LIVE_RELOAD_SCRIPT in body
+    status, _, body = request(dev_server, "/entry.html")
+    assert status == 200
+    assert b"First title" in body
+    status, _, _ = request(dev_server, "/", {"If-None-Match": etag})
+    assert status == 304
+
+    write_content(dev_src_dir, "Second title", MTIME + 1_000_000_000)
+    changed = rebuild(dev_src_dir, builder, before)
+    assert changed == [os.path.join(dev_src_dir, "content.json")]
+    before = snapshot(dev_src_dir)
+    status, new_etag, body = request(dev_server, "/", {"If-None-Match": etag})
+    assert status == 200
+    assert new_etag is not None
+    assert new_etag != etag
+    assert b"Second title" in body
+    assert b"First title" not in body
+    status, _, body = request(dev_server, "/entry.html")
+    assert status == 200
+    assert b"Second title" in body
+
+    # NOTE: scripts are only staged and do not render the pages again
+    write_file(dev_src_dir, "js/extra.js", "let a = 1;\n", MTIME)
+    changed = rebuild(dev_src_dir, builder, before)
+    assert not needs_render(dev_src_dir, changed)
+    status, _, body = request(dev_server, "/js/extra.js")
+    assert status == 200
+    assert body == b"let a = 1;\n"
+    status, _, body = request(dev_server, "/", {"If-None-Match": new_etag})
+    assert status == 304
+    status, _, _ = request(dev_server, "/missing.html")
+    assert status == 404
@@ -0,0 +1,129 @@
+# Homepage of Josua Krause
+# Copyright (C) 2024  Josua Krause
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+from pathlib import Path
+
+import pytest
+
+from create_sitemap import SITEMAP_RULES
+from filerules import FileRules, walk_files
+
+
+def touch(root: str, fname: str) -> None:
+    path = os.path.join(root, *fname.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as fout:
+        fout.write(fname)
+
+
+def walk(
+        root: str,
+        rules: FileRules,
+        *,
+        include_dirs: bool = False,
+        exclude: tuple[str, ...] = ()) -> list[str]:
+    return sorted(
+        os.path.relpath(entry.path, root).replace(os.sep, "/")
+        for entry in walk_files(
+            root, rules, include_dirs=include_dirs, exclude=exclude))
+
+
+@pytest.mark.parametrize("name, excluded", [
+    ("page.html", False),
+    ("paper.pdf", False),
+    ("script.js", True),
+    ("logo.PNG", False),
+    ("index.html", True),
+    ("robots.txt", True),
+    ("output.html.tmp", True),
+    (".hidden.html", True),
+    (".js", True),
+    ("noext", False),
+])
+def test_sitemap_files(name: str, excluded: bool) -> None:
+    rules = FileRules.load(SITEMAP_RULES)
+    assert rules.is_excluded_file(name) == excluded
+
+
+@pytest.mark.parametrize("name, excluded", [
+    ("lib", True),
+    ("jslib", True),
+    ("library", False),
+    ("material", False),
+    (".git", True),
+    ("stubs", False),
+])
+def test_sitemap_dirs(name: str, excluded: bool) -> None:
+    rules = FileRules.load(SITEMAP_RULES)
+    assert rules.is_excluded_dir(name) == excluded
+
+
+def test_rules() -> None:
+    rules = FileRules(
+        dirs=["build*"],
+        extensions=[".py"],
+        names=["Makefile"],
+        globs=["*.tmp", "draft-?.txt"])
+    assert rules.is_excluded_dir("build")
+    assert rules.is_excluded_dir("build-out")
+    assert not rules.is_excluded_dir("rebuild")
+    assert rules.is_excluded_file("run.py")
+    assert not rules.is_excluded_file("run.pyc")
+    assert rules.is_excluded_file("Makefile")
+    assert not rules.is_excluded_file("Makefile.old")
+    assert rules.is_excluded_file("a.tmp")
+    assert rules.is_excluded_file("draft-1.txt")
+    assert not rules.is_excluded_file("draft-10.txt")
+    assert not FileRules().is_excluded_file("anything.py")
+    assert FileRules().is_excluded_file(".anything")
+
+
+def test_walk_files(tmp_path: Path) -> None:
+    root = os.path.join(tmp_path, "www")
+    for fname in [
+            "page.html",
+            "index.html",
+            "script.js",
+            ".hidden/page.html",
+            "sub/.page.html",
+            "lib/page.html",
+            "js/lib/page.html",
+            "project/index.html",
+            "project/demo.html",
+            "assets/logo.png",
+            "out/page.html"]:
+        touch(root, fname)
+    rules = FileRules.load(SITEMAP_RULES)
+    assert walk(root, rules) == [
+        "out/page.html",
+        "page.html",
+        "project/demo.html",
+    ]
+    assert walk(root, rules, include_dirs=True) == [
+        "assets",
+        "js",
+        "out",
+        "out/page.html",
+        "page.html",
+        "project",
+        "project/demo.html",
+        "sub",
+    ]
+    # NOTE: excluded by path, e.g., the output folder inside the source
+    assert walk(root, rules, exclude=(os.path.join(root, "out"),)) == [
+        "page.html",
+        "project/demo.html",
+    ]
@@ -0,0 +1,87 @@
+# Homepage of Josua Krause
+# Copyright (C) 2024  Josua Krause
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import time
+
+from create_sitemap import REMOTE_PAGES
+from probe import Prober
+
+from .util import StandInServer
+
+
+def test_per_host_limit(stand_in: StandInServer) -> None:
+    stand_in.delay = 0.1
+    stand_in.replies["/page"] = [(200, {}, b"page")]
+    hosts = ["127.0.0.1", "localhost"]
+    prober = Prober(workers=8, per_host=2)
+    try:
+        futures = [
+            prober.submit("GET", stand_in.url("/page", host=host))
+            for _ in range(4)
+            for host in hosts
+        ]
+        assert [future.result().status_code for future in futures] == [
+            200,
+        ] * len(futures)
+    finally:
+        prober.close()
+    assert len(stand_in.received) == 8
+    assert stand_in.peak == {
+        f"{host}:{stand_in.get_port()}": 2 for host in hosts
+    }
+
+
+def test_retry_backoff(stand_in: StandInServer) -> None:
+    stand_in.replies["/flaky"] = [
+        (503, {}, b""),
+        (503, {}, b""),
+        (200, {}, b"done"),
+    ]
+    backoff = 0.2
+    prober = Prober(retries=3, backoff=backoff)
+    try:
+        start = time.monotonic()
+        res = prober.request("GET", stand_in.url("/flaky"))
+        elapsed = time.monotonic() - start
+    finally:
+        prober.close()
+    assert res.status_code == 200
+    assert res.content == b"done"
+    assert stand_in.get_paths() == ["/flaky"] * 3
+    # NOTE: urllib3 retries the first failure immediately and then waits
+    # backoff * 2 ** (failures - 1). only the lower bound is checked since
+    # a loaded machine can only make the request slower
+    assert elapsed >= backoff * 2
+
+
+def test_remote_pages_concurrent(stand_in: StandInServer) -> None:
+    stand_in.delay = 0.2
+    paths = [
+        f"/{subdomain}{path}{fname}"
+        for (subdomain, path, fname) in REMOTE_PAGES
+    ]
+    urls = [stand_in.url(path) for path in paths]
+    for (path, url) in zip(paths, urls):
+        stand_in.replies[path] = [(200, {}, url.encode("utf-8"))]
+    prober = Prober(workers=len(urls), per_host=len(urls))
+    try:
+        futures = [prober.submit("GET", url) for url in urls]
+        bodies = [future.result().content for future in futures]
+    finally:
+        prober.close()
+    assert bodies == [url.encode("utf-8") for url in urls]
+    assert sorted(stand_in.get_paths()) == sorted(paths)
+    # NOTE: the delay keeps each request open long enough to overlap
+    assert stand_in.peak[f"127.0.0.1:{stand_in.get_port()}"] > 1
@@ -0,0 +1,116 @@
+# Homepage of Josua Krause
+# Copyright (C) 2024  Josua Krause
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+from pathlib import Path
+
+import pytest
+
+from buildcache import HashCache, Manifest
+from filerules import FileRules
+from stage import stage_files, STAGE_RULES, StageStats
+
+
+def write_file(root: str, fname: str, content: str, mtime: int) -> None:
+    path = os.path.join(root, *fname.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as fout:
+        fout.write(content)
+    # NOTE: explicit times so changes are visible on coarse filesystems
+    os.utime(path, ns=(mtime, mtime))
+
+
+def read_file(root: str, fname: str) -> str:
+    with open(
+            os.path.join(root, *fname.split("/")),
+            "r",
+            encoding="utf-8") as fin:
+        return fin.read()
+
+
+def list_files(root: str) -> list[str]:
+    return sorted(
+        os.path.relpath(os.path.join(path, fname), root).replace(os.sep, "/")
+        for (path, _, fnames) in os.walk(root)
+        for fname in fnames)
+
+
+def run_stage(
+        tmp_path: Path,
+        src_dir: str,
+        out_dir: str,
+        *,
+        allow_link: bool) -> StageStats:
+    cache_dir = os.path.join(tmp_path, "cache")
+    return stage_files(
+        src_dir,
+        out_dir,
+        FileRules.load(STAGE_RULES),
+        manifest=Manifest(cache_dir, out_dir, incremental=True, name="stage"),
+        hash_cache=HashCache(cache_dir),
+        allow_link=allow_link)
+
+
+def count_transfers(stats: StageStats) -> int:
+    return sum(stats["files"].values())
+
+
+@pytest.mark.parametrize("allow_link", [False, True])
+def test_stage_files(tmp_path: Path, allow_link: bool) -> None:
+    src_dir = os.path.join(tmp_path, "src")
+    out_dir = os.path.join(src_dir, "www")
+    mtime = 1_000_000_000_000_000_000
+    write_file(src_dir, "page.html", "page", mtime)
+    write_file(src_dir, "js/main.js", "main", mtime)
+    write_file(src_dir, "create_page.py", "code", mtime)
+    write_file(src_dir, "node_modules/lib.js", "lib", mtime)
+    os.makedirs(out_dir)
+    stats = run_stage(tmp_path, src_dir, out_dir, allow_link=allow_link)
+    assert count_transfers(stats) == 2
+    # NOTE: the output folder inside the source folder is not staged again
+    assert list_files(out_dir) == ["js/main.js", "page.html"]
+
+    stats = run_stage(tmp_path, src_dir, out_dir, allow_link=allow_link)
+    assert count_transfers(stats) == 0
+    assert stats["unchanged"] == 2
+    assert stats["removed"] == 0
+
+    write_file(src_dir, "page.html", "new page", mtime + 10 ** 9)
+    os.remove(os.path.join(src_dir, "js", "main.js"))
+    stats = run_stage(tmp_path, src_dir, out_dir, allow_link=allow_link)
+    # NOTE: a hardlinked output already shows the modification
+    assert count_transfers(stats) == (0 if allow_link else 1)
+    assert stats["unchanged"] == (1 if allow_link else 0)
+    assert stats["removed"] == 1
+    assert list_files(out_dir) == ["page.html"]
+    assert read_file(out_dir, "page.html") == "new page"
+
+
+def test_stage_replaced(tmp_path: Path) -> None:
+    src_dir = os.path.join(tmp_path, "src")
+    out_dir = os.path.join(tmp_path, "www")
+    mtime = 1_000_000_000_000_000_000
+    write_file(src_dir, "page.html", "page", mtime)
+    run_stage(tmp_path, src_dir, out_dir, allow_link=True)
+    # NOTE: the source is replaced instead of written in place so the
+    # hardlink in the output is not updated
+    os.remove(os.path.join(src_dir, "page.html"))
+    write_file(src_dir, "page.html", "new page", mtime + 10 ** 9)
+    stats = run_stage(tmp_path, src_dir, out_dir, allow_link=True)
+    assert count_transfers(stats) == 1
+    assert read_file(out_dir, "page.html") == "new page"
+    assert os.path.samefile(
+        os.path.join(src_dir, "page.html"),
+        os.path.join(out_dir, "page.html"))
@@ -0,0 +1,95 @@
+# Homepage of Josua Krause
+# Copyright (C) 2024  Josua Krause
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# status, headers, body
+Reply = tuple[int, dict[str, str], bytes]
+# path, host, headers (lowercase keys), time
+Received = tuple[str, str, dict[str, str], float]
+
+
+class StandInServer(ThreadingHTTPServer):
+    # NOTE: answers every path with its scripted replies in order. the last
+    # reply is repeated. requests and the peak number of concurrent
+    # requests per host are recorded
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.replies: dict[str, list[Reply]] = {}
+        self.delay = 0.0
+        self.received: list[Received] = []
+        self.active: dict[str, int] = {}
+        self.peak: dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def get_port(self) -> int:
+        return self.server_address[1]
+
+    def url(self, path: str, *, host: str = "127.0.0.1") -> str:
+        return f"http://{host}:{self.get_port()}{path}"
+
+    def get_paths(self) -> list[str]:
+        with self.lock:
+            return [path for (path, _, _, _) in self.received]
+
+    def enter(self, path: str, host: str, headers: dict[str, str]) -> Reply:
+        with self.lock:
+            self.received.append((path, host, headers, time.monotonic()))
+            cur = self.active.get(host, 0) + 1
+            self.active[host] = cur
+            self.peak[host] = max(self.peak.get(host, 0), cur)
+            replies = self.replies.get(path)
+            if not replies:
+                return (404, {}, b"")
+            if len(replies) > 1:
+                return replies.pop(0)
+            return replies[0]
+
+    def leave(self, host: str) -> None:
+        with self.lock:
+            self.active[host] -= 1
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args: object) -> None:
+        pass
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        server = self.server
+        assert isinstance(server, StandInServer)
+        host = self.headers.get("Host", "")
+        status, headers, body = server.enter(
+            self.path,
+            host,
+            {key.lower(): value for (key, value) in self.headers.items()})
+        try:
+            time.sleep(server.delay)
+        finally:
+            # NOTE: the request counts as finished before the reply is sent
+            # so the client cannot start the next request earlier
+            server.leave(host)
+        self.send_response(status)
+        for (key, value) in headers.items():
+            self.send_header(key, value)
+        if status != 304:
+            self.send_header("Content-Length", f"{len(body)}")
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
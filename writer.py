@@ -0,0 +1,97 @@
+# Homepage of Josua Krause
+# Copyright (C) 2024  Josua Krause
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import queue
+import threading
+from collections.abc import Callable, Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from buildtrace import TRACE
+
+
+class OutputWriter:
+    # NOTE: writes outputs on a bounded thread pool so that filesystem
+    # latency overlaps with rendering. callbacks and errors are processed
+    # in finish in a deterministic order
+    def __init__(
+            self,
+            prefix: str,
+            *,
+            workers: int = 8,
+            queue_size: int = 64) -> None:
+        self._prefix = prefix
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="writer")
+        self._slots: queue.Queue[None] = queue.Queue(maxsize=queue_size)
+        self._dirs: set[str] = set()
+        self._futures: list[tuple[str, Future]] = []
+        self._done: list[Callable[[], None]] = []
+
+    def makedirs(self, paths: Iterable[str]) -> None:
+        for path in paths:
+            dirname = os.path.dirname(os.path.join(self._prefix, path))
+            if not dirname or dirname in self._dirs:
+                continue
+            os.makedirs(dirname, exist_ok=True)
+            self._dirs.add(dirname)
+
+    def _write(self, fname: str, content: str) -> None:
+        tmp = f"{fname}.{threading.get_ident()}.tmp"
+        try:
+            with TRACE.span("write", "entry", file=fname), open(
+                    tmp, "w", encoding="utf-8") as fout:
+                fout.write(content)
+            os.replace(tmp, fname)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+        finally:
+            self._slots.get_nowait()
+
+    def write(
+            self,
+            path: str,
+            content: str,
+            on_done: Callable[[], None] | None = None) -> None:
+        self.makedirs([path])
+        self._slots.put(None)
+        future = self._pool.submit(
+            self._write, os.path.join(self._prefix, path), content)
+        self._futures.append((path, future))
+        if on_done is not None:
+            self._done.append(on_done)
+
+    def finish(self) -> None:
+        self._pool.shutdown(wait=True)
+        errors: list[tuple[str, BaseException]] = []
+        for (path, future) in self._futures:
+            exc = future.exception()
+            if exc is not None:
+                errors.append((path, exc))
+        self._futures = []
+        if errors:
+            errors.sort(key=lambda elem: elem[0])
+            msg = "\n".join(f"{path}: {exc}" for (path, exc) in errors)
+            first = errors[0][1]
+            raise ValueError(
+                f"failed to write {len(errors)} outputs:\n{msg}") from first
+        done = self._done
+        self._done = []
+        for callback in done:
+            callback()